@@ -0,0 +1,193 @@
+import argparse
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pydub import AudioSegment
+
+from db import create_session_factory
+from models import AudioFile, CallFingerprint, FrogsToad
+
+# Calls are resampled to mono at this rate before analysis; frog calls sit
+# well below the 8 kHz Nyquist limit
+SAMPLE_RATE = 16000
+FRAME_SIZE = 1024
+HOP_SIZE = 512
+MEL_BANDS = 40
+MEL_MIN_HZ = 100.0
+MEL_MAX_HZ = 8000.0
+# Only the first stretch of long field recordings is analysed
+MAX_SECONDS = 60
+# Per band: mean and spread of log energy plus mean frame-to-frame change,
+# which captures pulse rate
+FEATURE_SIZE = MEL_BANDS * 3
+# Rows written per transaction while indexing
+WRITE_BATCH = 500
+
+def _mel(hz):
+    return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+def _mel_to_hz(mel):
+    return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+# Triangular mel filters as a (bands x fft bins) matrix
+def mel_filterbank(sample_rate=SAMPLE_RATE, frame_size=FRAME_SIZE, bands=MEL_BANDS):
+    bins = np.fft.rfftfreq(frame_size, 1.0 / sample_rate)
+    edges = _mel_to_hz(np.linspace(_mel(MEL_MIN_HZ), _mel(MEL_MAX_HZ), bands + 2))
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bins - lower) / (center - lower)
+    falling = (upper - bins) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+_FILTERBANK = mel_filterbank()
+_WINDOW = np.hanning(FRAME_SIZE).astype(np.float32)
+
+def decode(path):
+    """Decode any format pydub/ffmpeg reads into mono float32 samples."""
+    audio = AudioSegment.from_file(path)
+    audio = audio.set_channels(1).set_frame_rate(SAMPLE_RATE)[:MAX_SECONDS * 1000]
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    return samples / float(1 << (8 * audio.sample_width - 1))
+
+def fingerprint_samples(samples):
+    """Unit-length feature vector for a mono SAMPLE_RATE signal."""
+    if len(samples) < FRAME_SIZE:
+        samples = np.pad(samples, (0, FRAME_SIZE - len(samples)))
+    # All frames at once: a strided view, one batched FFT, one matrix product
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    power = np.abs(np.fft.rfft(frames * _WINDOW, axis=1)) ** 2
+    log_mel = np.log10(power @ _FILTERBANK.T + 1e-10)
+    delta = np.abs(np.diff(log_mel, axis=0)).mean(axis=0) if len(log_mel) > 1 else np.zeros(MEL_BANDS)
+    features = np.concatenate([log_mel.mean(axis=0), log_mel.std(axis=0), delta]).astype(np.float32)
+    # Centre and normalize so a dot product is a cosine similarity and
+    # overall recording level doesn't matter
+    features -= features.mean()
+    norm = np.linalg.norm(features)
+    return features / norm if norm else features
+
+def fingerprint_file(path):
+    return fingerprint_samples(decode(path))
+
+# Process-pool entry point: returns (audio_file_id, bytes) or (id, None)
+def _extract(job):
+    audio_file_id, path = job
+    try:
+        return audio_file_id, fingerprint_file(path).astype("<f2").tobytes()
+    except Exception as exc:
+        print(f"Could not fingerprint {path}: {exc}", file=sys.stderr)
+        return audio_file_id, None
+
+def build_fingerprints(Session, workers=None):
+    """Fingerprint every audio file that doesn't have one yet.
+
+    Decoding and FFTs run in a process pool; results are written in
+    batches. Returns the number of fingerprints added.
+    """
+    session = Session()
+    try:
+        pending = (
+            session.query(AudioFile.id, AudioFile.frog_toad_id, AudioFile.audio_path)
+            .outerjoin(CallFingerprint, CallFingerprint.audio_file_id == AudioFile.id)
+            .filter(CallFingerprint.audio_file_id.is_(None))
+            .all()
+        )
+        species = {audio_file_id: frog_toad_id for audio_file_id, frog_toad_id, _ in pending}
+        jobs = [(audio_file_id, path) for audio_file_id, _, path in pending]
+        added = 0
+        batch = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for audio_file_id, features in executor.map(_extract, jobs, chunksize=8):
+                if features is None:
+                    continue
+                batch.append({
+                    "audio_file_id": audio_file_id,
+                    "frog_toad_id": species[audio_file_id],
+                    "features": features,
+                })
+                if len(batch) >= WRITE_BATCH:
+                    session.bulk_insert_mappings(CallFingerprint, batch)
+                    session.commit()
+                    added += len(batch)
+                    batch = []
+        if batch:
+            session.bulk_insert_mappings(CallFingerprint, batch)
+            session.commit()
+            added += len(batch)
+        return added
+    finally:
+        session.close()
+
+class CallIndex:
+    """All fingerprints as one float32 matrix, grouped by species.
+
+    Loaded on first query and reused until ``invalidate``. A query is a
+    single matrix-vector product followed by a per-species max.
+    """
+
+    def __init__(self, Session):
+        self.Session = Session
+        self._lock = threading.Lock()
+        self._loaded = None
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = None
+
+    def _load(self):
+        session = self.Session()
+        try:
+            rows = (
+                session.query(CallFingerprint.frog_toad_id, CallFingerprint.features)
+                .order_by(CallFingerprint.frog_toad_id)
+                .all()
+            )
+            names = dict(session.query(FrogsToad.id, FrogsToad.name).filter(
+                FrogsToad.id.in_({frog_toad_id for frog_toad_id, _ in rows})
+            )) if rows else {}
+        finally:
+            session.close()
+        species_ids = np.fromiter((frog_toad_id for frog_toad_id, _ in rows), dtype=np.int64, count=len(rows))
+        matrix = np.frombuffer(b"".join(features for _, features in rows), dtype="<f2")
+        matrix = matrix.reshape(len(rows), FEATURE_SIZE).astype(np.float32)
+        # Start offset of each species' run of rows, for np.maximum.reduceat
+        unique_ids, starts = np.unique(species_ids, return_index=True)
+        return matrix, unique_ids, starts, names
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded is None:
+                self._loaded = self._load()
+            return self._loaded
+
+    def query_vector(self, vector, top_k=10):
+        matrix, unique_ids, starts, names = self._ensure_loaded()
+        if not len(matrix):
+            return []
+        scores = np.maximum.reduceat(matrix @ vector, starts)
+        top = np.argsort(scores)[::-1][:top_k]
+        return [(int(unique_ids[i]), names.get(int(unique_ids[i])), float(scores[i])) for i in top]
+
+    def query_file(self, path, top_k=10):
+        """Rank species by their best-matching call: [(id, name, score)]."""
+        return self.query_vector(fingerprint_file(path), top_k)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frog call fingerprint index.")
+    parser.add_argument("--db", default="frogs_toads.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index_parser = commands.add_parser("index", help="Fingerprint audio files not indexed yet")
+    index_parser.add_argument("--workers", type=int)
+    query_parser = commands.add_parser("query", help="Rank species by similarity to a recording")
+    query_parser.add_argument("clip")
+    query_parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    from main import init_db
+
+    Session = create_session_factory(init_db(args.db))
+    if args.command == "index":
+        print(f"{build_fingerprints(Session, args.workers)} fingerprint(s) added")
+    else:
+        for frog_toad_id, name, score in CallIndex(Session).query_file(args.clip, args.top):
+            print(f"{score:.3f}  {name} (#{frog_toad_id})")
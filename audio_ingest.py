@@ -0,0 +1,193 @@
+import argparse
+import math
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pydub import AudioSegment
+from sqlalchemy import bindparam, select, update
+
+from db import create_session_factory
+from media_store import MediaStore
+from models import AudioFile
+
+AUDIO_DIR = "data/audio"
+PREVIEW_DIR = "data/audio/previews"
+# Stored recordings: mono MP3, which every QMediaPlayer backend can play.
+# Frog calls sit well below 16 kHz, so 32 kHz loses nothing audible
+TARGET_FORMAT = "mp3"
+TARGET_RATE = 32000
+TARGET_BITRATE = "96k"
+# Recordings are brought to this RMS level, unless that would push peaks
+# above PEAK_CEILING_DBFS
+TARGET_DBFS = -20.0
+PEAK_CEILING_DBFS = -1.0
+# Mono MP3s within a quarter of the target bitrate and this close to
+# their normalized level are kept as they are; re-encoding them would
+# only lose quality. Anything else is downmixed, normalized and re-encoded.
+KEEP_BYTES_PER_SECOND = 96000 // 8 * 5 // 4
+KEEP_GAIN_DB = 1.0
+# Preview clips: the loudest stretch of the recording, where the call is
+PREVIEW_MS = 8000
+PREVIEW_RATE = 22050
+PREVIEW_BITRATE = "64k"
+PREVIEW_FADE_MS = 50
+# Energy is measured in blocks of this length to find the loudest stretch
+BLOCK_MS = 250
+# Transcoding is CPU bound; keep a core free for the GUI and queries
+INGEST_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+# Rows written per transaction when backfilling
+WRITE_BATCH = 100
+# AudioFile columns ingest_file() fills in
+INGEST_COLUMNS = ("audio_path", "duration_ms", "sample_rate", "loudness", "preview_path")
+
+def _dbfs(audio):
+    return round(audio.dBFS, 2) if math.isfinite(audio.dBFS) else None
+
+# Gain in dB towards TARGET_DBFS, limited so peaks stay under the ceiling
+def normalize_gain(audio):
+    if not math.isfinite(audio.dBFS):
+        return 0.0
+    return min(TARGET_DBFS - audio.dBFS, PEAK_CEILING_DBFS - audio.max_dBFS)
+
+def normalize(audio):
+    """Apply ``normalize_gain``."""
+    return audio.apply_gain(normalize_gain(audio))
+
+def loudest_window(audio, length_ms=PREVIEW_MS):
+    """Start, in ms, of the ``length_ms`` stretch with the most energy."""
+    if len(audio) <= length_ms:
+        return 0
+    samples = np.array(audio.set_channels(1).get_array_of_samples(), dtype=np.float64)
+    block = max(1, audio.frame_rate * BLOCK_MS // 1000)
+    blocks = len(samples) // block
+    energy = (samples[:blocks * block].reshape(blocks, block) ** 2).sum(axis=1)
+    window = min(blocks, length_ms // BLOCK_MS)
+    # Sum of every run of `window` consecutive blocks
+    totals = np.convolve(energy, np.ones(window), mode="valid")
+    return int(np.argmax(totals)) * BLOCK_MS
+
+def preview_clip(audio):
+    start = loudest_window(audio)
+    clip = audio[start:start + PREVIEW_MS].set_channels(1).set_frame_rate(PREVIEW_RATE)
+    return clip.fade_in(PREVIEW_FADE_MS).fade_out(PREVIEW_FADE_MS)
+
+def _store_segment(audio, dest_dir, bitrate):
+    """Encode ``audio`` into the media store under ``dest_dir``."""
+    os.makedirs(dest_dir, exist_ok=True)
+    # Encoded next to the store so adding it can hard link, not copy
+    handle, tmp_path = tempfile.mkstemp(suffix=f".{TARGET_FORMAT}", dir=dest_dir)
+    os.close(handle)
+    try:
+        audio.export(tmp_path, format=TARGET_FORMAT, bitrate=bitrate)
+        return MediaStore(dest_dir, allow_hardlink=True).add(tmp_path)
+    finally:
+        os.remove(tmp_path)
+
+def _keep_as_is(src_path, audio):
+    if os.path.splitext(src_path)[1].lower() != f".{TARGET_FORMAT}":
+        return False
+    if audio.channels != 1 or abs(normalize_gain(audio)) > KEEP_GAIN_DB:
+        return False
+    seconds = max(len(audio) / 1000.0, 1.0)
+    return os.path.getsize(src_path) <= seconds * KEEP_BYTES_PER_SECOND
+
+def ingest_file(src_path, audio_dir=AUDIO_DIR, preview_dir=PREVIEW_DIR):
+    """Store one recording with its metadata and preview clip.
+
+    Returns a dict of AudioFile column values: ``audio_path``,
+    ``duration_ms``, ``sample_rate``, ``loudness`` (RMS level of the
+    source in dBFS) and ``preview_path``. Runs in a pool process.
+    """
+    audio = AudioSegment.from_file(src_path)
+    info = {"duration_ms": len(audio), "loudness": _dbfs(audio)}
+    if _keep_as_is(src_path, audio):
+        # Copied, not linked: the source is the user's file
+        info["audio_path"] = MediaStore(audio_dir).add(src_path)
+        info["sample_rate"] = audio.frame_rate
+    else:
+        audio = normalize(audio.set_channels(1).set_frame_rate(TARGET_RATE))
+        info["audio_path"] = _store_segment(audio, audio_dir, TARGET_BITRATE)
+        info["sample_rate"] = TARGET_RATE
+    info["preview_path"] = _store_segment(preview_clip(audio), preview_dir, PREVIEW_BITRATE)
+    return info
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def executor():
+    """The shared ingest process pool, started on first use.
+
+    Workers are spawned rather than forked: forking a process that is
+    running Qt and database threads can deadlock the child.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=INGEST_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+# Process-pool entry point for backfilling: (audio_file_id, info or None)
+def _backfill(job):
+    audio_file_id, path = job
+    try:
+        return audio_file_id, ingest_file(path)
+    except Exception as exc:
+        print(f"Could not ingest {path}: {exc}", file=sys.stderr)
+        return audio_file_id, None
+
+def backfill(Session, workers=INGEST_WORKERS):
+    """Ingest audio rows stored before this pipeline existed.
+
+    Rows without a duration are transcoded, measured and given previews;
+    their ``audio_path`` moves to the new file, and the old one is left
+    for ``media_store.collect_garbage``. Returns the number updated.
+    """
+    session = Session()
+    try:
+        jobs = session.execute(
+            select(AudioFile.id, AudioFile.audio_path)
+            .where(AudioFile.duration_ms.is_(None), AudioFile.audio_path.isnot(None))
+        ).all()
+        updated = 0
+        batch = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for audio_file_id, info in pool.map(_backfill, [tuple(job) for job in jobs], chunksize=4):
+                if info is None:
+                    continue
+                batch.append({"audio_file_id": audio_file_id, **{f"new_{name}": value for name, value in info.items()}})
+                if len(batch) >= WRITE_BATCH:
+                    updated += _write_backfill(session, batch)
+                    batch = []
+        if batch:
+            updated += _write_backfill(session, batch)
+        return updated
+    finally:
+        session.close()
+
+def _write_backfill(session, batch):
+    # Bind names can't repeat column names in an executemany UPDATE
+    table = AudioFile.__table__
+    session.execute(
+        update(table).where(table.c.id == bindparam("audio_file_id")).values(
+            {name: bindparam(f"new_{name}") for name in INGEST_COLUMNS}
+        ),
+        batch,
+    )
+    session.commit()
+    return len(batch)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcode and measure audio stored before ingest existed.")
+    parser.add_argument("--db", default="frogs_toads.db")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    args = parser.parse_args()
+
+    from main import init_db
+
+    print(f"{backfill(create_session_factory(init_db(args.db)), args.workers)} recording(s) ingested")
@@ -0,0 +1,252 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import tarfile
+import time
+
+from sqlalchemy import select
+
+from db import create_session_factory
+from media_store import CHUNK_SIZE
+from models import AudioFile, FrogsToad, Image, State, TerritoryMap, frog_toad_states
+from queries import PROFILE_FIELDS
+
+# Pages copied per backup step. The source is only locked while a step
+# runs, so the app keeps reading and saving between steps
+BACKUP_PAGES = 1024
+# Pause between steps, in seconds, to give writers a turn
+BACKUP_SLEEP = 0.005
+# Species read per export batch; bounds memory regardless of catalog size
+EXPORT_BATCH = 500
+# Name of the checksum list inside a media archive, in `sha256sum` format
+MANIFEST_NAME = "MANIFEST.sha256"
+
+def backup_database(db_path, dest_path, pages=BACKUP_PAGES, progress=None):
+    """Copy a live database to ``dest_path`` with the SQLite backup API.
+
+    The copy is a consistent snapshot taken without blocking writers. It
+    is built under a temporary name and renamed into place, so
+    ``dest_path`` is either the previous backup or a complete new one.
+    ``progress(remaining, total)`` is called after every step.
+    """
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    source = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True, isolation_level=None)
+    dest = sqlite3.connect(tmp_path)
+    try:
+        # Hold one read transaction for the whole copy. Under WAL that pins
+        # a snapshot: saves carry on, and the backup neither sees them nor
+        # restarts because of them, which it otherwise would on every step
+        # while the app is writing
+        source.execute("BEGIN")
+        source.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        source.backup(dest, pages=pages, sleep=BACKUP_SLEEP,
+                      progress=lambda status, remaining, total: progress and progress(remaining, total))
+        # A backup of a WAL database is itself in WAL mode; a standalone
+        # file is easier to move around
+        dest.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        dest.close()
+        source.close()
+    try:
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _children(session, model, value, ids):
+    """{frog_toad_id: [value, ...]} for one child table, in row order."""
+    grouped = {}
+    for frog_toad_id, item in session.execute(
+        select(model.frog_toad_id, value).where(model.frog_toad_id.in_(ids)).order_by(model.frog_toad_id, model.id)
+    ):
+        if item:
+            grouped.setdefault(frog_toad_id, []).append(item)
+    return grouped
+
+def iter_species(session, batch_size=EXPORT_BATCH):
+    """Yield every species as an import-compatible record, in id order.
+
+    Species are read in keyset-paged batches and each batch's images,
+    audio, maps and states with one query apiece, so memory stays flat
+    however large the catalog is. The records use the same keys
+    ``importer.py`` reads, so an export can be imported again.
+    """
+    last_id = 0
+    columns = [getattr(FrogsToad, field) for field in PROFILE_FIELDS]
+    while True:
+        rows = session.execute(
+            select(FrogsToad.id, *columns).where(FrogsToad.id > last_id).order_by(FrogsToad.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        ids = [row[0] for row in rows]
+        images = _children(session, Image, Image.image_path, ids)
+        audio_files = _children(session, AudioFile, AudioFile.audio_path, ids)
+        maps = _children(session, TerritoryMap, TerritoryMap.map_path, ids)
+        states = {}
+        for frog_toad_id, state_name in session.execute(
+            select(frog_toad_states.c.frog_toad_id, State.state_name)
+            .join(State, State.id == frog_toad_states.c.state_id)
+            .where(frog_toad_states.c.frog_toad_id.in_(ids))
+            .order_by(frog_toad_states.c.frog_toad_id, State.state_name)
+        ):
+            states.setdefault(frog_toad_id, []).append(state_name)
+        for frog_toad_id, *values in rows:
+            record = {"id": frog_toad_id}
+            record.update(zip(PROFILE_FIELDS, values))
+            record["images"] = images.get(frog_toad_id, [])
+            record["audio"] = audio_files.get(frog_toad_id, [])
+            record["map"] = maps.get(frog_toad_id, [None])[0]
+            record["states"] = states.get(frog_toad_id, [])
+            yield record
+        last_id = ids[-1]
+
+def export_jsonl(session, dest_path):
+    """Write one JSON record per species; returns the number written."""
+    count = 0
+    with open(dest_path, "w", encoding="utf-8") as f:
+        for record in iter_species(session):
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+def export_columnar(session, dest_path, batch_size=EXPORT_BATCH):
+    """Write species as Parquet, or as an Arrow IPC file for ``.arrow``.
+
+    Needs pyarrow. Each batch of records becomes one record batch, so the
+    whole catalog is never held in memory.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet and Arrow export need pyarrow (pip install pyarrow)")
+
+    schema = pa.schema(
+        [pa.field("id", pa.int64())]
+        + [pa.field(field, pa.string()) for field in PROFILE_FIELDS]
+        + [
+            pa.field("images", pa.list_(pa.string())),
+            pa.field("audio", pa.list_(pa.string())),
+            pa.field("map", pa.string()),
+            pa.field("states", pa.list_(pa.string())),
+        ]
+    )
+    if dest_path.endswith((".arrow", ".feather")):
+        writer = pa.ipc.new_file(dest_path, schema)
+    else:
+        writer = pq.ParquetWriter(dest_path, schema)
+
+    count = 0
+    batch = []
+    try:
+        for record in iter_species(session, batch_size):
+            batch.append(record)
+            if len(batch) == batch_size:
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+            count += len(batch)
+    finally:
+        writer.close()
+    return count
+
+def iter_media_paths(session):
+    """Yield each distinct media path referenced by any row, sorted."""
+    for column in (Image.image_path, AudioFile.audio_path, AudioFile.preview_path, TerritoryMap.map_path):
+        for path, in session.execute(select(column).distinct().where(column.isnot(None)).order_by(column)):
+            if path:
+                yield path
+
+class _HashingReader:
+    """File wrapper that hashes whatever tarfile reads through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.digest.update(data)
+        return data
+
+def archive_media(session, dest_path, compress=False):
+    """Bundle every referenced media file into a tar archive.
+
+    Each file is hashed in the same pass that copies it into the archive,
+    and the digests are written last as ``MANIFEST.sha256``, which
+    ``sha256sum -c`` can check after extraction. Media formats are already
+    compressed, so gzip is off by default. Returns ``(archived, missing)``.
+    """
+    seen = set()
+    manifest = []
+    missing = []
+    with tarfile.open(dest_path, "w|gz" if compress else "w|", bufsize=CHUNK_SIZE) as archive:
+        for path in iter_media_paths(session):
+            # The same file can be referenced from several tables
+            name = os.path.normpath(path)
+            if name in seen:
+                continue
+            seen.add(name)
+            if not os.path.isfile(path):
+                missing.append(path)
+                continue
+            info = archive.gettarinfo(path, arcname=name)
+            with open(path, "rb") as f:
+                reader = _HashingReader(f)
+                archive.addfile(info, reader)
+            manifest.append(f"{reader.digest.hexdigest()}  {name}\n")
+
+        data = "".join(manifest).encode("utf-8")
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        archive.addfile(info, io.BytesIO(data))
+    return len(manifest), missing
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up or export the species catalog.")
+    parser.add_argument("--db", default="frogs_toads.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backup_parser = commands.add_parser("backup", help="Online snapshot of the database file")
+    backup_parser.add_argument("dest")
+    backup_parser.add_argument("--pages", type=int, default=BACKUP_PAGES)
+    export_parser = commands.add_parser("export", help="Species with their media, states and maps")
+    export_parser.add_argument("dest", help="A .jsonl, .parquet or .arrow file")
+    media_parser = commands.add_parser("media", help="Tar archive of referenced media with checksums")
+    media_parser.add_argument("dest")
+    media_parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "backup":
+        def report(remaining, total):
+            print(f"\r{total - remaining}/{total} pages", end="", flush=True)
+        backup_database(args.db, args.dest, args.pages, report)
+        print()
+    else:
+        from main import init_db
+
+        session = create_session_factory(init_db(args.db))()
+        try:
+            if args.command == "export":
+                if args.dest.endswith((".parquet", ".arrow", ".feather")):
+                    try:
+                        count = export_columnar(session, args.dest)
+                    except RuntimeError as e:
+                        parser.error(str(e))
+                else:
+                    count = export_jsonl(session, args.dest)
+                print(f"{count} species exported")
+            else:
+                archived, missing = archive_media(session, args.dest, args.gzip)
+                for path in missing:
+                    print(f"missing: {path}")
+                print(f"{archived} file(s) archived, {len(missing)} missing")
+        finally:
+            session.close()
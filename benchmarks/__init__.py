@@ -0,0 +1,7 @@
+"""Performance benchmarks for the catalog.
+
+``benchmarks.generate`` fills a database with a seeded synthetic catalog and
+``benchmarks.harness`` times the main code paths against it. Run everything
+with ``python -m benchmarks``. ``python -m benchmarks.loadtest`` drives a
+running API server (server.py) instead.
+"""
@@ -0,0 +1,31 @@
+import argparse
+import json
+import sys
+
+from benchmarks.harness import ITERATIONS, SCALES, compare, load_results, run
+
+parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Run the catalog benchmarks.")
+parser.add_argument("--scales", default="1k", help=f"Comma-separated subset of {', '.join(SCALES)}")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--iterations", type=int, default=ITERATIONS)
+parser.add_argument("--out", help="Write JSON results here instead of stdout")
+parser.add_argument("--compare", metavar="BASELINE", help="Previous results JSON to compare against")
+args = parser.parse_args()
+
+scales = [scale.strip() for scale in args.scales.split(",") if scale.strip()]
+unknown = [scale for scale in scales if scale not in SCALES]
+if unknown:
+    parser.error(f"unknown scale(s): {', '.join(unknown)}")
+
+# Progress goes to stderr so stdout stays valid JSON
+results = run(scales, args.seed, args.iterations, report=lambda line: print(line, file=sys.stderr))
+if args.out:
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+else:
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+if args.compare:
+    for scale, name, before, after, ratio in compare(load_results(args.compare), results):
+        print(f"{scale:>5} {name:<18} {before:9.2f} -> {after:9.2f} ms  x{ratio:.2f}", file=sys.stderr)
@@ -0,0 +1,115 @@
+import argparse
+import random
+import time
+
+from models import AudioFile, FrogsToad, Image, State, TerritoryMap, frog_toad_states
+
+US_STATES = (
+    "Alabama", "Alaska", "Arizona", "Arkansas", "California", "Colorado", "Connecticut",
+    "Delaware", "Florida", "Georgia", "Hawaii", "Idaho", "Illinois", "Indiana", "Iowa",
+    "Kansas", "Kentucky", "Louisiana", "Maine", "Maryland", "Massachusetts", "Michigan",
+    "Minnesota", "Mississippi", "Missouri", "Montana", "Nebraska", "Nevada", "New Hampshire",
+    "New Jersey", "New Mexico", "New York", "North Carolina", "North Dakota", "Ohio",
+    "Oklahoma", "Oregon", "Pennsylvania", "Rhode Island", "South Carolina", "South Dakota",
+    "Tennessee", "Texas", "Utah", "Vermont", "Virginia", "Washington", "West Virginia",
+    "Wisconsin", "Wyoming",
+)
+GENUS = ("Lithobates", "Anaxyrus", "Hyla", "Pseudacris", "Acris", "Scaphiopus", "Incilius", "Rana")
+EPITHET_SYLLABLES = ("ca", "te", "si", "pal", "lo", "ver", "mon", "ri", "us", "ta", "no", "gra")
+COMMON_PREFIX = ("Northern", "Southern", "Eastern", "Western", "Spotted", "Barking", "Gray", "Green", "Red-legged")
+COMMON_KIND = ("Leopard Frog", "Tree Frog", "Chorus Frog", "Toad", "Spadefoot", "Cricket Frog", "Bullfrog")
+SEASONS = ("Spring", "Summer", "Late winter", "Early spring", "Monsoon season", "Spring and summer")
+HABITATS = ("Wetlands", "Ponds and lakes", "Forest floor", "Grassland", "Desert washes", "Streams", "Marshes")
+DIETS = ("Insects", "Insects and spiders", "Small invertebrates", "Worms and snails", "Insects, small fish")
+SIZES = ("2-3 cm", "3-5 cm", "5-9 cm", "9-15 cm", "15-20 cm")
+COLORS = ("Green with dark spots", "Brown", "Gray-green", "Olive with bands", "Bright green", "Tan and cream")
+NOTE_WORDS = (
+    "nocturnal", "chorus", "breeding", "vernal", "pool", "call", "trill", "secretive",
+    "burrowing", "arboreal", "declining", "common", "regional", "variant", "observed",
+)
+# Rows per executemany call / transaction
+CHUNK_SIZE = 10000
+
+def _species_row(rng, frog_toad_id):
+    name = (
+        f"{rng.choice(COMMON_PREFIX)} {rng.choice(COMMON_KIND)} "
+        f"({rng.choice(GENUS)} {''.join(rng.choices(EPITHET_SYLLABLES, k=3))} #{frog_toad_id})"
+    )
+    return {
+        "id": frog_toad_id,
+        "name": name,
+        "breeding_season": rng.choice(SEASONS),
+        "habitat": rng.choice(HABITATS),
+        "diet": rng.choice(DIETS),
+        "adult_size": rng.choice(SIZES),
+        "color_scheme": rng.choice(COLORS),
+        "profile_notes": " ".join(rng.choices(NOTE_WORDS, k=rng.randint(5, 25))),
+    }
+
+# States for one species: a home state plus a few "neighbours" nearby in the
+# list, so memberships cluster regionally instead of being uniform
+def _state_ids(rng, state_count):
+    home = rng.randrange(state_count)
+    spread = rng.choice((0, 1, 1, 2, 3, 6))
+    ids = {home}
+    for _ in range(spread):
+        ids.add(min(state_count - 1, max(0, home + rng.randint(-4, 4))))
+    return ids
+
+def generate_catalog(engine, species, images_per_species=2, audio_per_species=1, seed=0, report=None):
+    """Fill an empty database with a reproducible synthetic catalog.
+
+    The same ``seed`` and sizes always produce identical rows. Media paths
+    are synthetic and do not exist on disk.
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(State.__table__.insert(), [
+            {"id": state_id, "state_name": state_name}
+            for state_id, state_name in enumerate(US_STATES, start=1)
+        ])
+
+    image_id = audio_id = 1
+    for chunk_start in range(1, species + 1, CHUNK_SIZE):
+        chunk_ids = range(chunk_start, min(species + 1, chunk_start + CHUNK_SIZE))
+        rows, images, audio_files, maps, links = [], [], [], [], []
+        for frog_toad_id in chunk_ids:
+            rows.append(_species_row(rng, frog_toad_id))
+            for _ in range(rng.randint(0, 2 * images_per_species)):
+                images.append({"id": image_id, "frog_toad_id": frog_toad_id,
+                               "image_path": f"data/images/synthetic/{image_id}.jpg"})
+                image_id += 1
+            for _ in range(rng.randint(0, 2 * audio_per_species)):
+                audio_files.append({"id": audio_id, "frog_toad_id": frog_toad_id,
+                                    "audio_path": f"data/audio/synthetic/{audio_id}.mp3"})
+                audio_id += 1
+            maps.append({"frog_toad_id": frog_toad_id, "map_path": f"data/maps/synthetic/{frog_toad_id}.png"})
+            links.extend({"frog_toad_id": frog_toad_id, "state_id": state_index + 1}
+                         for state_index in _state_ids(rng, len(US_STATES)))
+        with engine.begin() as conn:
+            conn.execute(FrogsToad.__table__.insert(), rows)
+            if images:
+                conn.execute(Image.__table__.insert(), images)
+            if audio_files:
+                conn.execute(AudioFile.__table__.insert(), audio_files)
+            conn.execute(TerritoryMap.__table__.insert(), maps)
+            conn.execute(frog_toad_states.insert(), links)
+        if report:
+            report(f"generated {chunk_ids[-1]}/{species} species")
+    return time.perf_counter() - started
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic species catalog.")
+    parser.add_argument("db")
+    parser.add_argument("--species", type=int, default=1000)
+    parser.add_argument("--images", type=int, default=2, help="Mean images per species")
+    parser.add_argument("--audio", type=int, default=1, help="Mean audio files per species")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from main import init_db
+
+    seconds = generate_catalog(init_db(args.db, profile="bulk"), args.species,
+                               args.images, args.audio, args.seed, report=print)
+    print(f"done in {seconds:.1f}s")
@@ -0,0 +1,240 @@
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Must be set before the QApplication is created
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QEventLoop, QTimer
+from sqlalchemy import event
+
+from benchmarks.generate import generate_catalog
+
+SCALES = {"1k": 1000, "100k": 100000, "1m": 1000000}
+ITERATIONS = 50
+# Longest any single operation may take before the run is aborted
+TIMEOUT_MS = 120000
+DATA_DIR = "bench_data"
+
+class QueryCounter:
+    """Counts statements executed on an engine while ``active``."""
+
+    def __init__(self, engine):
+        self.count = 0
+        self.active = False
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        if self.active:
+            self.count += 1
+
+def wait_for(signal, trigger, timeout_ms=TIMEOUT_MS):
+    """Call ``trigger`` and spin the event loop until ``signal`` fires."""
+    loop = QEventLoop()
+    fired = []
+
+    def done(*args):
+        fired.append(args)
+        loop.quit()
+
+    signal.connect(done)
+    try:
+        trigger()
+        if not fired:
+            QTimer.singleShot(timeout_ms, loop.quit)
+            loop.exec_()
+    finally:
+        signal.disconnect(done)
+    if not fired:
+        raise TimeoutError(f"no {signal} within {timeout_ms} ms")
+    return fired[0]
+
+def wait_for_callback(start, timeout_ms=TIMEOUT_MS):
+    """Call ``start(done)`` and spin the event loop until ``done`` is called."""
+    loop = QEventLoop()
+    fired = []
+
+    def done(*args):
+        fired.append(args)
+        loop.quit()
+
+    start(done)
+    if not fired:
+        QTimer.singleShot(timeout_ms, loop.quit)
+        loop.exec_()
+    if not fired:
+        raise TimeoutError(f"no result within {timeout_ms} ms")
+    return fired[0]
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def measure(operation, counter, iterations=ITERATIONS):
+    """Time ``operation(i)`` for each iteration and summarize.
+
+    Peak Python allocation is measured in one extra traced run, so tracing
+    overhead doesn't skew the latencies.
+    """
+    timings = []
+    counter.count = 0
+    counter.active = True
+    for i in range(iterations):
+        started = time.perf_counter()
+        operation(i)
+        timings.append((time.perf_counter() - started) * 1000)
+    counter.active = False
+    queries = counter.count
+
+    tracemalloc.start()
+    operation(iterations)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "mean_ms": sum(timings) / len(timings),
+        "p50_ms": percentile(timings, 0.50),
+        "p90_ms": percentile(timings, 0.90),
+        "p99_ms": percentile(timings, 0.99),
+        "max_ms": timings[-1],
+        "queries_per_call": queries / iterations,
+        "peak_alloc_kb": peak / 1024,
+    }
+
+def catalog_path(species, seed):
+    return os.path.join(DATA_DIR, f"catalog_{species}_{seed}.db")
+
+def prepare_catalog(species, seed, report=print):
+    """Return an engine on a generated catalog, reusing one from a previous run."""
+    from main import init_db
+
+    path = catalog_path(species, seed)
+    exists = os.path.exists(path)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    engine = init_db(path)
+    if not exists:
+        seconds = generate_catalog(engine, species, seed=seed, report=report)
+        report(f"generated {species} species in {seconds:.1f}s")
+    return engine
+
+def run_scale(species, seed=0, iterations=ITERATIONS, report=print):
+    from db import create_session_factory
+    from repository import CatalogRepository
+    from species_model import SpeciesListModel
+    from utils import copy_file_to_dir
+    from views import EditView, FrogsMainWindow
+
+    engine = prepare_catalog(species, seed, report)
+    counter = QueryCounter(engine)
+    Session = create_session_factory(engine)
+    rng = random.Random(seed)
+    ids = [rng.randint(1, species) for _ in range(iterations + 1)]
+    results = {}
+    repository = CatalogRepository(Session)
+
+    def load_species(i):
+        model = SpeciesListModel(repository)
+        wait_for(model.rowsInserted, model.fetchMore)
+
+    def main_window(i):
+        window = FrogsMainWindow(engine=engine)
+        window.show()
+        if not window.species_model.rowCount():
+            wait_for(window.species_model.rowsInserted, lambda: None)
+        window.close()
+        window.repository.shutdown()
+
+    def view_profile(i):
+        wait_for_callback(lambda done: repository.profile(ids[i], done))
+
+    # Everything the map needs is one payload; clicks are then handled
+    # in the page. Measures fetching and encoding it from a warm index.
+    def map_payload(i):
+        wait_for_callback(lambda done: repository.map_payload(done))
+
+    profiles = {}
+
+    def edit_save(i):
+        if ids[i] not in profiles:
+            profiles[ids[i]], = wait_for_callback(lambda done: repository.profile(ids[i], done))
+        edit_view = EditView(profiles[ids[i]], repository)
+        # Unchanged forms are not written at all, so edit one field
+        edit_view.notes_edit.setPlainText(f"benchmark edit {i}")
+        wait_for(edit_view.saved, edit_view.save)
+
+    media_dir = tempfile.mkdtemp(prefix="frogs_bench_")
+    sources = []
+    for n in range(iterations + 1):
+        src = os.path.join(media_dir, f"photo_{n}.jpg")
+        with open(src, "wb") as f:
+            f.write(os.urandom(2 * 1024 * 1024))
+        sources.append(src)
+
+    def copy_file(i):
+        copy_file_to_dir(sources[i], os.path.join(media_dir, "store"))
+
+    operations = {
+        "load_species": load_species,
+        "main_window": main_window,
+        "view_profile": view_profile,
+        "map_payload": map_payload,
+        "edit_save": edit_save,
+        "copy_file_to_dir": copy_file,
+    }
+    try:
+        for name, operation in operations.items():
+            results[name] = measure(operation, counter, iterations)
+            report(f"{species}: {name} p50={results[name]['p50_ms']:.2f}ms p99={results[name]['p99_ms']:.2f}ms")
+    finally:
+        shutil.rmtree(media_dir, ignore_errors=True)
+    return results
+
+def run(scales, seed=0, iterations=ITERATIONS, report=print):
+    from main import create_application
+
+    app = create_application(sys.argv[:1])
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    output = {
+        "meta": {
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "iterations": iterations,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "scales": {},
+    }
+    for scale in scales:
+        output["scales"][scale] = run_scale(SCALES[scale], seed, iterations, report)
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    output["meta"]["peak_rss_kb"] = peak / 1024 if sys.platform == "darwin" else peak
+    app.processEvents()
+    return output
+
+def compare(baseline, current, metric="p50_ms"):
+    """Yield (scale, operation, before, after, ratio) for every shared measurement."""
+    for scale, operations in current["scales"].items():
+        for name, stats in operations.items():
+            before = baseline.get("scales", {}).get(scale, {}).get(name)
+            if before:
+                ratio = stats[metric] / before[metric] if before[metric] else float("inf")
+                yield scale, name, before[metric], stats[metric], ratio
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
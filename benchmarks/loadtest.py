@@ -0,0 +1,144 @@
+"""Load test for the catalog API server (server.py).
+
+Start a server, then e.g.::
+
+    python -m benchmarks.loadtest --url http://127.0.0.1:8080 --concurrency 32 --duration 30
+
+Each client thread keeps one HTTP/1.1 connection open and requests a mix
+of species pages, profiles, state lookups and media files. With
+``--revalidate`` clients send back the ETags they were given, the way a
+tablet app refreshing its lists would, and the server answers with 304s.
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+# Relative weight of each kind of request in the mix
+MIX = {"page": 4, "profile": 4, "state": 2, "media": 1}
+# Profiles fetched up front to find media URLs to request
+MEDIA_SAMPLE = 50
+
+def _get(connection, path, headers=None):
+    connection.request("GET", path, headers=headers or {})
+    response = connection.getresponse()
+    return response.status, response.getheader("ETag"), response.read()
+
+def discover(host, port):
+    """Species ids, state URLs and media URLs to draw requests from."""
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        ids, path = [], "/species?limit=500"
+        while path and len(ids) < 100000:
+            status, _, body = _get(connection, path)
+            page = json.loads(body)
+            ids.extend(item["id"] for item in page["items"])
+            path = page["next"]
+        _, _, body = _get(connection, "/states")
+        states = [state["url"] for state in json.loads(body)["states"] if state["species"]]
+        media = []
+        for frog_toad_id in random.sample(ids, min(MEDIA_SAMPLE, len(ids))):
+            _, _, body = _get(connection, f"/species/{frog_toad_id}")
+            profile = json.loads(body)
+            media.extend(image["url"] for image in profile["images"])
+            media.extend(audio["url"] for audio in profile["audio"])
+        return ids, states, media
+    finally:
+        connection.close()
+
+class Client(threading.Thread):
+    def __init__(self, host, port, targets, deadline, revalidate, seed):
+        super().__init__(daemon=True)
+        self.host, self.port = host, port
+        self.ids, self.states, self.media = targets
+        self.deadline = deadline
+        self.revalidate = revalidate
+        self.random = random.Random(seed)
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+        self.bytes = 0
+        self.etags = {}
+
+    def pick(self):
+        kinds = [kind for kind in MIX if kind != "media" or self.media]
+        kind = self.random.choices(kinds, [MIX[kind] for kind in kinds])[0]
+        if kind == "page":
+            after = self.random.choice(self.ids)
+            return f"/species?after={after}&limit=100"
+        if kind == "profile":
+            return f"/species/{self.random.choice(self.ids)}"
+        if kind == "state":
+            return self.random.choice(self.states)
+        return self.random.choice(self.media)
+
+    def run(self):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        while time.perf_counter() < self.deadline:
+            path = self.pick()
+            headers = {}
+            if self.revalidate and path in self.etags:
+                headers["If-None-Match"] = self.etags[path]
+            started = time.perf_counter()
+            try:
+                status, etag, body = _get(connection, path, headers)
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                continue
+            self.latencies.append(time.perf_counter() - started)
+            self.statuses[status] += 1
+            self.bytes += len(body)
+            if etag:
+                self.etags[path] = etag
+        connection.close()
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def run(url, concurrency, duration, revalidate, seed=0):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    random.seed(seed)
+    targets = discover(host, port)
+    if not targets[0]:
+        raise SystemExit("The catalog is empty")
+    deadline = time.perf_counter() + duration
+    clients = [Client(host, port, targets, deadline, revalidate, seed + index) for index in range(concurrency)]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    statuses = sum((client.statuses for client in clients), Counter())
+    return {
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / elapsed,
+        "megabytes_per_second": sum(client.bytes for client in clients) / elapsed / 1e6,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "statuses": dict(sorted(statuses.items())),
+        "errors": sum(client.errors for client in clients),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest", description="Load test the catalog API server.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds")
+    parser.add_argument("--revalidate", action="store_true", help="Send If-None-Match with remembered ETags")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.url, args.concurrency, args.duration, args.revalidate, args.seed), indent=2))
@@ -0,0 +1,109 @@
+import os
+from urllib.parse import quote
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+# PRAGMA settings applied to every new SQLite connection. WAL lets the
+# repository's reader threads keep querying while a save or import commits;
+# synchronous=NORMAL is crash-safe under WAL and skips an fsync per commit.
+# cache_size is negative, i.e. in KiB rather than pages.
+SQLITE_PROFILES = {
+    "desktop": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64 * 1024,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+        "busy_timeout": 5000,
+    },
+    # Large imports: a bigger page cache and fewer WAL checkpoints
+    "bulk": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -512 * 1024,
+        "mmap_size": 1024 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+        "busy_timeout": 30000,
+        "wal_autocheckpoint": 10000,
+    },
+    # Kiosk or low-memory machines
+    "small": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -8 * 1024,
+        "mmap_size": 0,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+        "busy_timeout": 5000,
+    },
+}
+DEFAULT_PROFILE = "desktop"
+
+# One pooled connection per query thread plus the GUI thread, with some
+# headroom for short bursts (imports, thumbnails, backups)
+POOL_SIZE = 8
+MAX_OVERFLOW = 8
+
+def create_sqlite_engine(db_path, profile=DEFAULT_PROFILE, pool_size=POOL_SIZE, read_only=False, **pragmas):
+    """Create an engine for ``db_path`` tuned with a named PRAGMA profile.
+
+    Keyword arguments override individual PRAGMAs from the profile, e.g.
+    ``cache_size=-16384``. Connections are pooled and may be used from any
+    thread, one thread at a time. ``read_only`` opens the file with
+    ``mode=ro``, keeping whatever journal mode it has; if its directory
+    can't be written either (no room for WAL index files), it is opened
+    as immutable.
+    """
+    settings = dict(SQLITE_PROFILES[profile])
+    settings.update(pragmas)
+
+    url = f"sqlite:///{db_path}"
+    if read_only:
+        # Changing the journal mode is a write
+        settings.pop("journal_mode", None)
+        path = os.path.abspath(db_path)
+        flags = "mode=ro" if os.access(os.path.dirname(path), os.W_OK) else "mode=ro&immutable=1"
+        url = f"sqlite:///file:{quote(path)}?{flags}&uri=true"
+
+    engine = create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=MAX_OVERFLOW,
+        connect_args={"check_same_thread": False},
+    )
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in settings.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
+
+def add_missing_columns(engine, metadata):
+    """Add model columns that an older database file's tables lack.
+
+    ``create_all`` only creates missing tables. SQLite's ALTER TABLE can
+    only add nullable columns without defaults, which is all a new model
+    column should be.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(engine.dialect)}'
+                    )
+
+# The one session factory an application shares. Objects stay readable
+# after commit so a save can report ids and names without a reload query.
+def create_session_factory(engine):
+    return sessionmaker(bind=engine, expire_on_commit=False)
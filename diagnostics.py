@@ -0,0 +1,199 @@
+import functools
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+from sqlalchemy import event
+
+# Set to any value to turn diagnostics on; FROGS_DIAGNOSTICS_LOG overrides
+# where slow operations are logged
+ENV_VAR = "FROGS_DIAGNOSTICS"
+LOG_ENV_VAR = "FROGS_DIAGNOSTICS_LOG"
+SLOW_LOG = "diagnostics.log"
+
+# Anything slower than these is logged
+SLOW_QUERY_MS = 50
+SLOW_CALL_MS = 100
+# The same statement run this many times for one operation is reported as
+# an N+1 pattern: usually a lazy-loaded relationship inside a loop
+N_PLUS_ONE_REPEATS = 10
+# Recent slow events kept for the diagnostics window
+EVENT_HISTORY = 500
+UNSCOPED = "(unscoped)"
+
+@dataclass
+class OperationStats:
+    calls: int = 0
+    call_ms: float = 0.0
+    max_call_ms: float = 0.0
+    queries: int = 0
+    query_ms: float = 0.0
+    max_query_ms: float = 0.0
+    n_plus_one: int = 0
+
+class Operation:
+    """One run of a timed view operation.
+
+    Worker threads started during the run carry it along, so the queries
+    they execute are counted against the view that asked for them.
+    """
+
+    __slots__ = ("name", "statements")
+
+    def __init__(self, name):
+        self.name = name
+        self.statements = Counter()
+
+class Recorder:
+    """Thread-safe totals per operation name plus a log of slow events."""
+
+    def __init__(self, log_path=SLOW_LOG):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.events = deque(maxlen=EVENT_HISTORY)
+        self.stalls = 0
+        # Last operation finished on the GUI thread, to blame stalls on
+        self.last_gui_call = (None, 0.0)
+        self.log_path = log_path
+        self.logger = logging.getLogger("frogs.diagnostics")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        handler = logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self.logger.addHandler(handler)
+
+    def _stats(self, name):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = OperationStats()
+        return stats
+
+    # Caller holds the lock
+    def _event(self, kind, name, ms, detail=""):
+        self.events.append((time.time(), kind, name, ms, detail))
+        self.logger.info("%s %s %.1fms %s", kind, name, ms, detail)
+
+    def record_query(self, operation, statement, ms):
+        name = operation.name if operation else UNSCOPED
+        with self.lock:
+            stats = self._stats(name)
+            stats.queries += 1
+            stats.query_ms += ms
+            stats.max_query_ms = max(stats.max_query_ms, ms)
+            if ms >= SLOW_QUERY_MS:
+                self._event("slow-query", name, ms, " ".join(statement.split())[:300])
+            if operation is not None:
+                operation.statements[statement] += 1
+                if operation.statements[statement] == N_PLUS_ONE_REPEATS:
+                    stats.n_plus_one += 1
+                    self._event("n+1", name, 0.0, " ".join(statement.split())[:300])
+
+    def record_call(self, name, started, ms):
+        with self.lock:
+            stats = self._stats(name)
+            stats.calls += 1
+            stats.call_ms += ms
+            stats.max_call_ms = max(stats.max_call_ms, ms)
+            if ms >= SLOW_CALL_MS:
+                self._event("slow-call", name, ms)
+            if threading.current_thread() is threading.main_thread():
+                self.last_gui_call = (name, started)
+
+    def record_stall(self, started, ms):
+        with self.lock:
+            self.stalls += 1
+            name, call_started = self.last_gui_call
+            self._event("stall", name if name and call_started >= started else "event loop", ms)
+
+    def snapshot(self):
+        with self.lock:
+            stats = {name: OperationStats(**vars(stats)) for name, stats in self.stats.items()}
+            return stats, list(self.events), self.stalls
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.events.clear()
+            self.stalls = 0
+
+_recorder = None
+_local = threading.local()
+
+def enabled():
+    return _recorder is not None
+
+def enable(log_path=SLOW_LOG):
+    """Start recording. Until this is called every hook is a no-op."""
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder(log_path)
+    return _recorder
+
+def enable_from_environment():
+    if os.environ.get(ENV_VAR):
+        return enable(os.environ.get(LOG_ENV_VAR, SLOW_LOG))
+    return None
+
+def recorder():
+    return _recorder
+
+def current_operation():
+    if _recorder is None:
+        return None
+    return getattr(_local, "operation", None)
+
+class _Resumed:
+    __slots__ = ("operation", "previous")
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def __enter__(self):
+        self.previous = getattr(_local, "operation", None)
+        _local.operation = self.operation
+
+    def __exit__(self, *exc_info):
+        _local.operation = self.previous
+
+_NOTHING = nullcontext()
+
+def resumed(operation):
+    """Attribute queries on this thread to ``operation`` (from a Worker)."""
+    return _Resumed(operation) if operation is not None else _NOTHING
+
+def timed(name):
+    """Decorator: time each call and attribute its queries to ``name``.
+
+    With diagnostics off this is one extra function call.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                with _Resumed(Operation(name)):
+                    return fn(*args, **kwargs)
+            finally:
+                _recorder.record_call(name, started, (time.perf_counter() - started) * 1000)
+        return wrapper
+    return decorate
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.diagnostics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = context.diagnostics_started
+    _recorder.record_query(getattr(_local, "operation", None), statement,
+                           (time.perf_counter() - started) * 1000)
+
+def instrument(engine):
+    """Count and time every statement on ``engine``; call after enable()."""
+    if _recorder is not None:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,119 @@
+import time
+
+from PyQt5.QtCore import QObject, Qt, QTimer
+from PyQt5.QtWidgets import (
+    QDialog, QHBoxLayout, QHeaderView, QPlainTextEdit, QPushButton, QTableWidget,
+    QTableWidgetItem, QVBoxLayout
+)
+
+import diagnostics
+
+# The Qt side of diagnostics, kept apart so command-line tools can import
+# diagnostics without loading QtWidgets
+
+# The stall detector ticks this often; a tick late by more than STALL_MS
+# means the GUI thread was blocked
+STALL_TICK_MS = 50
+STALL_MS = 250
+
+class StallDetector(QObject):
+    """Notices GUI-thread stalls by how late a short repeating timer fires."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.timer = QTimer(self)
+        self.timer.setInterval(STALL_TICK_MS)
+        self.timer.timeout.connect(self.tick)
+        self.last_tick = time.perf_counter()
+
+    def start(self):
+        self.last_tick = time.perf_counter()
+        self.timer.start()
+
+    def tick(self):
+        now = time.perf_counter()
+        late_ms = (now - self.last_tick) * 1000 - STALL_TICK_MS
+        recorder = diagnostics.recorder()
+        if late_ms >= STALL_MS and recorder is not None:
+            recorder.record_stall(self.last_tick, late_ms)
+        self.last_tick = now
+
+_stall_detector = None
+
+def start_stall_detector():
+    global _stall_detector
+    if diagnostics.enabled() and _stall_detector is None:
+        _stall_detector = StallDetector()
+        _stall_detector.start()
+
+class DiagnosticsWindow(QDialog):
+    COLUMNS = ("Operation", "Calls", "Avg ms", "Max ms", "Queries", "Queries/call",
+               "SQL ms", "Max SQL ms", "N+1")
+    REFRESH_MS = 1000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Diagnostics")
+        self.resize(900, 600)
+
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSortingEnabled(True)
+        layout.addWidget(self.table)
+
+        self.events = QPlainTextEdit()
+        self.events.setReadOnly(True)
+        layout.addWidget(self.events)
+
+        button_layout = QHBoxLayout()
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+        button_layout.addWidget(reset_button)
+        button_layout.addStretch()
+        layout.addLayout(button_layout)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(self.REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def showEvent(self, event):
+        self.refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def reset(self):
+        if diagnostics.enabled():
+            diagnostics.recorder().reset()
+        self.refresh()
+
+    def refresh(self):
+        recorder = diagnostics.recorder()
+        if recorder is None:
+            self.events.setPlainText(f"Diagnostics are off. Set {diagnostics.ENV_VAR}=1 to enable them.")
+            return
+        stats, events, stalls = recorder.snapshot()
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(stats))
+        for row, (name, op) in enumerate(sorted(stats.items())):
+            calls = op.calls or 1
+            values = (name, op.calls, op.call_ms / calls, op.max_call_ms, op.queries,
+                      op.queries / calls, op.query_ms, op.max_query_ms, op.n_plus_one)
+            for column, value in enumerate(values):
+                item = QTableWidgetItem()
+                # Numbers go in as data so sorting is numeric
+                item.setData(Qt.DisplayRole, round(value, 1) if isinstance(value, float) else value)
+                self.table.setItem(row, column, item)
+        self.table.setSortingEnabled(True)
+
+        lines = [f"{stalls} GUI stall(s); slow operations are logged to {recorder.log_path}"]
+        for timestamp, kind, name, ms, detail in reversed(events):
+            clock = time.strftime("%H:%M:%S", time.localtime(timestamp))
+            lines.append(f"{clock} {kind:<10} {name:<24} {ms:8.1f}ms {detail}")
+        self.events.setPlainText("\n".join(lines))
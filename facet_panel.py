@@ -0,0 +1,74 @@
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import QLabel, QListWidget, QListWidgetItem, QScrollArea, QVBoxLayout, QWidget
+
+from facets import FACET_TITLES
+
+# Height of each facet's value list
+LIST_HEIGHT = 120
+
+class FacetPanel(QWidget):
+    """Checkable value lists, one per facet, labelled with live counts.
+
+    Emits ``filtersChanged`` with ``{facet: [values]}`` whenever a value is
+    ticked or cleared; ``set_counts`` relabels the lists from a
+    ``FacetIndex.query`` result. Values with no matches under the current
+    filters are hidden unless they are ticked.
+    """
+
+    filtersChanged = pyqtSignal(dict)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumWidth(240)
+        self.setStyleSheet("background-color: #2D2D2D; color: white;")
+        self.lists = {}
+        # {facet: {value: item}}
+        self.items = {}
+
+        content = QWidget()
+        content_layout = QVBoxLayout(content)
+        for facet, title in FACET_TITLES.items():
+            content_layout.addWidget(QLabel(f"<b>{title}</b>"))
+            value_list = QListWidget()
+            value_list.setFixedHeight(LIST_HEIGHT)
+            value_list.setStyleSheet("border: 1px solid #555;")
+            value_list.itemChanged.connect(self.item_changed)
+            content_layout.addWidget(value_list)
+            self.lists[facet] = value_list
+            self.items[facet] = {}
+        content_layout.addStretch()
+
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setWidget(content)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(scroll_area)
+
+    def selected(self):
+        return {
+            facet: [value for value, item in items.items() if item.checkState() == Qt.Checked]
+            for facet, items in self.items.items()
+        }
+
+    def item_changed(self, item):
+        self.filtersChanged.emit(self.selected())
+
+    def set_counts(self, counts):
+        for facet, value_list in self.lists.items():
+            facet_counts = counts.get(facet, {})
+            items = self.items[facet]
+            value_list.blockSignals(True)
+            for value in sorted(facet_counts):
+                if value not in items:
+                    item = QListWidgetItem()
+                    item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                    item.setCheckState(Qt.Unchecked)
+                    value_list.addItem(item)
+                    items[value] = item
+            for value, item in items.items():
+                count = facet_counts.get(value, 0)
+                item.setText(f"{value} ({count})")
+                item.setHidden(count == 0 and item.checkState() != Qt.Checked)
+            value_list.sortItems()
+            value_list.blockSignals(False)
@@ -0,0 +1,324 @@
+import argparse
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+from models import FacetValue, FrogsToad, State, frog_toad_states, species_facets
+
+# Free-text FrogsToad columns offered as filters
+FACETS = ("habitat", "diet", "breeding_season", "color_scheme", "adult_size")
+# States come from frog_toad_states rather than a text column
+STATE_FACET = "state"
+FACET_TITLES = {
+    "habitat": "Habitat",
+    "diet": "Diet",
+    "breeding_season": "Breeding Season",
+    "color_scheme": "Color Scheme",
+    "adult_size": "Adult Size",
+    STATE_FACET: "State",
+}
+# Species synced per batch; also keeps IN lists under SQLite's variable limit
+SYNC_BATCH = 500
+# Matching species returned with names by a filter query
+RESULT_LIMIT = 1000
+
+# "Ponds and lakes" -> ponds, lakes; "Insects, small fish" -> insects, small fish
+_SEPARATORS = re.compile(r"\s*(?:[,;/&]|\band\b)\s*", re.IGNORECASE)
+
+def normalize(text):
+    """Split a free-text attribute into its lower-cased facet values."""
+    if not text:
+        return set()
+    values = (" ".join(part.split()).lower() for part in _SEPARATORS.split(text))
+    return {value for value in values if value}
+
+def _value_ids(session, pairs):
+    """{(facet, value): facet_values.id}, creating rows for new values."""
+    if not pairs:
+        return {}
+    known = {}
+    for facet in {facet for facet, _ in pairs}:
+        values = [value for pair_facet, value in pairs if pair_facet == facet]
+        for start in range(0, len(values), SYNC_BATCH):
+            rows = session.execute(select(FacetValue.id, FacetValue.value).where(
+                FacetValue.facet == facet, FacetValue.value.in_(values[start:start + SYNC_BATCH])))
+            known.update({(facet, value): value_id for value_id, value in rows})
+    missing = [pair for pair in pairs if pair not in known]
+    for facet, value in missing:
+        known[(facet, value)] = session.execute(
+            insert(FacetValue).values(facet=facet, value=value, species_count=0)
+        ).inserted_primary_key[0]
+    return known
+
+def sync_species(session, frog_toad_ids):
+    """Bring species_facets and the value counts in line with these species.
+
+    Only links that changed are inserted or deleted. Runs in the caller's
+    transaction; the caller commits.
+    """
+    frog_toad_ids = list(frog_toad_ids)
+    for start in range(0, len(frog_toad_ids), SYNC_BATCH):
+        batch = frog_toad_ids[start:start + SYNC_BATCH]
+        columns = [getattr(FrogsToad, facet) for facet in FACETS]
+        desired = {}
+        for frog_toad_id, *texts in session.execute(select(FrogsToad.id, *columns).where(FrogsToad.id.in_(batch))):
+            desired[frog_toad_id] = {(facet, value) for facet, text in zip(FACETS, texts) for value in normalize(text)}
+        existing = {}
+        for frog_toad_id, value_id in session.execute(
+            select(species_facets.c.frog_toad_id, species_facets.c.facet_value_id)
+            .where(species_facets.c.frog_toad_id.in_(batch))
+        ):
+            existing.setdefault(frog_toad_id, set()).add(value_id)
+
+        value_ids = _value_ids(session, {pair for pairs in desired.values() for pair in pairs})
+        links_added, links_removed = [], []
+        count_changes = Counter()
+        for frog_toad_id in batch:
+            want = {value_ids[pair] for pair in desired.get(frog_toad_id, ())}
+            have = existing.get(frog_toad_id, set())
+            for value_id in want - have:
+                links_added.append({"frog_toad_id": frog_toad_id, "facet_value_id": value_id})
+                count_changes[value_id] += 1
+            for value_id in have - want:
+                links_removed.append({"species_id": frog_toad_id, "value_id": value_id})
+                count_changes[value_id] -= 1
+
+        # One executemany per kind of write
+        if links_added:
+            session.execute(insert(species_facets), links_added)
+        if links_removed:
+            session.execute(delete(species_facets).where(
+                species_facets.c.frog_toad_id == bindparam("species_id"),
+                species_facets.c.facet_value_id == bindparam("value_id"),
+            ), links_removed)
+        count_updates = [{"value_id": value_id, "change": change}
+                         for value_id, change in count_changes.items() if change]
+        if count_updates:
+            values = FacetValue.__table__
+            session.execute(update(values).where(values.c.id == bindparam("value_id"))
+                            .values(species_count=values.c.species_count + bindparam("change")), count_updates)
+
+def sync_missing(session):
+    """Sync species that have no facet links yet, e.g. after a bulk import.
+
+    Returns how many were checked; species whose attributes are all empty
+    are checked again each time, which costs one cheap pass.
+    """
+    missing = [frog_toad_id for frog_toad_id, in session.execute(
+        select(FrogsToad.id).where(~FrogsToad.id.in_(select(species_facets.c.frog_toad_id).distinct()))
+    )]
+    sync_species(session, missing)
+    return len(missing)
+
+# Unfiltered counts straight from the tables: facet_values.species_count
+# for the text facets, one GROUP BY for states. Needs no index build.
+def value_counts(session):
+    counts = {facet: {} for facet in FACETS + (STATE_FACET,)}
+    for facet, value, count in session.execute(
+        select(FacetValue.facet, FacetValue.value, FacetValue.species_count).where(FacetValue.species_count > 0)
+    ):
+        counts[facet][value] = count
+    counts[STATE_FACET] = dict(session.execute(
+        select(State.state_name, func.count())
+        .join(frog_toad_states, frog_toad_states.c.state_id == State.id)
+        .group_by(State.id)
+    ).all())
+    return counts
+
+# group_concat hands back each value's member ids as one string, which
+# numpy converts far faster than millions of row tuples
+def _parse_ids(text):
+    return np.array(text.split(","), dtype=np.int64) if text else np.zeros(0, dtype=np.int64)
+
+class _FacetLinks:
+    """One facet's (species, value) links as two parallel arrays.
+
+    ``species[i]`` has value ``values[value_index[i]]``. Counting every
+    value under a filter is one ``np.bincount`` over the links that pass,
+    so the cost follows the number of links, not the number of values.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.positions = {}
+        self.species = np.zeros(0, dtype=np.int64)
+        self.value_index = np.zeros(0, dtype=np.int32)
+
+    def position(self, value):
+        if value not in self.positions:
+            self.positions[value] = len(self.values)
+            self.values.append(value)
+        return self.positions[value]
+
+    def extend(self, pairs):
+        """Append ``(value, species ids array)`` pairs."""
+        pairs = list(pairs)
+        if not pairs:
+            return
+        self.species = np.concatenate([self.species] + [ids for _, ids in pairs])
+        self.value_index = np.concatenate([self.value_index] + [
+            np.full(len(ids), self.position(value), dtype=np.int32) for value, ids in pairs
+        ])
+
+    def remove_species(self, frog_toad_id):
+        keep = self.species != frog_toad_id
+        if not keep.all():
+            self.species = self.species[keep]
+            self.value_index = self.value_index[keep]
+
+    def mask(self, values, size):
+        """Species with any of ``values``, as a bool array over ids."""
+        chosen = [self.positions[value] for value in values if value in self.positions]
+        mask = np.zeros(size, dtype=bool)
+        mask[self.species[np.isin(self.value_index, chosen)]] = True
+        return mask
+
+    def counts(self, base):
+        hits = np.bincount(self.value_index[base[self.species]], minlength=len(self.values))
+        return dict(zip(self.values, hits.tolist()))
+
+class FacetIndex:
+    """Every facet's species links, held in memory as numpy arrays.
+
+    A filter ORs the chosen values within a facet and ANDs across facets
+    as bool arrays indexed by species id. Each value's count under the
+    other facets' choices comes from one ``np.bincount`` per facet, so a
+    query is linear in the catalog and its links however many distinct
+    values a free-text facet has. Built on the first filtered query,
+    patched per species by ``refresh_species``; unfiltered counts come
+    from ``value_counts`` until then.
+    """
+
+    def __init__(self, Session):
+        self.Session = Session
+        self._lock = threading.Lock()
+        self._synced = False
+        self._universe = None
+        self._links = None
+
+    def _sync(self, session):
+        # Caller holds the lock; species imported without facet links
+        # would be missing from both the counts and the index
+        if not self._synced:
+            if sync_missing(session):
+                session.commit()
+            self._synced = True
+
+    def _build(self):
+        session = self.Session()
+        try:
+            self._sync(session)
+            all_ids = _parse_ids(session.execute(select(func.group_concat(FrogsToad.id))).scalar())
+            universe = np.zeros(int(all_ids.max()) + 1 if len(all_ids) else 1, dtype=bool)
+            universe[all_ids] = True
+            links = {facet: _FacetLinks() for facet in FACETS + (STATE_FACET,)}
+            by_facet = {}
+            for facet, value, ids in session.execute(
+                select(FacetValue.facet, FacetValue.value, func.group_concat(species_facets.c.frog_toad_id))
+                .join(species_facets, species_facets.c.facet_value_id == FacetValue.id)
+                .group_by(FacetValue.id)
+            ):
+                by_facet.setdefault(facet, []).append((value, _parse_ids(ids)))
+            by_facet[STATE_FACET] = [(state_name, _parse_ids(ids)) for state_name, ids in session.execute(
+                select(State.state_name, func.group_concat(frog_toad_states.c.frog_toad_id))
+                .join(frog_toad_states, frog_toad_states.c.state_id == State.id)
+                .group_by(State.id)
+            )]
+            for facet, pairs in by_facet.items():
+                links[facet].extend(pairs)
+            return universe, links
+        finally:
+            session.close()
+
+    def _ensure_built(self):
+        # Caller holds the lock
+        if self._links is None:
+            self._universe, self._links = self._build()
+
+    def invalidate(self):
+        with self._lock:
+            self._universe = self._links = None
+
+    def refresh_species(self, frog_toad_id):
+        """Re-read one species' values after a save; a no-op until built."""
+        with self._lock:
+            if self._links is None:
+                return
+            session = self.Session()
+            try:
+                exists = session.get(FrogsToad, frog_toad_id) is not None
+                values = set(session.execute(
+                    select(FacetValue.facet, FacetValue.value)
+                    .join(species_facets, species_facets.c.facet_value_id == FacetValue.id)
+                    .where(species_facets.c.frog_toad_id == frog_toad_id)
+                ))
+                values.update((STATE_FACET, state_name) for state_name, in session.execute(
+                    select(State.state_name)
+                    .join(frog_toad_states, frog_toad_states.c.state_id == State.id)
+                    .where(frog_toad_states.c.frog_toad_id == frog_toad_id)
+                ))
+            finally:
+                session.close()
+            if frog_toad_id >= len(self._universe):
+                self._universe = np.concatenate([self._universe, np.zeros(frog_toad_id + 1 - len(self._universe), dtype=bool)])
+            self._universe[frog_toad_id] = exists
+            one = np.array([frog_toad_id], dtype=np.int64)
+            for facet, links in self._links.items():
+                links.remove_species(frog_toad_id)
+                links.extend((value, one) for value_facet, value in values if value_facet == facet)
+
+    def _unfiltered(self, limit):
+        # Caller holds the lock
+        session = self.Session()
+        try:
+            self._sync(session)
+            total = session.execute(select(func.count(FrogsToad.id))).scalar()
+            ids = list(session.execute(select(FrogsToad.id).order_by(FrogsToad.id).limit(limit)).scalars())
+            return value_counts(session), total, ids
+        finally:
+            session.close()
+
+    def query(self, selected, limit=RESULT_LIMIT):
+        """Filter by ``{facet: [values]}`` and count every facet value.
+
+        Returns ``(counts, total, ids)``: ``counts[facet][value]`` is how
+        many species would match if that value were chosen alongside the
+        other facets' current choices; ``ids`` are the first ``limit``
+        matching species ids.
+        """
+        with self._lock:
+            if self._links is None and not any(selected.values()):
+                return self._unfiltered(limit)
+            self._ensure_built()
+            size = len(self._universe)
+            chosen = {facet: self._links[facet].mask(values, size) for facet, values in selected.items() if values}
+            counts = {}
+            for facet, links in self._links.items():
+                base = self._universe.copy()
+                for other, mask in chosen.items():
+                    if other != facet:
+                        base &= mask
+                counts[facet] = links.counts(base)
+            matches = self._universe.copy()
+            for mask in chosen.values():
+                matches &= mask
+            ids = np.flatnonzero(matches)
+            return counts, len(ids), ids[:limit].tolist()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild facet values for species that lack them.")
+    parser.add_argument("--db", default="frogs_toads.db")
+    args = parser.parse_args()
+
+    from db import create_session_factory
+    from main import init_db
+
+    session = create_session_factory(init_db(args.db, profile="bulk"))()
+    try:
+        print(f"{sync_missing(session)} species synced")
+        session.commit()
+    finally:
+        session.close()
@@ -0,0 +1,393 @@
+import argparse
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PyQt5.QtCore import QSize, Qt
+from PyQt5.QtGui import QImage, QImageReader
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from db import create_session_factory
+from models import FrogsToad, Image, ImageHash
+
+# dHash: the image shrunk to HASH_WIDTH + 1 by HASH_HEIGHT grey pixels, one
+# bit per pair of horizontal neighbours. Resizing and re-encoding move it
+# by a few bits at most; a crop of a few percent by up to about ten
+HASH_WIDTH = 8
+HASH_HEIGHT = 8
+# Images are decoded straight to roughly this size; the JPEG decoder can
+# then skip most of the full-resolution work
+DECODE_SIZE = QSize(64, 64)
+# Hashes at most this many bits apart are reported as near-duplicates.
+# Unrelated photos are rarely closer than 16 bits
+DUPLICATE_DISTANCE = 6
+# Multi-index hashing: the 64 bits split into this many 16-bit blocks, each
+# with its own sorted table. Two hashes within distance d agree to within
+# d // BLOCKS bits on at least one block, so only those buckets are probed
+BLOCKS = 4
+BLOCK_BITS = 64 // BLOCKS
+# Hashes added since the tables were sorted are scanned directly until
+# there are this many, then folded in
+RECENT_LIMIT = 4096
+# Images hashed per repository job, so a backfill never holds a query
+# thread for long
+HASH_BATCH = 100
+# Hashes probed at once by the duplicate report; bounds its memory
+REPORT_CHUNK = 8192
+# Near-duplicates described when an image is added
+MATCH_LIMIT = 20
+
+def dhash_image(image):
+    """64-bit dHash of a QImage as a Python int, or None for a null image."""
+    if image.isNull():
+        return None
+    # Smooth scaling hands back 32-bit pixels whatever the input, so the
+    # grey conversion comes last
+    image = image.scaled(HASH_WIDTH + 1, HASH_HEIGHT, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    image = image.convertToFormat(QImage.Format_Grayscale8)
+    bits = image.constBits()
+    bits.setsize(image.bytesPerLine() * HASH_HEIGHT)
+    pixels = np.frombuffer(bits, np.uint8).reshape(HASH_HEIGHT, image.bytesPerLine())[:, :HASH_WIDTH + 1]
+    brighter = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(brighter).tobytes(), "big")
+
+def dhash_file(path):
+    """dHash of an image file, or None if it can't be read."""
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if size.isValid():
+        reader.setScaledSize(size.scaled(DECODE_SIZE, Qt.KeepAspectRatioByExpanding).boundedTo(size))
+    return dhash_image(reader.read())
+
+# Hashes are unsigned but SQLite integers are signed 64-bit
+def _to_signed(dhash):
+    return dhash - (1 << 64) if dhash is not None and dhash >= 1 << 63 else dhash
+
+def _to_unsigned(dhash):
+    return dhash + (1 << 64) if dhash < 0 else dhash
+
+def store_hashes(session, hashes):
+    """Upsert ``{path: dhash}``; returns ``{path: image_hashes.id}``."""
+    if not hashes:
+        return {}
+    statement = insert(ImageHash)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[ImageHash.path], set_={"dhash": statement.excluded.dhash},
+    ), [{"path": path, "dhash": _to_signed(dhash)} for path, dhash in hashes.items()])
+    paths = list(hashes)
+    ids = {}
+    for start in range(0, len(paths), HASH_BATCH):
+        ids.update(session.execute(select(ImageHash.path, ImageHash.id)
+                                   .where(ImageHash.path.in_(paths[start:start + HASH_BATCH]))).all())
+    return ids
+
+def hash_missing(session, limit=HASH_BATCH, workers=1, index=None):
+    """Hash up to ``limit`` referenced images that have no hash yet.
+
+    Unreadable files are stored with a NULL hash so they are not retried
+    on every pass (``prune`` clears those). New hashes are added to
+    ``index`` if one is given. Commits; returns the number of paths done.
+    """
+    paths = [path for path, in session.execute(
+        select(Image.image_path).distinct()
+        .outerjoin(ImageHash, ImageHash.path == Image.image_path)
+        .where(ImageHash.id.is_(None), Image.image_path.isnot(None))
+        .limit(limit)
+    )]
+    if workers > 1:
+        # QImage releases the GIL while decoding, so threads scale
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            hashes = dict(zip(paths, executor.map(dhash_file, paths)))
+    else:
+        hashes = {path: dhash_file(path) for path in paths}
+    ids = store_hashes(session, hashes)
+    session.commit()
+    if index is not None:
+        for path, dhash in hashes.items():
+            if dhash is not None:
+                index.add(ids[path], dhash)
+    return len(paths)
+
+def prune(session):
+    """Forget hashes of unreferenced paths and of files that failed to read."""
+    referenced = select(Image.image_path).where(Image.image_path.isnot(None))
+    removed = session.execute(delete(ImageHash).where(
+        ImageHash.path.not_in(referenced) | ImageHash.dhash.is_(None))).rowcount
+    session.commit()
+    return removed
+
+def _block(hashes, block):
+    return ((hashes >> np.uint64(block * BLOCK_BITS)) & np.uint64((1 << BLOCK_BITS) - 1)).astype(np.uint16)
+
+# Set bits in each byte value, for numpy before 2.0 (no np.bitwise_count)
+_BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+def popcount(values):
+    """Set bits in each element of an unsigned integer array, as uint8."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    values = np.ascontiguousarray(values)
+    per_byte = _BYTE_BITS[values.view(np.uint8)].reshape(values.shape + (values.itemsize,))
+    return per_byte.sum(axis=-1, dtype=np.uint8)
+
+def _masks(radius):
+    """Every BLOCK_BITS-bit pattern with at most ``radius`` bits set."""
+    masks = [0]
+    for count in range(1, radius + 1):
+        masks.extend(sum(1 << bit for bit in bits) for bits in itertools.combinations(range(BLOCK_BITS), count))
+    return np.array(masks, dtype=np.uint16)
+
+def _segments(starts, counts):
+    # Positions of every element of the ranges [start, start + count)
+    ends = np.cumsum(counts)
+    return np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - (ends - counts), counts)
+
+class ImageHashIndex:
+    """Every image hash in memory, searchable by Hamming distance.
+
+    One sorted table per 16-bit block of the hash. A query probes each
+    table for the block values within ``distance // BLOCKS`` bits of its
+    own and checks only the hashes found there, so a lookup reads a few
+    buckets instead of the whole library. Built on first use.
+    """
+
+    def __init__(self, Session):
+        self.Session = Session
+        self._lock = threading.Lock()
+        self._ids = None
+        self._hashes = None
+        # Per block: (sorted block values, positions into _ids/_hashes)
+        self._tables = None
+        self._recent = []
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = self._hashes = self._tables = None
+            self._recent = []
+
+    def _load(self):
+        session = self.Session()
+        try:
+            rows = session.execute(select(ImageHash.id, ImageHash.dhash).where(ImageHash.dhash.isnot(None))).all()
+        finally:
+            session.close()
+        ids = np.fromiter((hash_id for hash_id, _ in rows), dtype=np.int64, count=len(rows))
+        hashes = np.fromiter((dhash for _, dhash in rows), dtype=np.int64, count=len(rows)).view(np.uint64)
+        return ids, hashes
+
+    def _sort(self, ids, hashes):
+        self._ids, self._hashes = ids, hashes
+        self._tables = []
+        for block in range(BLOCKS):
+            values = _block(hashes, block)
+            order = np.argsort(values, kind="stable")
+            self._tables.append((values[order], order))
+
+    def _ensure_built(self):
+        # Caller holds the lock
+        if self._tables is None:
+            self._sort(*self._load())
+            self._recent = []
+
+    def add(self, hash_id, dhash):
+        """Make a newly stored hash searchable; a no-op until built."""
+        with self._lock:
+            if self._tables is None:
+                return
+            self._recent.append((hash_id, _to_unsigned(dhash)))
+            if len(self._recent) >= RECENT_LIMIT:
+                ids, hashes = zip(*self._recent)
+                self._sort(np.concatenate([self._ids, np.array(ids, dtype=np.int64)]),
+                           np.concatenate([self._hashes, np.array(hashes, dtype=np.uint64)]))
+                self._recent = []
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_built()
+            return len(self._ids) + len(self._recent)
+
+    def near(self, dhash, distance=DUPLICATE_DISTANCE):
+        """``[(image_hashes.id, distance), ...]`` within ``distance`` bits, closest first."""
+        dhash = np.uint64(_to_unsigned(dhash))
+        masks = _masks(distance // BLOCKS)
+        with self._lock:
+            self._ensure_built()
+            found = []
+            for block, (values, order) in enumerate(self._tables):
+                probes = _block(np.array([dhash]), block)[0] ^ masks
+                starts = np.searchsorted(values, probes, side="left")
+                counts = np.searchsorted(values, probes, side="right") - starts
+                found.append(order[_segments(starts, counts)])
+            positions = np.unique(np.concatenate(found))
+            distances = popcount(self._hashes[positions] ^ dhash)
+            close = distances <= distance
+            matches = list(zip(self._ids[positions][close].tolist(), distances[close].tolist()))
+            for hash_id, other in self._recent:
+                bits = (int(dhash) ^ other).bit_count()
+                if bits <= distance:
+                    matches.append((hash_id, bits))
+        return sorted(matches, key=lambda match: (match[1], match[0]))
+
+    def pairs(self, distance=DUPLICATE_DISTANCE):
+        """Yield ``(id, id, distance)`` arrays for every near-duplicate pair.
+
+        Each block's table is joined with itself through the same probes a
+        query uses, REPORT_CHUNK rows at a time. A pair is reported by the
+        first block that finds it only, so nothing needs de-duplicating
+        afterwards and nothing is compared pairwise.
+        """
+        radius = distance // BLOCKS
+        masks = _masks(radius)
+        with self._lock:
+            self._ensure_built()
+            if self._recent:
+                ids, hashes = zip(*self._recent)
+                self._sort(np.concatenate([self._ids, np.array(ids, dtype=np.int64)]),
+                           np.concatenate([self._hashes, np.array(hashes, dtype=np.uint64)]))
+                self._recent = []
+            ids, hashes, tables = self._ids, self._hashes, self._tables
+        for block, (values, order) in enumerate(tables):
+            for start in range(0, len(values), REPORT_CHUNK):
+                chunk = order[start:start + REPORT_CHUNK]
+                probes = (values[start:start + REPORT_CHUNK, None] ^ masks).ravel()
+                lows = np.searchsorted(values, probes, side="left")
+                counts = np.searchsorted(values, probes, side="right") - lows
+                left = np.repeat(np.repeat(chunk, len(masks)), counts)
+                right = order[_segments(lows, counts)]
+                # Each unordered pair once
+                keep = left < right
+                left, right = left[keep], right[keep]
+                bits = popcount(hashes[left] ^ hashes[right])
+                keep = bits <= distance
+                for earlier in range(block):
+                    keep &= popcount(_block(hashes[left], earlier) ^ _block(hashes[right], earlier)) > radius
+                if keep.any():
+                    yield ids[left[keep]], ids[right[keep]], bits[keep]
+
+def describe(session, matches, limit=MATCH_LIMIT):
+    """``(distance, path, frog_toad_id, name)`` for each species image behind ``matches``."""
+    distances = dict(matches[:limit])
+    if not distances:
+        return []
+    rows = session.execute(
+        select(ImageHash.id, ImageHash.path, FrogsToad.id, FrogsToad.name)
+        .join(Image, Image.image_path == ImageHash.path)
+        .join(FrogsToad, FrogsToad.id == Image.frog_toad_id)
+        .where(ImageHash.id.in_(list(distances)))
+        .distinct()
+    )
+    return sorted((distances[hash_id], path, frog_toad_id, name) for hash_id, path, frog_toad_id, name in rows)
+
+def check_image(session, index, path, distance=DUPLICATE_DISTANCE):
+    """Hash a newly stored image and find library images that look like it.
+
+    The hash is stored straight away, so saving the species later doesn't
+    hash the file again. Returns ``describe`` rows; the same file already
+    used by another species comes back at distance 0.
+    """
+    dhash = dhash_file(path)
+    if dhash is None:
+        return []
+    known = session.execute(select(ImageHash.id).where(ImageHash.path == path)).scalar()
+    matches = index.near(dhash, distance)
+    hash_id = store_hashes(session, {path: dhash})[path]
+    session.commit()
+    if known is None:
+        index.add(hash_id, dhash)
+    return describe(session, matches)
+
+def duplicate_groups(session, index, distance=DUPLICATE_DISTANCE):
+    """Group images into clusters of near-duplicates.
+
+    Returns a list of groups, largest first; each group is a list of
+    ``(path, [(frog_toad_id, name), ...])`` for images used by species.
+    """
+    parent = {}
+
+    def find(item):
+        root = item
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while item != root:
+            parent[item], item = root, parent[item]
+        return root
+
+    for left, right, _ in index.pairs(distance):
+        for a, b in zip(left.tolist(), right.tolist()):
+            parent.setdefault(a, a)
+            parent.setdefault(b, b)
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+    clusters = {}
+    for hash_id in parent:
+        clusters.setdefault(find(hash_id), []).append(hash_id)
+
+    hash_ids = list(parent)
+    paths, species = {}, {}
+    for start in range(0, len(hash_ids), HASH_BATCH):
+        for hash_id, path, frog_toad_id, name in session.execute(
+            select(ImageHash.id, ImageHash.path, FrogsToad.id, FrogsToad.name)
+            .outerjoin(Image, Image.image_path == ImageHash.path)
+            .outerjoin(FrogsToad, FrogsToad.id == Image.frog_toad_id)
+            .where(ImageHash.id.in_(hash_ids[start:start + HASH_BATCH]))
+            .order_by(ImageHash.id, FrogsToad.name)
+        ):
+            paths[hash_id] = path
+            if frog_toad_id is not None:
+                species.setdefault(hash_id, []).append((frog_toad_id, name))
+    groups = []
+    for members in clusters.values():
+        group = [(paths[hash_id], species[hash_id]) for hash_id in sorted(members) if hash_id in species]
+        if len(group) > 1:
+            groups.append(group)
+    groups.sort(key=len, reverse=True)
+    return groups
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perceptual hashes for near-duplicate species images.")
+    parser.add_argument("--db", default="frogs_toads.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index_parser = commands.add_parser("index", help="Hash every referenced image that has no hash yet")
+    index_parser.add_argument("--workers", type=int, default=4)
+    report_parser = commands.add_parser("report", help="List groups of near-duplicate images")
+    report_parser.add_argument("--distance", type=int, default=DUPLICATE_DISTANCE)
+    query_parser = commands.add_parser("query", help="Library images that look like a file")
+    query_parser.add_argument("image")
+    query_parser.add_argument("--distance", type=int, default=DUPLICATE_DISTANCE)
+    args = parser.parse_args()
+
+    from main import init_db
+
+    Session = create_session_factory(init_db(args.db))
+    session = Session()
+    try:
+        if args.command == "index":
+            print(f"{prune(session)} stale hash(es) removed")
+            total = 0
+            while True:
+                done = hash_missing(session, HASH_BATCH * args.workers, args.workers)
+                if not done:
+                    break
+                total += done
+                print(f"\r{total} image(s) hashed", end="", flush=True)
+            print(f"\r{total} image(s) hashed")
+        elif args.command == "report":
+            groups = duplicate_groups(session, ImageHashIndex(Session), args.distance)
+            for group in groups:
+                for path, owners in group:
+                    print(f"{path}  {', '.join(f'{name} (#{frog_toad_id})' for frog_toad_id, name in owners)}")
+                print()
+            print(f"{len(groups)} group(s) of near-duplicate images")
+        else:
+            dhash = dhash_file(args.image)
+            if dhash is None:
+                parser.error(f"cannot read {args.image}")
+            rows = describe(session, ImageHashIndex(Session).near(dhash, args.distance))
+            for distance, path, frog_toad_id, name in rows:
+                print(f"{distance:2}  {path}  {name} (#{frog_toad_id})")
+    finally:
+        session.close()
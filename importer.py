@@ -0,0 +1,218 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, text
+
+import facets
+from db import create_session_factory
+from media_store import MediaStore
+from models import (
+    AudioFile, FrogsToad, Image, ImportCheckpoint, State, TerritoryMap, frog_toad_states,
+)
+from queries import PROFILE_FIELDS
+
+CHUNK_SIZE = 1000
+MEDIA_WORKERS = 8
+# Separator for list fields (states, images, audio) in CSV cells
+CSV_LIST_SEPARATOR = ";"
+
+# Yield one dict per species. CSV and JSON Lines are read a record at a time;
+# a .json file must hold a single array and is parsed in one go.
+def iter_records(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+    elif ext in (".jsonl", ".ndjson"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif ext == ".json":
+        with open(path, encoding="utf-8") as f:
+            yield from json.load(f)
+    else:
+        raise ValueError(f"Unsupported catalog format: {path}")
+
+def _as_list(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(CSV_LIST_SEPARATOR) if item.strip()]
+    return list(value)
+
+# Store paths of one record's media list, in order, each once
+def _stored_paths(media, kind, value):
+    paths = (media.get((kind, src)) for src in _as_list(value))
+    return [path for path in dict.fromkeys(paths) if path]
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+class CatalogImporter:
+    """Bulk-load species records and their media into the database.
+
+    Each chunk of records is written in one transaction together with the
+    file's checkpoint, so a rerun after an interruption resumes at the first
+    uncommitted chunk. Media is hashed into the content-addressed stores by a
+    thread pool before the chunk's transaction opens; re-copying a file after
+    a crash is a no-op because identical content is deduplicated. If the file
+    was edited since an earlier run, it is read again from the start and
+    records whose species name is already in the catalog are skipped.
+    """
+
+    def __init__(self, engine, media_dir=None, chunk_size=CHUNK_SIZE, workers=MEDIA_WORKERS):
+        self.Session = create_session_factory(engine)
+        self.media_dir = media_dir
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.stores = {
+            "images": MediaStore("data/images"),
+            "audio": MediaStore("data/audio"),
+            "map": MediaStore("data/maps"),
+        }
+
+    def run(self, path, report=print):
+        source = os.path.abspath(path)
+        fingerprint = _fingerprint(source)
+        media_dir = self.media_dir or os.path.dirname(source)
+
+        session = self.Session()
+        checkpoint = session.get(ImportCheckpoint, source)
+        # Names already in the catalog; only filled in when an edited file is
+        # re-read, so its earlier records aren't imported a second time
+        known_names = set()
+        if checkpoint is None or checkpoint.fingerprint != fingerprint:
+            if checkpoint is not None and checkpoint.rows_done:
+                known_names = {name for (name,) in session.query(FrogsToad.name)}
+                report(f"{path}: changed since the last import, skipping species already in the catalog")
+            checkpoint = ImportCheckpoint(source=source, fingerprint=fingerprint, rows_done=0)
+            session.merge(checkpoint)
+            session.commit()
+        rows_done = checkpoint.rows_done
+        # Resolve states from memory instead of one query per checked state
+        state_ids = dict(session.query(State.state_name, State.id))
+        session.close()
+        if rows_done:
+            report(f"{path}: resuming after {rows_done} records")
+
+        records = itertools.islice(iter_records(source), rows_done, None)
+        started = time.perf_counter()
+        imported = skipped = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                chunk = list(itertools.islice(records, self.chunk_size))
+                if not chunk:
+                    break
+                rows_done += len(chunk)
+                if known_names:
+                    new = [record for record in chunk if (record.get("name") or "") not in known_names]
+                    skipped += len(chunk) - len(new)
+                    chunk = new
+                media = self._store_media(executor, chunk, media_dir)
+                self._write_chunk(source, chunk, media, state_ids, rows_done)
+                imported += len(chunk)
+                elapsed = time.perf_counter() - started
+                report(f"{path}: {rows_done} records ({imported / elapsed:.0f} rows/s)")
+        if skipped:
+            report(f"{path}: {skipped} records skipped as already imported")
+        return imported
+
+    def _store_media(self, executor, chunk, media_dir):
+        jobs = []
+        for record in chunk:
+            for kind in ("images", "audio"):
+                jobs.extend((kind, src) for src in _as_list(record.get(kind)))
+            if record.get("map"):
+                jobs.append(("map", record["map"]))
+        # Unique (kind, source) pairs so a photo shared by many rows is hashed once
+        jobs = list(dict.fromkeys(jobs))
+        stored = executor.map(lambda job: self._store_one(job, media_dir), jobs)
+        return dict(zip(jobs, stored))
+
+    def _store_one(self, job, media_dir):
+        kind, src = job
+        src_path = src if os.path.isabs(src) else os.path.join(media_dir, src)
+        if not os.path.isfile(src_path):
+            print(f"Missing media file skipped: {src_path}", file=sys.stderr)
+            return None
+        return self.stores[kind].add(src_path)
+
+    def _write_chunk(self, source, chunk, media, state_ids, rows_done):
+        session = self.Session()
+        new_states = []
+        try:
+            # Take the write lock before reading the max ids: the GUI can save
+            # while an import runs, and no other writer may commit until this
+            # chunk does, so ids assigned up front can't collide and child
+            # rows can be inserted without reading generated keys back
+            session.execute(text("BEGIN IMMEDIATE"))
+            next_id = (session.query(func.max(FrogsToad.id)).scalar() or 0) + 1
+            species, images, audio_files, maps, links = [], [], [], [], []
+            next_state_id = (session.query(func.max(State.id)).scalar() or 0) + 1
+            # Pick up states the GUI added since the last chunk
+            state_ids.update(session.query(State.state_name, State.id))
+            for frog_toad_id, record in enumerate(chunk, start=next_id):
+                row = {field: record.get(field) or "" for field in PROFILE_FIELDS}
+                row["id"] = frog_toad_id
+                species.append(row)
+                # Each list de-duplicated: a file listed twice, or two copies of
+                # the same content, is one row; a state repeated is one link
+                for path in _stored_paths(media, "images", record.get("images")):
+                    images.append({"frog_toad_id": frog_toad_id, "image_path": path})
+                for path in _stored_paths(media, "audio", record.get("audio")):
+                    audio_files.append({"frog_toad_id": frog_toad_id, "audio_path": path})
+                if record.get("map") and media.get(("map", record["map"])):
+                    maps.append({"frog_toad_id": frog_toad_id, "map_path": media[("map", record["map"])]})
+                for state_name in dict.fromkeys(_as_list(record.get("states"))):
+                    if state_name not in state_ids:
+                        state_ids[state_name] = next_state_id
+                        new_states.append({"id": next_state_id, "state_name": state_name})
+                        next_state_id += 1
+                    links.append({"frog_toad_id": frog_toad_id, "state_id": state_ids[state_name]})
+
+            if new_states:
+                session.bulk_insert_mappings(State, new_states)
+            if species:
+                session.bulk_insert_mappings(FrogsToad, species)
+            if images:
+                session.bulk_insert_mappings(Image, images)
+            if audio_files:
+                session.bulk_insert_mappings(AudioFile, audio_files)
+            if maps:
+                session.bulk_insert_mappings(TerritoryMap, maps)
+            if links:
+                session.execute(frog_toad_states.insert(), links)
+            facets.sync_species(session, [row["id"] for row in species])
+            session.get(ImportCheckpoint, source).rows_done = rows_done
+            session.commit()
+        except Exception:
+            session.rollback()
+            # States created in this chunk were rolled back with it
+            for state in new_states:
+                state_ids.pop(state["state_name"], None)
+            raise
+        finally:
+            session.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import species catalogs (CSV, JSON Lines or JSON).")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--db", default="frogs_toads.db")
+    parser.add_argument("--media-dir", help="Base directory for relative media paths (default: the catalog's directory)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=MEDIA_WORKERS)
+    args = parser.parse_args()
+
+    from main import init_db
+
+    importer = CatalogImporter(init_db(args.db, profile="bulk"), args.media_dir, args.chunk_size, args.workers)
+    for catalog in args.files:
+        importer.run(catalog)
@@ -1,20 +1,156 @@
+import time
+
+# Taken before any other import so the startup breakdown includes them
+PROCESS_STARTED = time.perf_counter()
+
+import argparse
+import os
 import sys
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import diagnostics
+from db import DEFAULT_PROFILE, add_missing_columns, create_sqlite_engine
 from models import Base
-from views import FrogsMainWindow
-from PyQt5.QtWidgets import QApplication
+from ranges import init_ranges
+from search import init_search
+from snapshot import init_snapshot
+
+def init_db(db_path, profile=DEFAULT_PROFILE, **pragmas):
+    """Set up the database engine and create tables if they don’t exist.
 
-def init_db(db_path):
-    """Set up the database engine and create tables if they don’t exist."""
-    engine = create_engine(f"sqlite:///{db_path}")
+    ``profile`` names a PRAGMA set from ``db.SQLITE_PROFILES``; keyword
+    arguments override single PRAGMAs.
+    """
+    engine = create_sqlite_engine(db_path, profile, **pragmas)
+    # No-op unless diagnostics.enable() ran first
+    diagnostics.instrument(engine)
     Base.metadata.create_all(engine)
+    # create_all skips tables that already exist, so columns and indexes
+    # added to the models later still need creating on older database files
+    add_missing_columns(engine, Base.metadata)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    init_search(engine)
+    init_ranges(engine)
+    init_snapshot(engine)
     return engine
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    db_path = "frogs_toads.db"
-    engine = init_db(db_path)
-    window = FrogsMainWindow(engine=engine)
+def open_read_only(db_path, profile=DEFAULT_PROFILE, **pragmas):
+    """Engine for a database file that can't be written, e.g. a kiosk image.
+
+    ``init_db`` is skipped, since every step of it writes; the file must
+    already have been set up by this version of the app.
+    """
+    engine = create_sqlite_engine(db_path, profile, read_only=True, **pragmas)
+    diagnostics.instrument(engine)
+    return engine
+
+def create_application(argv):
+    """Create the QApplication so QtWebEngine can still be imported later.
+
+    QtWebEngineWidgets normally has to be imported before the application
+    exists; sharing OpenGL contexts lifts that, which is what lets the map
+    load on first use instead of at startup.
+    """
+    from PyQt5.QtCore import QCoreApplication, Qt
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication.instance()
+    if app is None:
+        QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+        app = QApplication(argv)
+    return app
+
+class StartupTimer:
+    """Wall-clock time of each startup phase, for --profile-startup."""
+
+    def __init__(self, started=PROCESS_STARTED):
+        self.started = self.last = started
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self.last) * 1000))
+        self.last = now
+
+    def report(self, out=sys.stderr):
+        for phase, ms in self.phases:
+            print(f"{phase:<24} {ms:9.1f} ms", file=out)
+        print(f"{'total':<24} {(self.last - self.started) * 1000:9.1f} ms", file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Frog & Toad Database")
+    parser.add_argument("--db", default="frogs_toads.db")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print how long each startup phase took, then keep running")
+    parser.add_argument("--map", choices=("web", "native"), default="web",
+                        help="Map widget: QtWebEngine, or QtSvg for low-memory machines")
+    parser.add_argument("--prewarm-map", action="store_true",
+                        help="Load the interactive map in the background after the window appears")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="Serve the species list from a memory-mapped snapshot file, "
+                             "updated from the database first if it is behind")
+    args, qt_args = parser.parse_known_args(argv)
+
+    timer = StartupTimer()
+    timer.mark("python imports")
+    app = create_application(sys.argv[:1] + qt_args)
+    # FROGS_DIAGNOSTICS=1 records query and UI timings; Ctrl+Shift+D shows them
+    if diagnostics.enable_from_environment():
+        from diagnostics_window import start_stall_detector
+        start_stall_detector()
+    timer.mark("qt application")
+    read_only = os.path.exists(args.db) and not os.access(args.db, os.W_OK)
+    engine = open_read_only(args.db) if read_only else init_db(args.db)
+    timer.mark("database")
+    catalog_snapshot = None
+    if args.snapshot:
+        from db import create_session_factory
+        from snapshot import open_snapshot
+        catalog_snapshot = open_snapshot(create_session_factory(engine), args.snapshot)
+        timer.mark("catalog snapshot")
+    from views import FrogsMainWindow
+    timer.mark("view imports")
+    window = FrogsMainWindow(engine=engine, map_mode=args.map, snapshot=catalog_snapshot, read_only=read_only)
+    timer.mark("main window")
     window.show()
-    sys.exit(app.exec_())
+
+    from PyQt5.QtCore import QTimer
+
+    # The report waits for the first paint and the first page of species,
+    # whichever comes last (and the map, when prewarming)
+    pending = {"first paint"}
+    # A snapshot's list is complete as soon as the window exists
+    if catalog_snapshot is None:
+        pending.add("first species page")
+    if args.prewarm_map:
+        pending.add("map prewarm")
+
+    def reached(phase):
+        timer.mark(phase)
+        pending.discard(phase)
+        if args.profile_startup and not pending:
+            timer.report()
+
+    def first_page(rows):
+        window.species_model.pageLoaded.disconnect(first_page)
+        reached("first species page")
+
+    # A zero timer fires once the events queued by show(), including the
+    # first paint, have been processed
+    def first_paint():
+        reached("first paint")
+        if args.prewarm_map:
+            window.prewarm_map().dataLoaded.connect(map_loaded)
+
+    # The map's data arrives asynchronously, after prewarm_map returns
+    def map_loaded():
+        window.map_view.dataLoaded.disconnect(map_loaded)
+        reached("map prewarm")
+
+    if catalog_snapshot is None:
+        window.species_model.pageLoaded.connect(first_page)
+    QTimer.singleShot(0, first_paint)
+    return app.exec_()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import json
+import os
+from PyQt5.QtCore import QUrl, pyqtSignal
+from PyQt5.QtWebEngineWidgets import QWebEngineView
+from PyQt5.QtWidgets import QWidget, QVBoxLayout
+
+import diagnostics
+
+# Imported on first use by FrogsMainWindow: loading QtWebEngine starts
+# Chromium's machinery, which is most of a cold start's cost
+
+# Species listed under a clicked state before the list is cut short
+RESULT_LIMIT = 1000
+
+# The page keeps the whole state -> species index client side. Python pushes
+# it once with frogMap.load() and keeps it current with frogMap.update();
+# hovering, shading and clicking never call back into Python.
+MAP_HTML = '''
+<html>
+<head>
+<style>
+body { background-color: #1E1E1E; color: white; margin: 0; font-family: sans-serif; display: flex; }
+#map { flex: 3; }
+#svgObject { width: 100%%; height: 560px; }
+#results { flex: 1; height: 560px; overflow-y: auto; background-color: #2D2D2D; border-left: 1px solid #555; padding: 6px; }
+#results h3 { margin: 4px 0; }
+#results ul { padding-left: 18px; margin: 4px 0; }
+#tooltip { position: fixed; display: none; pointer-events: none; background: #000C; padding: 4px 8px; border-radius: 4px; }
+</style>
+</head>
+<body>
+<div id="map"><object id="svgObject" type="image/svg+xml" data="us_map.svg"></object></div>
+<div id="results"><h3>Click a state</h3></div>
+<div id="tooltip"></div>
+<script>
+var RESULT_LIMIT = %(result_limit)d;
+var frogMap = (function() {
+    var names = {};       // species id -> name
+    var states = {};      // state name -> [species id, ...]
+    var paths = null;     // state name -> SVG path, once the SVG has loaded
+    var selected = null;
+    var tooltip = document.getElementById('tooltip');
+    var results = document.getElementById('results');
+
+    function count(state) {
+        return (states[state] || []).length;
+    }
+
+    // Linear shading from dark (no species) to green (the busiest state)
+    function shade() {
+        if (!paths) return;
+        var max = 1;
+        for (var state in states) max = Math.max(max, states[state].length);
+        for (var state in paths) {
+            var t = count(state) / max;
+            var r = Math.round(45 + t * (76 - 45));
+            var g = Math.round(45 + t * (175 - 45));
+            var b = Math.round(45 + t * (80 - 45));
+            paths[state].style.fill = 'rgb(' + r + ',' + g + ',' + b + ')';
+        }
+    }
+
+    function escape(text) {
+        var div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    function showResults(state) {
+        selected = state;
+        var ids = (states[state] || []).slice().sort(function(a, b) {
+            return names[a] < names[b] ? -1 : names[a] > names[b] ? 1 : 0;
+        });
+        var html = '<h3>' + escape(state) + ' (' + ids.length + ')</h3><ul>';
+        ids.slice(0, RESULT_LIMIT).forEach(function(id) {
+            html += '<li>' + escape(names[id]) + '</li>';
+        });
+        html += '</ul>';
+        if (ids.length > RESULT_LIMIT) html += '<p>and ' + (ids.length - RESULT_LIMIT) + ' more</p>';
+        results.innerHTML = html;
+    }
+
+    function attach(svgDoc) {
+        paths = {};
+        svgDoc.querySelectorAll('path').forEach(function(path) {
+            var state = path.id;
+            paths[state] = path;
+            path.style.stroke = '#1E1E1E';
+            path.addEventListener('mousemove', function(event) {
+                var box = svgObject.getBoundingClientRect();
+                tooltip.textContent = state + ': ' + count(state) + ' species';
+                tooltip.style.left = (box.left + event.clientX + 12) + 'px';
+                tooltip.style.top = (box.top + event.clientY + 12) + 'px';
+                tooltip.style.display = 'block';
+                path.style.stroke = '#FF4500';
+            });
+            path.addEventListener('mouseout', function() {
+                tooltip.style.display = 'none';
+                path.style.stroke = '#1E1E1E';
+            });
+            path.addEventListener('click', function() {
+                showResults(state);
+            });
+        });
+        shade();
+    }
+
+    var svgObject = document.getElementById('svgObject');
+    svgObject.addEventListener('load', function() {
+        attach(svgObject.contentDocument);
+    });
+
+    return {
+        // Replace everything: {"names": {id: name}, "states": {state: [id]}}
+        load: function(payload) {
+            names = payload.names;
+            states = payload.states;
+            shade();
+            if (selected) showResults(selected);
+        },
+        // One species changed: {"id", "name", "states": [...]}. A null
+        // name means it was deleted.
+        update: function(delta) {
+            var id = delta.id;
+            for (var state in states) {
+                var index = states[state].indexOf(id);
+                if (index >= 0) states[state].splice(index, 1);
+            }
+            if (delta.name === null) {
+                delete names[id];
+            } else {
+                names[id] = delta.name;
+                delta.states.forEach(function(state) {
+                    (states[state] = states[state] || []).push(id);
+                });
+            }
+            shade();
+            if (selected) showResults(selected);
+        }
+    };
+})();
+</script>
+</body>
+</html>
+'''
+
+class MapView(QWidget):
+    """U.S. map shaded by species count, built once and reused.
+
+    The state index is pushed to the page as one JSON payload the first
+    time the map is shown; after that ``species_changed`` sends a delta
+    for each saved species instead of reloading everything.
+    ``dataLoaded`` is emitted once the page has applied a full payload.
+    """
+
+    dataLoaded = pyqtSignal()
+
+    @diagnostics.timed("MapView.build")
+    def __init__(self, repository):
+        super().__init__()
+        self.repository = repository
+        self._page_loaded = False
+        # True until the page holds current data
+        self._stale = True
+        # A full payload has been requested and not yet pushed
+        self._loading = False
+        # (script, callback) pairs waiting for the page to finish loading
+        self._pending = []
+
+        self.setWindowTitle("Interactive U.S. Map")
+        self.resize(1000, 600)
+        self.setStyleSheet("background-color: #1E1E1E; color: white;")
+
+        layout = QVBoxLayout(self)
+
+        self.webview = QWebEngineView()
+        self.webview.loadFinished.connect(self.page_loaded)
+        self.webview.setHtml(MAP_HTML % {"result_limit": RESULT_LIMIT},
+                             QUrl.fromLocalFile(os.path.abspath('resources')))
+        layout.addWidget(self.webview)
+
+    def showEvent(self, event):
+        if self._stale:
+            self.refresh()
+        super().showEvent(event)
+
+    def refresh(self):
+        """Fetch the full state index and push it to the page."""
+        if self.repository:
+            self._stale = False
+            self._loading = True
+            self.repository.map_payload(self.push_payload, self.show_error)
+
+    @diagnostics.timed("MapView.populate")
+    def push_payload(self, payload):
+        self._loading = False
+        # Anything queued before this is older than the payload
+        self._pending = []
+        self.run_script(f"frogMap.load({payload});", lambda result: self.dataLoaded.emit())
+
+    def species_changed(self, frog_toad_id):
+        """Send the page one species' new name and states after a save."""
+        if not self.repository or self._stale:
+            return
+        if self._loading:
+            # The payload in flight may predate the save; the repository
+            # cancels it in favour of a fresh one
+            self.refresh()
+        else:
+            self.repository.species_states(frog_toad_id, self.push_delta, self.show_error)
+
+    def push_delta(self, row):
+        if row is None:
+            return
+        frog_toad_id, name, states = row
+        self.run_script(f"frogMap.update({json.dumps({'id': frog_toad_id, 'name': name, 'states': states})});")
+
+    def run_script(self, script, callback=None):
+        if self._page_loaded:
+            self._run(script, callback)
+        else:
+            self._pending.append((script, callback))
+
+    def _run(self, script, callback):
+        if callback is None:
+            self.webview.page().runJavaScript(script)
+        else:
+            self.webview.page().runJavaScript(script, callback)
+
+    def page_loaded(self, ok):
+        self._page_loaded = ok
+        if ok:
+            for script, callback in self._pending:
+                self._run(script, callback)
+            self._pending = []
+
+    def show_error(self, error):
+        # The next show tries again
+        self._stale = True
+        self._loading = False
+        print(error)
@@ -0,0 +1,290 @@
+import argparse
+import os
+import re
+import time
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QThreadPool, QTimer, pyqtSignal
+from sqlalchemy import delete, func, literal, select, union_all
+from sqlalchemy.dialects.sqlite import insert
+
+import workers
+from db import create_session_factory
+from media_store import hash_file
+from models import AudioFile, FrogsToad, Image, MediaStatus, TerritoryMap
+from workers import Worker
+
+STATUS_OK = "ok"
+STATUS_MISSING = "missing"
+STATUS_CORRUPT = "corrupt"
+# (kind, model, path column) for every table that references media
+MEDIA_COLUMNS = (
+    ("image", Image, Image.image_path),
+    ("audio", AudioFile, AudioFile.audio_path),
+    ("map", TerritoryMap, TerritoryMap.map_path),
+)
+# Paths checked and written per transaction
+CHECK_BATCH = 500
+# MediaStore names files after their SHA-256
+_DIGEST_NAME = re.compile(r"[0-9a-f]{64}")
+
+# Delay before the first full pass, so it doesn't compete with startup
+START_DELAY_MS = 3000
+# Directory events are collected this long before the paths in them are
+# re-checked; a copy or unpack fires many events for one directory
+DEBOUNCE_MS = 500
+# Full pass that catches what the watcher can't see: directories past the
+# watch limit, ones that did not exist when watching started, and files
+# rewritten in place (directory events only cover adds, removes, renames)
+RECHECK_MS = 30 * 60 * 1000
+# inotify watches are a per-user system resource; stay well inside the
+# usual default limit
+MAX_WATCHED_DIRS = 4096
+
+def referenced_paths(session):
+    paths = set()
+    for _, _, column in MEDIA_COLUMNS:
+        paths.update(path for path, in session.execute(select(column).distinct()) if path)
+    return paths
+
+def _expected_digest(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem if _DIGEST_NAME.fullmatch(stem) else None
+
+def check_paths(session, paths):
+    """Stat ``paths`` and bring their media_status rows up to date.
+
+    A file is hashed only when it is new to the table or its size or
+    mtime changed, and rows are only written when something moved, so a
+    pass over an unchanged library costs one stat per file. Commits per
+    batch; returns the number of rows whose status changed.
+    """
+    paths = sorted(paths)
+    changed = 0
+    for start in range(0, len(paths), CHECK_BATCH):
+        batch = paths[start:start + CHECK_BATCH]
+        # Plain rows rather than ORM objects: a full pass reads one per file
+        known = {row.path: row for row in session.execute(
+            select(MediaStatus.path, MediaStatus.status, MediaStatus.size, MediaStatus.mtime_ns, MediaStatus.sha256)
+            .where(MediaStatus.path.in_(batch)))}
+        rows = []
+        now = time.time()
+        for path in batch:
+            row = known.get(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is None:
+                if row and row.status == STATUS_MISSING:
+                    continue
+                values = {"status": STATUS_MISSING, "size": None, "mtime_ns": None,
+                          "sha256": row.sha256 if row else None}
+            elif row and row.size == stat.st_size and row.mtime_ns == stat.st_mtime_ns and row.sha256:
+                continue
+            else:
+                try:
+                    digest = hash_file(path)
+                except OSError:
+                    # Removed or unreadable between the stat and the read
+                    values = {"status": STATUS_MISSING, "size": None, "mtime_ns": None,
+                              "sha256": row.sha256 if row else None}
+                else:
+                    expected = _expected_digest(path)
+                    values = {"status": STATUS_CORRUPT if expected and expected != digest else STATUS_OK,
+                              "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+            if row is None or row.status != values["status"]:
+                changed += 1
+            rows.append({"path": path, "checked_at": now, **values})
+        if rows:
+            statement = insert(MediaStatus)
+            session.execute(statement.on_conflict_do_update(
+                index_elements=[MediaStatus.path],
+                set_={name: statement.excluded[name] for name in ("status", "size", "mtime_ns", "sha256", "checked_at")},
+            ), rows)
+        session.commit()
+    return changed
+
+def reconcile(session):
+    """Check every referenced path and forget paths nothing references.
+
+    Returns the referenced paths grouped by directory, which is what the
+    watcher needs.
+    """
+    paths = referenced_paths(session)
+    check_paths(session, paths)
+    stale = [path for path, in session.execute(select(MediaStatus.path)) if path not in paths]
+    for start in range(0, len(stale), CHECK_BATCH):
+        session.execute(delete(MediaStatus).where(MediaStatus.path.in_(stale[start:start + CHECK_BATCH])))
+    session.commit()
+    return group_by_directory(paths)
+
+def group_by_directory(paths):
+    """{absolute directory: {path, ...}}, the keys the watcher reports."""
+    relative = {}
+    for path in paths:
+        relative.setdefault(os.path.dirname(path), set()).add(path)
+    directories = {}
+    for directory, directory_paths in relative.items():
+        directories.setdefault(os.path.abspath(directory), set()).update(directory_paths)
+    return directories
+
+def species_paths(session, frog_toad_id):
+    paths = set()
+    for _, model, column in MEDIA_COLUMNS:
+        paths.update(path for path, in session.execute(
+            select(column).where(model.frog_toad_id == frog_toad_id)) if path)
+    return paths
+
+def _broken_rows():
+    return union_all(*(
+        select(literal(kind).label("kind"), model.id.label("media_id"), model.frog_toad_id,
+               column.label("path"), MediaStatus.status)
+        .join(MediaStatus, MediaStatus.path == column)
+        .where(MediaStatus.status != STATUS_OK)
+        for kind, model, column in MEDIA_COLUMNS
+    )).subquery()
+
+def broken_media(session, limit=None):
+    """Rows whose file is missing or corrupt, from the last check.
+
+    Returns ``(kind, media_id, frog_toad_id, species name, path, status)``
+    tuples ordered by species name. Reads media_status only, so it is
+    cheap however large the library is.
+    """
+    broken = _broken_rows()
+    query = (
+        select(broken.c.kind, broken.c.media_id, broken.c.frog_toad_id, FrogsToad.name,
+               broken.c.path, broken.c.status)
+        .join(FrogsToad, FrogsToad.id == broken.c.frog_toad_id)
+        .order_by(FrogsToad.name, broken.c.kind, broken.c.path)
+        .limit(limit)
+    )
+    return [tuple(row) for row in session.execute(query)]
+
+def broken_count(session):
+    return session.execute(select(func.count()).select_from(_broken_rows())).scalar()
+
+class MediaReconciler(QObject):
+    """Keeps media_status current in the background.
+
+    One full pass builds the directory -> paths index and checks every
+    file; after that ``QFileSystemWatcher`` events on those directories
+    re-check only the paths inside them. All file and database work runs
+    on a dedicated single-thread pool, so it never competes with more
+    than one query thread and never runs on the GUI thread.
+    """
+
+    brokenCountChanged = pyqtSignal(int)
+
+    def __init__(self, Session, parent=None):
+        super().__init__(parent)
+        self.Session = Session
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        # Absolute directory -> referenced paths inside it
+        self.directories = {}
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.directory_changed)
+        self._dirty = set()
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(DEBOUNCE_MS)
+        self._debounce.timeout.connect(self.check_dirty)
+        self._recheck = QTimer(self)
+        self._recheck.setInterval(RECHECK_MS)
+        self._recheck.timeout.connect(self.start)
+
+    def _submit(self, fn, *args, on_result=None):
+        def run():
+            session = self.Session()
+            try:
+                return fn(session, *args)
+            finally:
+                session.close()
+        worker = Worker(run)
+        if on_result:
+            worker.signals.finished.connect(on_result)
+        worker.signals.failed.connect(print)
+        workers.start(self.pool, worker)
+        return worker
+
+    def start(self):
+        """Run a full pass, then watch the directories it found."""
+        def full(session):
+            return reconcile(session), broken_count(session)
+        self._submit(full, on_result=self._apply_full)
+        self._recheck.start()
+
+    def _apply_full(self, result):
+        self.directories, count = result
+        self._update_watches()
+        self.brokenCountChanged.emit(count)
+
+    def _update_watches(self):
+        watched = set(self.watcher.directories())
+        wanted = [directory for directory in sorted(self.directories) if os.path.isdir(directory)]
+        wanted = set(wanted[:MAX_WATCHED_DIRS])
+        if watched - wanted:
+            self.watcher.removePaths(sorted(watched - wanted))
+        if wanted - watched:
+            self.watcher.addPaths(sorted(wanted - watched))
+
+    def directory_changed(self, directory):
+        self._dirty.add(directory)
+        self._debounce.start()
+
+    def check_dirty(self):
+        paths = set()
+        for directory in self._dirty:
+            paths.update(self.directories.get(directory, ()))
+        self._dirty = set()
+        if paths:
+            self._submit(self._check, paths, on_result=self._apply_check)
+
+    @staticmethod
+    def _check(session, paths):
+        check_paths(session, paths)
+        return paths, broken_count(session)
+
+    def _apply_check(self, result):
+        paths, count = result
+        for directory, directory_paths in group_by_directory(paths).items():
+            self.directories.setdefault(directory, set()).update(directory_paths)
+        # A deleted directory drops out of the watcher; a re-created one
+        # is picked up again here
+        self._update_watches()
+        self.brokenCountChanged.emit(count)
+
+    def species_changed(self, frog_toad_id):
+        """Check a saved species' media and watch any new directories."""
+        self._submit(lambda session: self._check(session, species_paths(session, frog_toad_id)),
+                     on_result=self._apply_check)
+
+    def broken_media(self, on_result, limit=None):
+        return self._submit(broken_media, limit, on_result=on_result)
+
+    def shutdown(self):
+        self._debounce.stop()
+        self._recheck.stop()
+        self.pool.clear()
+        self.pool.waitForDone()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check referenced media files and report broken ones.")
+    parser.add_argument("--db", default="frogs_toads.db")
+    parser.add_argument("--report-only", action="store_true", help="Report the last check without re-checking")
+    args = parser.parse_args()
+
+    from main import init_db
+
+    session = create_session_factory(init_db(args.db))()
+    try:
+        if not args.report_only:
+            directories = reconcile(session)
+            print(f"{sum(len(paths) for paths in directories.values())} file(s) checked")
+        rows = broken_media(session)
+        for kind, media_id, frog_toad_id, name, path, status in rows:
+            print(f"{status:8} {kind:6} {name} (#{frog_toad_id}): {path}")
+        print(f"{len(rows)} broken media reference(s)")
+    finally:
+        session.close()
@@ -0,0 +1,145 @@
+import argparse
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import func
+
+from db import create_session_factory, create_sqlite_engine
+from models import AudioFile, Image, TerritoryMap
+
+# Directories managed by the store, one per kind of media
+MEDIA_DIRS = ("data/images", "data/audio", "data/maps")
+# Read size for hashing; large enough for throughput, small enough for memory
+CHUNK_SIZE = 1024 * 1024
+# Files younger than this are never collected, so media copied in by an
+# EditView that has not been saved yet survives a concurrent collection
+GC_GRACE_SECONDS = 3600
+# Linux FICLONE ioctl: share extents copy-on-write (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+# SHA-256 of a file, read in fixed-size chunks so memory stays flat
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _reflink(src_path, dest_path):
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(src_path, "rb") as src, open(dest_path, "wb") as dest:
+        try:
+            fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(dest_path)
+    return False
+
+# Materialize src at dest as cheaply as the filesystem allows: a reflink,
+# then (if allowed) a hard link, then a plain copy.
+def _link_or_copy(src_path, dest_path, allow_hardlink=False):
+    if _reflink(src_path, dest_path):
+        return
+    if allow_hardlink:
+        try:
+            os.link(src_path, dest_path)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(src_path, dest_path)
+
+class MediaStore:
+    """Content-addressed file store rooted at one media directory.
+
+    Files are stored as ``<root>/ab/cd/<sha256><ext>``, so identical content
+    is kept once and no directory grows past a few hundred entries. Sources
+    are reflinked or copied: a hard link would share the source's inode, and
+    an in-place edit of the user's file would then silently change the
+    stored object. Only pass ``allow_hardlink=True`` for temporary files the
+    app wrote itself and deletes after adding.
+    """
+
+    def __init__(self, root, allow_hardlink=False):
+        self.root = root
+        self.allow_hardlink = allow_hardlink
+
+    def path_for(self, digest, ext):
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}{ext}")
+
+    def add(self, src_path):
+        """Store ``src_path`` and return its path inside the store."""
+        digest = hash_file(src_path)
+        ext = os.path.splitext(src_path)[1].lower()
+        dest_path = self.path_for(digest, ext)
+        if os.path.exists(dest_path):
+            return dest_path
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        # Build under a private name and rename into place, so concurrent
+        # adds of the same content can't observe or clobber a partial file
+        tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            _link_or_copy(src_path, tmp_path, self.allow_hardlink)
+            os.replace(tmp_path, dest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return dest_path
+
+# Number of rows referencing each stored path, across every media table
+def reference_counts(session):
+    counts = Counter()
+    for column in (Image.image_path, AudioFile.audio_path, AudioFile.preview_path, TerritoryMap.map_path):
+        for path, count in session.query(column, func.count()).group_by(column):
+            if path:
+                counts[os.path.normpath(path)] += count
+    return counts
+
+def collect_garbage(session, roots=MEDIA_DIRS, dry_run=False, grace_seconds=GC_GRACE_SECONDS):
+    """Delete media files under ``roots`` that no row references.
+
+    Returns the list of orphaned paths (removed unless ``dry_run``).
+    """
+    counts = reference_counts(session)
+    cutoff = time.time() - grace_seconds
+    orphans = []
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for dirpath, _, filenames in os.walk(root, topdown=False):
+            for filename in filenames:
+                path = os.path.normpath(os.path.join(dirpath, filename))
+                if counts[path] > 0:
+                    continue
+                stat = os.stat(path)
+                # ctime moves when a hard link is created, mtime may not
+                if max(stat.st_mtime, stat.st_ctime) > cutoff:
+                    continue
+                orphans.append(path)
+                if not dry_run:
+                    os.remove(path)
+            # Drop shard directories emptied by this pass
+            if not dry_run and dirpath != root and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+    return orphans
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove media files no species references.")
+    parser.add_argument("--db", default="frogs_toads.db")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    Session = create_session_factory(create_sqlite_engine(args.db))
+    session = Session()
+    orphans = collect_garbage(session, dry_run=args.dry_run)
+    session.close()
+    for path in orphans:
+        print(path)
+    print(f"{len(orphans)} orphaned file(s) {'found' if args.dry_run else 'removed'}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, LargeBinary, Table, UniqueConstraint
 from sqlalchemy.orm import declarative_base, relationship  # Updated import
 
 # Create the base class for all database models
@@ -9,15 +9,15 @@ Base = declarative_base()
 frog_toad_states = Table(
     'frog_toad_states',
     Base.metadata,
-    Column('frog_toad_id', Integer, ForeignKey('frogs_toads.id')),
-    Column('state_id', Integer, ForeignKey('states.id'))
+    Column('frog_toad_id', Integer, ForeignKey('frogs_toads.id'), index=True),
+    Column('state_id', Integer, ForeignKey('states.id'), index=True)
 )
 
 # Main entity for frog and toad species, storing all core profile data
 class FrogsToad(Base):
     __tablename__ = 'frogs_toads'
     id = Column(Integer, primary_key=True)
-    name = Column(String)
+    name = Column(String, index=True)
     breeding_season = Column(String)
     habitat = Column(String)
     diet = Column(String)
@@ -43,9 +43,9 @@ class Image(Base):
     # Unique identifier for each image
     id = Column(Integer, primary_key=True)
     # Links this image to a specific frog/toad species
-    frog_toad_id = Column(Integer, ForeignKey('frogs_toads.id'))
+    frog_toad_id = Column(Integer, ForeignKey('frogs_toads.id'), index=True)
     # Path to the image file on disk (e.g., "data/images/bullfrog1.jpg")
-    image_path = Column(String)
+    image_path = Column(String, index=True)
 
     # Relationship back to the FrogsToad entity
     frog_toad = relationship('FrogsToad', back_populates='images')
@@ -57,9 +57,16 @@ class AudioFile(Base):
     # Unique identifier for each audio file
     id = Column(Integer, primary_key=True)
     # Links this audio to a specific frog/toad species
-    frog_toad_id = Column(Integer, ForeignKey('frogs_toads.id'))
+    frog_toad_id = Column(Integer, ForeignKey('frogs_toads.id'), index=True)
     # Path to the audio file on disk (e.g., "data/audio/bullfrog_call.mp3")
-    audio_path = Column(String)
+    audio_path = Column(String, index=True)
+    # Filled in by audio_ingest.py; NULL for recordings stored before it
+    duration_ms = Column(Integer)
+    sample_rate = Column(Integer)
+    # RMS level of the original recording in dBFS
+    loudness = Column(Float)
+    # Short clip of the loudest stretch of the recording
+    preview_path = Column(String, index=True)
 
     # Relationship back to the FrogsToad entity
     frog_toad = relationship('FrogsToad', back_populates='audio_files')
@@ -71,9 +78,9 @@ class TerritoryMap(Base):
     # Unique identifier for each map
     id = Column(Integer, primary_key=True)
     # Links this map to a specific frog/toad species
-    frog_toad_id = Column(Integer, ForeignKey('frogs_toads.id'))
+    frog_toad_id = Column(Integer, ForeignKey('frogs_toads.id'), index=True)
     # Path to the map image on disk (e.g., "data/maps/bullfrog_range.jpg")
-    map_path = Column(String)
+    map_path = Column(String, index=True)
 
     # Relationship back to the FrogsToad entity
     frog_toad = relationship('FrogsToad', back_populates='territory_map')
@@ -85,7 +92,113 @@ class State(Base):
     # Unique identifier for each state
     id = Column(Integer, primary_key=True)
     # Name of the state (e.g., "California")
-    state_name = Column(String)
+    state_name = Column(String, index=True)
 
     # Many-to-many relationship back to FrogsToad
     frogs_toads = relationship('FrogsToad', secondary=frog_toad_states, back_populates='states')
+
+# Progress of a bulk catalog import, so an interrupted run can resume
+class ImportCheckpoint(Base):
+    __tablename__ = 'import_checkpoints'
+
+    # Absolute path of the imported file
+    source = Column(String, primary_key=True)
+    # Size and mtime of the file when the import started; a changed file
+    # restarts from the beginning instead of resuming
+    fingerprint = Column(String)
+    # Number of records already committed
+    rows_done = Column(Integer, default=0)
+
+# Acoustic fingerprint of one audio file, used for call similarity search
+class CallFingerprint(Base):
+    __tablename__ = 'call_fingerprints'
+
+    # The fingerprinted audio file; one fingerprint per file
+    audio_file_id = Column(Integer, ForeignKey('audio_files.id'), primary_key=True)
+    # Copied from the audio file so queries can rank species without a join
+    frog_toad_id = Column(Integer, ForeignKey('frogs_toads.id'), index=True)
+    # Feature vector as little-endian float16 bytes (see acoustics.py)
+    features = Column(LargeBinary)
+
+# One normalized value of a filterable profile attribute, e.g. habitat
+# "ponds" (see facets.py)
+class FacetValue(Base):
+    __tablename__ = 'facet_values'
+    __table_args__ = (UniqueConstraint('facet', 'value'),)
+
+    id = Column(Integer, primary_key=True)
+    # FrogsToad column the value came from, e.g. "habitat"
+    facet = Column(String, nullable=False)
+    # Lower-cased, trimmed value
+    value = Column(String, nullable=False)
+    # Number of species with this value, kept current by facets.sync_species;
+    # facets.value_counts serves unfiltered counts from it
+    species_count = Column(Integer, default=0, nullable=False)
+
+# Which species have which facet values
+species_facets = Table(
+    'species_facets',
+    Base.metadata,
+    Column('frog_toad_id', Integer, ForeignKey('frogs_toads.id'), primary_key=True),
+    Column('facet_value_id', Integer, ForeignKey('facet_values.id'), primary_key=True, index=True)
+)
+
+# Last known state of one referenced media file, kept current by the
+# media reconciler (see media_reconciler.py)
+class MediaStatus(Base):
+    __tablename__ = 'media_status'
+
+    # Path exactly as stored in images, audio_files or territory_maps
+    path = Column(String, primary_key=True)
+    # "ok", "missing", or "corrupt" when a content-addressed file no longer
+    # matches the digest in its name
+    status = Column(String, nullable=False, index=True)
+    # Size, mtime and SHA-256 when last seen; a file is only re-hashed when
+    # its size or mtime moves
+    size = Column(Integer)
+    mtime_ns = Column(Integer)
+    sha256 = Column(String)
+    # time.time() of the last check
+    checked_at = Column(Float)
+
+# One polygon (outer ring plus holes) of a species' range; a range made of
+# several parts has several rows. Bounding boxes are mirrored into an R*Tree
+# by triggers (see ranges.py).
+class SpeciesRange(Base):
+    __tablename__ = 'species_ranges'
+
+    id = Column(Integer, primary_key=True)
+    frog_toad_id = Column(Integer, ForeignKey('frogs_toads.id'), index=True)
+    # Bounding box in degrees
+    min_lon = Column(Float, nullable=False)
+    max_lon = Column(Float, nullable=False)
+    min_lat = Column(Float, nullable=False)
+    max_lat = Column(Float, nullable=False)
+    vertex_count = Column(Integer, nullable=False)
+    # Rings as packed little-endian lon/lat float64 pairs (ranges.encode_polygon)
+    geometry = Column(LargeBinary, nullable=False)
+
+# Catalog change counter (see snapshot.py). One row, bumped by triggers
+# whenever a species, its states or its media change
+class CatalogVersion(Base):
+    __tablename__ = 'catalog_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+# The catalog version at which each species last changed, so a snapshot
+# can re-read just the species changed since it was built
+class SpeciesVersion(Base):
+    __tablename__ = 'species_versions'
+    frog_toad_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, index=True)
+
+# Perceptual hash of one stored image file, for near-duplicate detection
+# (see image_hash.py)
+class ImageHash(Base):
+    __tablename__ = 'image_hashes'
+
+    id = Column(Integer, primary_key=True)
+    # Path exactly as stored in images.image_path
+    path = Column(String, nullable=False, unique=True)
+    # 64-bit dHash stored as a signed integer; NULL if the file couldn't be read
+    dhash = Column(Integer)
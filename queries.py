@@ -0,0 +1,195 @@
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import joinedload, selectinload
+
+import facets
+from models import AudioFile, CallFingerprint, FrogsToad, Image, State, TerritoryMap, frog_toad_states
+
+# Scalar profile columns, shared by the DTOs and the edit form
+PROFILE_FIELDS = (
+    "name", "breeding_season", "habitat", "diet",
+    "adult_size", "color_scheme", "profile_notes",
+)
+
+# Load a species together with everything ProfileView and EditView display.
+# The one-to-one territory map is joined into the main SELECT and each
+# collection costs a single extra IN query, so a profile is four queries
+# however many images, calls or states the species has.
+def load_profile(session, frog_toad_id):
+    return session.get(
+        FrogsToad,
+        frog_toad_id,
+        options=[
+            joinedload(FrogsToad.territory_map),
+            selectinload(FrogsToad.images),
+            selectinload(FrogsToad.audio_files),
+            selectinload(FrogsToad.states),
+        ],
+    )
+
+# One keyset page of (id, name) rows with ids greater than after_id
+def species_page(session, after_id, limit):
+    query = session.query(FrogsToad.id, FrogsToad.name)
+    if after_id is not None:
+        query = query.filter(FrogsToad.id > after_id)
+    return [tuple(row) for row in query.order_by(FrogsToad.id).limit(limit)]
+
+# (id, name, [state names]) for one species, or None if it no longer exists
+def species_states(session, frog_toad_id):
+    frog_toad = session.get(FrogsToad, frog_toad_id, options=[selectinload(FrogsToad.states)])
+    if frog_toad is None:
+        return None
+    return frog_toad.id, frog_toad.name, sorted(state.state_name for state in frog_toad.states)
+
+# (id, name) rows for a list of ids, in id order
+def species_names(session, frog_toad_ids):
+    rows = []
+    for start in range(0, len(frog_toad_ids), 500):
+        rows.extend(tuple(row) for row in session.query(FrogsToad.id, FrogsToad.name)
+                    .filter(FrogsToad.id.in_(frog_toad_ids[start:start + 500])).order_by(FrogsToad.id))
+    return rows
+
+def all_states(session):
+    return [tuple(row) for row in session.query(State.id, State.state_name).order_by(State.state_name)]
+
+@dataclass
+class ProfileChanges:
+    """The writes needed to turn a loaded profile into an edit form's state.
+
+    Media rows are matched by id: the form lists ``(id, path)`` pairs with
+    an id of None for files added in this edit.
+    """
+    fields: dict = field(default_factory=dict)
+    image_inserts: list = field(default_factory=list)
+    image_updates: dict = field(default_factory=dict)
+    image_deletes: list = field(default_factory=list)
+    audio_inserts: list = field(default_factory=list)
+    audio_updates: dict = field(default_factory=dict)
+    audio_deletes: list = field(default_factory=list)
+    # {audio_path: {column: value}} from audio_ingest for inserted or
+    # re-pointed recordings
+    audio_metadata: dict = field(default_factory=dict)
+    # New map path, or None to leave the map alone
+    map_path: Optional[str] = None
+    state_inserts: list = field(default_factory=list)
+    state_deletes: list = field(default_factory=list)
+
+    def __bool__(self):
+        return any(getattr(self, item.name) for item in fields(self))
+
+    @property
+    def touches_facets(self):
+        return any(name in self.fields for name in facets.FACETS) or bool(self.state_inserts or self.state_deletes)
+
+    @property
+    def touches_states(self):
+        # Name and state changes are what the state index and map show
+        return "name" in self.fields or bool(self.state_inserts or self.state_deletes)
+
+    @property
+    def touches_calls(self):
+        # Re-pointed and deleted recordings lose their call fingerprints
+        return bool(self.audio_updates or self.audio_deletes)
+
+def _media_changes(loaded, rows, path_attr):
+    before = {ref.id: getattr(ref, path_attr) for ref in loaded}
+    inserts = [path for media_id, path in rows if media_id is None]
+    updates = {media_id: path for media_id, path in rows
+               if media_id is not None and before.get(media_id, path) != path}
+    kept = {media_id for media_id, _ in rows}
+    deletes = [media_id for media_id in before if media_id not in kept]
+    return inserts, updates, deletes
+
+def profile_changes(profile, form):
+    """Compare a ``repository.SpeciesProfile`` (None for a new species) with a form.
+
+    ``form`` holds the PROFILE_FIELDS values plus ``images`` and
+    ``audio_files`` (lists of ``(id, path)``), ``map_path`` and ``states``
+    (a list of state ids). An empty ``map_path`` leaves the map as it is.
+    An optional ``audio_metadata`` maps ingested audio paths to their
+    AudioFile column values.
+    """
+    changes = ProfileChanges()
+    changes.fields = {name: form[name] for name in PROFILE_FIELDS
+                      if profile is None or getattr(profile, name) != form[name]}
+    changes.image_inserts, changes.image_updates, changes.image_deletes = _media_changes(
+        profile.images if profile else (), form["images"], "image_path")
+    changes.audio_inserts, changes.audio_updates, changes.audio_deletes = _media_changes(
+        profile.audio_files if profile else (), form["audio_files"], "audio_path")
+    metadata = form.get("audio_metadata", {})
+    changes.audio_metadata = {path: metadata[path] for path in changes.audio_inserts + list(changes.audio_updates.values())
+                              if path in metadata}
+    current_map = profile.territory_map.map_path if profile and profile.territory_map else None
+    if form["map_path"] and form["map_path"] != current_map:
+        changes.map_path = form["map_path"]
+    before = {state.id for state in profile.states} if profile else set()
+    after = set(form["states"])
+    changes.state_inserts = sorted(after - before)
+    changes.state_deletes = sorted(before - after)
+    return changes
+
+def _write_media(session, model, path_column, frog_toad_id, inserts, updates, deletes, metadata=None):
+    metadata = metadata or {}
+    if inserts:
+        # One executemany needs the same keys in every row
+        blank = dict.fromkeys({name for values in metadata.values() for name in values})
+        session.execute(insert(model), [{"frog_toad_id": frog_toad_id, path_column: path, **blank, **metadata.get(path, {})}
+                                        for path in inserts])
+    for media_id, path in updates.items():
+        session.execute(update(model).where(model.id == media_id).values({path_column: path, **metadata.get(path, {})}))
+    if deletes:
+        session.execute(delete(model).where(model.id.in_(deletes), model.frog_toad_id == frog_toad_id))
+
+def save_profile(session, frog_toad_id, changes):
+    """Apply a ``ProfileChanges`` in one transaction and commit.
+
+    Only the rows that differ are written: an UPDATE of the changed
+    columns, and INSERT/UPDATE/DELETE for individual media rows and state
+    links. A ``frog_toad_id`` of None inserts a new species. Returns the
+    ``(action, id, name)`` triple that ``EditView.saved`` reports.
+    """
+    if frog_toad_id is None:
+        action = "inserted"
+        frog_toad_id = session.execute(insert(FrogsToad).values(changes.fields)).inserted_primary_key[0]
+    else:
+        action = "renamed" if "name" in changes.fields else "updated"
+        if changes.fields:
+            session.execute(update(FrogsToad).where(FrogsToad.id == frog_toad_id).values(changes.fields))
+
+    _write_media(session, Image, "image_path", frog_toad_id,
+                 changes.image_inserts, changes.image_updates, changes.image_deletes)
+    if changes.touches_calls:
+        # Fingerprints describe the file a row pointed at when they were
+        # computed; acoustics.build_fingerprints redoes re-pointed rows
+        stale = changes.audio_deletes + list(changes.audio_updates)
+        session.execute(delete(CallFingerprint).where(CallFingerprint.audio_file_id.in_(stale)))
+    _write_media(session, AudioFile, "audio_path", frog_toad_id,
+                 changes.audio_inserts, changes.audio_updates, changes.audio_deletes, changes.audio_metadata)
+
+    if changes.map_path:
+        updated = session.execute(
+            update(TerritoryMap).where(TerritoryMap.frog_toad_id == frog_toad_id).values(map_path=changes.map_path)
+        ).rowcount
+        if not updated:
+            session.execute(insert(TerritoryMap).values(frog_toad_id=frog_toad_id, map_path=changes.map_path))
+
+    if changes.state_deletes:
+        session.execute(delete(frog_toad_states).where(
+            frog_toad_states.c.frog_toad_id == frog_toad_id,
+            frog_toad_states.c.state_id.in_(changes.state_deletes),
+        ))
+    if changes.state_inserts:
+        session.execute(insert(frog_toad_states), [
+            {"frog_toad_id": frog_toad_id, "state_id": state_id} for state_id in changes.state_inserts
+        ])
+
+    if action == "inserted" or any(name in changes.fields for name in facets.FACETS):
+        facets.sync_species(session, [frog_toad_id])
+
+    session.commit()
+    name = changes.fields.get("name")
+    if name is None:
+        name = session.execute(select(FrogsToad.name).where(FrogsToad.id == frog_toad_id)).scalar_one()
+    return action, frog_toad_id, name
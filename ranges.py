@@ -0,0 +1,335 @@
+import argparse
+import json
+import math
+
+import numpy as np
+from sqlalchemy import delete, insert, select, text
+
+from db import create_session_factory
+from models import FrogsToad, SpeciesRange
+from queries import species_names
+
+# R*Tree over species_ranges bounding boxes, kept in step by triggers
+RTREE_TABLE = "species_ranges_rtree"
+# Edge pairs compared per block when testing a range's edges against an
+# area's; bounds the temporary arrays whatever the polygons' sizes
+EDGE_PAIRS_PER_BLOCK = 1 << 20
+# Ranges written per transaction when loading GeoJSON
+WRITE_BATCH = 500
+
+# Spherical Albers equal-area conic with the USGS parameters for the
+# contiguous U.S.; used to georeference the map (see svg_map.py)
+ALBERS_PARALLELS = (29.5, 45.5)
+ALBERS_ORIGIN = (-96.0, 23.0)
+
+def init_ranges(engine):
+    """Create the R*Tree and its sync triggers if they don't exist.
+
+    A freshly created tree is filled from species_ranges, so databases that
+    already hold ranges are indexed on the next start.
+    """
+    columns = "min_lon, max_lon, min_lat, max_lat"
+    new_values = "new.id, new.min_lon, new.max_lon, new.min_lat, new.max_lat"
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": RTREE_TABLE},
+        ).first()
+        if not exists:
+            conn.exec_driver_sql(f"CREATE VIRTUAL TABLE {RTREE_TABLE} USING rtree(id, {columns})")
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_ai AFTER INSERT ON species_ranges "
+            f"BEGIN INSERT INTO {RTREE_TABLE}(id, {columns}) VALUES ({new_values}); END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_ad AFTER DELETE ON species_ranges "
+            f"BEGIN DELETE FROM {RTREE_TABLE} WHERE id = old.id; END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_au AFTER UPDATE ON species_ranges "
+            f"BEGIN DELETE FROM {RTREE_TABLE} WHERE id = old.id; "
+            f"INSERT INTO {RTREE_TABLE}(id, {columns}) VALUES ({new_values}); END"
+        )
+        if not exists:
+            conn.exec_driver_sql(f"INSERT INTO {RTREE_TABLE}(id, {columns}) SELECT id, {columns} FROM species_ranges")
+
+def encode_polygon(rings):
+    """Pack ``[[(lon, lat), ...], ...]`` (outer ring first) into bytes.
+
+    Layout: int32 ring count, int32 vertex count per ring, padding to 8
+    bytes, then every ring's float64 lon/lat pairs back to back.
+    """
+    rings = [np.asarray(ring, dtype="<f8").reshape(-1, 2) for ring in rings]
+    header = [len(rings)] + [len(ring) for ring in rings]
+    if len(header) % 2:
+        header.append(0)
+    return np.array(header, dtype="<i4").tobytes() + b"".join(ring.tobytes() for ring in rings)
+
+def _unpack(blob):
+    """``(ring sizes, (n, 2) coordinates)`` of an ``encode_polygon`` blob, without copying."""
+    count = int(np.frombuffer(blob, dtype="<i4", count=1)[0])
+    sizes = np.frombuffer(blob, dtype="<i4", count=count, offset=4)
+    offset = 4 * (count + 1 + (count + 1) % 2)
+    return sizes, np.frombuffer(blob, dtype="<f8", offset=offset).reshape(-1, 2)
+
+def decode_polygon(blob):
+    """The rings of an ``encode_polygon`` blob as (n, 2) arrays."""
+    sizes, coords = _unpack(blob)
+    return np.split(coords, np.cumsum(sizes)[:-1])
+
+def _part(rings):
+    rings = [np.asarray(ring, dtype=np.float64).reshape(-1, 2) for ring in rings]
+    return np.array([len(ring) for ring in rings]), np.concatenate(rings)
+
+def _range_row(frog_toad_id, rings):
+    outer = np.asarray(rings[0], dtype=np.float64).reshape(-1, 2)
+    return {
+        "frog_toad_id": frog_toad_id,
+        "min_lon": float(outer[:, 0].min()), "max_lon": float(outer[:, 0].max()),
+        "min_lat": float(outer[:, 1].min()), "max_lat": float(outer[:, 1].max()),
+        "vertex_count": sum(len(ring) for ring in rings),
+        "geometry": encode_polygon(rings),
+    }
+
+def set_species_ranges(session, frog_toad_id, polygons):
+    """Replace a species' range with ``polygons`` (lists of rings).
+
+    Runs in the caller's transaction; the caller commits.
+    """
+    session.execute(delete(SpeciesRange).where(SpeciesRange.frog_toad_id == frog_toad_id))
+    rows = [_range_row(frog_toad_id, rings) for rings in polygons if rings and len(rings[0]) >= 3]
+    if rows:
+        session.execute(insert(SpeciesRange), rows)
+
+def _flatten(parts):
+    """Join ``(sizes, coords)`` parts into one vertex array.
+
+    Returns the coordinates, the index of each vertex's successor on its
+    ring (so vertex i and next[i] form an edge, closing every ring) and
+    the part each vertex belongs to. Everything after this is array
+    arithmetic, with no Python loop over rings.
+    """
+    sizes = np.concatenate([part_sizes for part_sizes, _ in parts]).astype(np.int64)
+    coords = np.concatenate([part_coords for _, part_coords in parts])
+    owners = np.repeat(np.arange(len(parts)), [len(part_coords) for _, part_coords in parts])
+    ends = np.cumsum(sizes)
+    following = np.arange(1, len(coords) + 1)
+    rings = sizes > 0
+    following[ends[rings] - 1] = ends[rings] - sizes[rings]
+    return coords, following, owners
+
+def _containing(parts, lon, lat):
+    """Indexes of ``parts`` containing the point (even-odd, so holes are out)."""
+    if not parts:
+        return np.zeros(0, dtype=np.int64)
+    coords, following, owners = _flatten(parts)
+    above = coords[:, 1] > lat
+    # Only edges that straddle the point's latitude can cross its ray
+    edges = np.flatnonzero(above != above[following])
+    x1, y1 = coords[edges, 0], coords[edges, 1]
+    x2, y2 = coords[following[edges], 0], coords[following[edges], 1]
+    x_at = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+    crossings = np.bincount(owners[edges[lon < x_at]], minlength=len(parts))
+    return np.flatnonzero(crossings % 2 == 1)
+
+def polygons_containing(polygons, lon, lat):
+    """Indexes of ``polygons`` (lists of rings) that contain the point."""
+    return _containing([_part(rings) for rings in polygons], lon, lat)
+
+def _edges(part):
+    coords, following, _ = _flatten([part])
+    return coords[:, 0], coords[:, 1], coords[following, 0], coords[following, 1]
+
+def _segments_cross(ax1, ay1, ax2, ay2, bx1, by1, bx2, by2):
+    # Each a-segment against each b-segment: a as a column, b as a row
+    def orientation(px, py, qx, qy, rx, ry):
+        return np.sign((qx - px) * (ry - py) - (qy - py) * (rx - px))
+    ax1, ay1, ax2, ay2 = (values[:, None] for values in (ax1, ay1, ax2, ay2))
+    return (
+        (orientation(ax1, ay1, ax2, ay2, bx1, by1) != orientation(ax1, ay1, ax2, ay2, bx2, by2))
+        & (orientation(bx1, by1, bx2, by2, ax1, ay1) != orientation(bx1, by1, bx2, by2, ax2, ay2))
+    ).any(axis=1)
+
+def _overlapping(parts, area):
+    """Indexes of ``parts`` sharing any point with the ``area`` part.
+
+    Two polygons overlap when either has a vertex inside the other or
+    their edges cross; the crossing test only looks at a candidate's
+    edges inside the area's bounding box.
+    """
+    area_sizes, area_coords = area
+    found = set(_containing(parts, *area_coords[0]).tolist())
+    qx1, qy1, qx2, qy2 = _edges(area)
+    min_x, min_y = area_coords.min(axis=0)
+    max_x, max_y = area_coords.max(axis=0)
+    step = max(1, EDGE_PAIRS_PER_BLOCK // max(len(qx1), 1))
+    for index, part in enumerate(parts):
+        if index in found:
+            continue
+        if len(_containing([area], *part[1][0])):
+            found.add(index)
+            continue
+        x1, y1, x2, y2 = _edges(part)
+        near = ((np.maximum(x1, x2) >= min_x) & (np.minimum(x1, x2) <= max_x)
+                & (np.maximum(y1, y2) >= min_y) & (np.minimum(y1, y2) <= max_y))
+        x1, y1, x2, y2 = x1[near], y1[near], x2[near], y2[near]
+        for start in range(0, len(x1), step):
+            block = slice(start, start + step)
+            if _segments_cross(x1[block], y1[block], x2[block], y2[block], qx1, qy1, qx2, qy2).any():
+                found.add(index)
+                break
+    return sorted(found)
+
+def polygons_overlapping(polygons, area):
+    """Indexes of ``polygons`` that share any point with the ``area`` polygon."""
+    return _overlapping([_part(rings) for rings in polygons], _part(area))
+
+def _candidates(session, where, params):
+    rows = session.execute(text(
+        f"SELECT r.frog_toad_id, r.geometry FROM {RTREE_TABLE} AS t "
+        f"JOIN species_ranges AS r ON r.id = t.id WHERE {where}"
+    ), params).all()
+    return [frog_toad_id for frog_toad_id, _ in rows], [_unpack(geometry) for _, geometry in rows]
+
+def _named(session, frog_toad_ids):
+    rows = species_names(session, sorted(frog_toad_ids))
+    return sorted(rows, key=lambda row: (row[1] or "", row[0]))
+
+def species_at(session, lon, lat):
+    """``(id, name)`` of species whose range contains the point, by name.
+
+    The R*Tree narrows the search to ranges whose box holds the point;
+    those are tested exactly in one vectorized pass.
+    """
+    owners, parts = _candidates(
+        session, "t.min_lon <= :lon AND t.max_lon >= :lon AND t.min_lat <= :lat AND t.max_lat >= :lat",
+        {"lon": lon, "lat": lat},
+    )
+    return _named(session, {owners[index] for index in _containing(parts, lon, lat)})
+
+def species_in_area(session, area):
+    """``(id, name)`` of species whose range overlaps the ``area`` polygon
+    (a list of rings, e.g. a county boundary), by name."""
+    area = _part(area)
+    (min_lon, min_lat), (max_lon, max_lat) = area[1].min(axis=0), area[1].max(axis=0)
+    owners, parts = _candidates(
+        session, "t.max_lon >= :min_lon AND t.min_lon <= :max_lon AND t.max_lat >= :min_lat AND t.min_lat <= :max_lat",
+        {"min_lon": min_lon, "max_lon": max_lon, "min_lat": min_lat, "max_lat": max_lat},
+    )
+    return _named(session, {owners[index] for index in _overlapping(parts, area)})
+
+def geojson_polygons(geometry):
+    """Polygons (lists of rings) from a GeoJSON Polygon or MultiPolygon."""
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return list(geometry["coordinates"])
+    return []
+
+def load_geojson(session, path, key="frog_toad_id"):
+    """Replace ranges from a GeoJSON FeatureCollection.
+
+    Each feature's ``key`` property names its species, by id or, with
+    ``key="name"``, by species name. Features naming no species in the
+    catalog are counted as unmatched. Returns ``(species, polygons,
+    unmatched)`` counts; commits per batch of species.
+    """
+    with open(path, encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    by_species = {}
+    unmatched = 0
+    # Checked up front: an unknown id would fail the foreign key halfway
+    # through, after earlier batches were committed
+    if key == "name":
+        lookup = dict(session.execute(select(FrogsToad.name, FrogsToad.id)))
+    else:
+        lookup = {frog_toad_id: frog_toad_id for frog_toad_id in session.execute(select(FrogsToad.id)).scalars()}
+    for feature in features:
+        value = (feature.get("properties") or {}).get(key)
+        if key != "name":
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                value = None
+        frog_toad_id = lookup.get(value)
+        if frog_toad_id is None:
+            unmatched += 1
+            continue
+        by_species.setdefault(frog_toad_id, []).extend(geojson_polygons(feature.get("geometry")))
+    polygons = 0
+    for count, (frog_toad_id, species_polygons) in enumerate(by_species.items(), start=1):
+        set_species_ranges(session, frog_toad_id, species_polygons)
+        polygons += len(species_polygons)
+        if count % WRITE_BATCH == 0:
+            session.commit()
+    session.commit()
+    return len(by_species), polygons, unmatched
+
+def _albers_constants():
+    phi1, phi2 = (math.radians(parallel) for parallel in ALBERS_PARALLELS)
+    lon0, lat0 = (math.radians(value) for value in ALBERS_ORIGIN)
+    n = (math.sin(phi1) + math.sin(phi2)) / 2
+    c = math.cos(phi1) ** 2 + 2 * n * math.sin(phi1)
+    rho0 = math.sqrt(c - 2 * n * math.sin(lat0)) / n
+    return n, c, rho0, lon0
+
+def albers(lon, lat):
+    """Project degrees to Albers x, y (unit sphere); accepts arrays."""
+    n, c, rho0, lon0 = _albers_constants()
+    rho = np.sqrt(c - 2 * n * np.sin(np.radians(lat))) / n
+    theta = n * (np.radians(lon) - lon0)
+    return rho * np.sin(theta), rho0 - rho * np.cos(theta)
+
+def albers_inverse(x, y):
+    n, c, rho0, lon0 = _albers_constants()
+    rho = np.hypot(x, rho0 - y)
+    theta = np.arctan2(x, rho0 - y)
+    lat = np.arcsin(np.clip((c - (rho * n) ** 2) / (2 * n), -1.0, 1.0))
+    return np.degrees(lon0 + theta / n), np.degrees(lat)
+
+def fit_affine(source, target):
+    """Least-squares 2x3 affine matrix taking ``source`` points onto ``target``."""
+    source = np.asarray(source, dtype=np.float64)
+    design = np.column_stack([source, np.ones(len(source))])
+    matrix, *_ = np.linalg.lstsq(design, np.asarray(target, dtype=np.float64), rcond=None)
+    return matrix.T
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Species range polygons.")
+    parser.add_argument("--db", default="frogs_toads.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load_parser = commands.add_parser("load", help="Replace ranges from a GeoJSON FeatureCollection")
+    load_parser.add_argument("geojson")
+    load_parser.add_argument("--key", default="frog_toad_id", help="Feature property naming the species (frog_toad_id or name)")
+    at_parser = commands.add_parser("at", help="Species whose range contains a point")
+    at_parser.add_argument("lon", type=float)
+    at_parser.add_argument("lat", type=float)
+    area_parser = commands.add_parser("in", help="Species whose range overlaps a GeoJSON polygon, e.g. a county")
+    area_parser.add_argument("geojson")
+    args = parser.parse_args()
+
+    from main import init_db
+
+    session = create_session_factory(init_db(args.db))()
+    try:
+        if args.command == "load":
+            species, polygons, unmatched = load_geojson(session, args.geojson, args.key)
+            print(f"{polygons} polygon(s) for {species} species loaded, {unmatched} feature(s) unmatched")
+        else:
+            if args.command == "at":
+                rows = species_at(session, args.lon, args.lat)
+            else:
+                with open(args.geojson, encoding="utf-8") as f:
+                    data = json.load(f)
+                feature = data["features"][0] if data.get("type") == "FeatureCollection" else data
+                rows = []
+                for area in geojson_polygons(feature.get("geometry", feature)):
+                    rows.extend(species_in_area(session, area))
+                rows = sorted(set(rows), key=lambda row: (row[1] or "", row[0]))
+            for frog_toad_id, name in rows:
+                print(f"{name} (#{frog_toad_id})")
+            print(f"{len(rows)} species")
+    finally:
+        session.close()
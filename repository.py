@@ -0,0 +1,252 @@
+import json
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from PyQt5.QtCore import QObject, QThreadPool
+
+import image_hash
+import queries
+import ranges
+from facets import FacetIndex
+from search import search_species
+from state_index import StateSpeciesIndex
+from utils import copy_file_to_dir
+import workers
+from workers import Worker
+
+# Threads for database work. SQLite serializes writers anyway; a few
+# readers keep a slow query from holding up list paging or map clicks.
+MAX_QUERY_THREADS = 4
+
+# Plain snapshots of database rows handed to the GUI thread. Attribute names
+# mirror the ORM models so views read them the same way.
+@dataclass(frozen=True)
+class ImageRef:
+    id: int
+    image_path: str
+
+@dataclass(frozen=True)
+class AudioRef:
+    id: int
+    audio_path: str
+    # None until audio_ingest has measured the recording
+    duration_ms: Optional[int] = None
+    preview_path: Optional[str] = None
+
+@dataclass(frozen=True)
+class MapRef:
+    id: int
+    map_path: str
+
+@dataclass(frozen=True)
+class StateRef:
+    id: int
+    state_name: str
+
+@dataclass(frozen=True)
+class SpeciesProfile:
+    id: int
+    name: str
+    breeding_season: str
+    habitat: str
+    diet: str
+    adult_size: str
+    color_scheme: str
+    profile_notes: str
+    images: Tuple[ImageRef, ...]
+    audio_files: Tuple[AudioRef, ...]
+    territory_map: Optional[MapRef]
+    states: Tuple[StateRef, ...]
+
+def profile_from_row(frog_toad):
+    territory_map = frog_toad.territory_map
+    return SpeciesProfile(
+        images=tuple(ImageRef(image.id, image.image_path) for image in frog_toad.images),
+        audio_files=tuple(AudioRef(audio.id, audio.audio_path, audio.duration_ms, audio.preview_path)
+                          for audio in frog_toad.audio_files),
+        territory_map=MapRef(territory_map.id, territory_map.map_path) if territory_map else None,
+        states=tuple(StateRef(state.id, state.state_name) for state in frog_toad.states),
+        id=frog_toad.id,
+        **{field: getattr(frog_toad, field) for field in queries.PROFILE_FIELDS},
+    )
+
+def _load_profile(session, frog_toad_id):
+    frog_toad = queries.load_profile(session, frog_toad_id)
+    return profile_from_row(frog_toad) if frog_toad else None
+
+class CatalogRepository(QObject):
+    """Runs catalog queries on a thread pool and hands back DTOs.
+
+    Every call takes ``on_result`` (and optionally ``on_error``) callbacks,
+    which run on the GUI thread, and returns the queued ``Worker``. Calls
+    made with a ``channel`` supersede the previous call on that channel: the
+    older one is pulled from the queue or, if already running, its result is
+    discarded. Views use this so that clicking a different species or state
+    never shows a stale answer.
+    """
+
+    def __init__(self, Session, max_threads=MAX_QUERY_THREADS, parent=None):
+        super().__init__(parent)
+        self.Session = Session
+        self.state_index = StateSpeciesIndex(Session)
+        self.facet_index = FacetIndex(Session)
+        self.image_index = image_hash.ImageHashIndex(Session)
+        self._call_index = None
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self._latest = {}
+
+    @property
+    def call_index(self):
+        # acoustics pulls in pydub; load it on the first call search
+        if self._call_index is None:
+            import acoustics
+            self._call_index = acoustics.CallIndex(self.Session)
+        return self._call_index
+
+    def _in_session(self, fn, *args):
+        session = self.Session()
+        try:
+            return fn(session, *args)
+        finally:
+            session.close()
+
+    def submit(self, fn, *args, on_result=None, on_error=None, channel=None):
+        worker = Worker(fn, *args)
+        if channel is not None:
+            self.cancel(channel)
+            self._latest[channel] = worker
+
+        # Checked again on the GUI thread: a cancel can land after the
+        # worker emitted but before its queued signal is delivered
+        def deliver(result):
+            if worker.cancelled:
+                return
+            if channel is not None and self._latest.get(channel) is worker:
+                del self._latest[channel]
+            if on_result:
+                on_result(result)
+
+        def fail(error):
+            if worker.cancelled:
+                return
+            if channel is not None and self._latest.get(channel) is worker:
+                del self._latest[channel]
+            (on_error or print)(error)
+
+        worker.signals.finished.connect(deliver)
+        worker.signals.failed.connect(fail)
+        workers.start(self.pool, worker)
+        return worker
+
+    def shutdown(self):
+        """Drop queued work and wait for running queries to finish.
+
+        Call before the repository is destroyed: QThreadPool's destructor
+        waits for its threads while holding the GIL, which deadlocks with a
+        worker that still needs it to deliver its result.
+        """
+        self.pool.clear()
+        self.pool.waitForDone()
+
+    def cancel(self, channel):
+        worker = self._latest.pop(channel, None)
+        if worker is not None:
+            worker.cancel()
+            workers.take(self.pool, worker)
+
+    def species_page(self, after_id, limit, on_result, on_error=None):
+        return self.submit(self._in_session, queries.species_page, after_id, limit,
+                           on_result=on_result, on_error=on_error)
+
+    def profile(self, frog_toad_id, on_result, on_error=None, channel="profile"):
+        return self.submit(self._in_session, _load_profile, frog_toad_id,
+                           on_result=on_result, on_error=on_error, channel=channel)
+
+    def states(self, on_result, on_error=None):
+        return self.submit(self._in_session, queries.all_states,
+                           on_result=on_result, on_error=on_error)
+
+    def search(self, query_text, on_result, on_error=None):
+        return self.submit(self._in_session, search_species, query_text,
+                           on_result=on_result, on_error=on_error, channel="search")
+
+    def species_for_state(self, state_name, on_result, on_error=None):
+        return self.submit(self.state_index.species_for, state_name,
+                           on_result=on_result, on_error=on_error, channel="state")
+
+    def warm_state_index(self):
+        return self.submit(self.state_index.ensure_built)
+
+    # Serialized on the worker too: for a large catalog encoding the JSON
+    # costs as much as building the index
+    def map_payload(self, on_result, on_error=None):
+        return self.submit(lambda: json.dumps(self.state_index.payload()),
+                           on_result=on_result, on_error=on_error, channel="map")
+
+    def state_counts(self, on_result, on_error=None):
+        return self.submit(self.state_index.counts,
+                           on_result=on_result, on_error=on_error, channel="map")
+
+    def facet_filter(self, selected, on_result, on_error=None):
+        """Counts and matches for ``{facet: [values]}``: ``(counts, total, rows)``."""
+        def run(session):
+            counts, total, ids = self.facet_index.query(selected)
+            return counts, total, queries.species_names(session, ids)
+        return self.submit(self._in_session, run, on_result=on_result, on_error=on_error, channel="facets")
+
+    def species_at_point(self, lon, lat, on_result, on_error=None):
+        """Species whose range polygons contain the point, by name."""
+        return self.submit(self._in_session, ranges.species_at, lon, lat,
+                           on_result=on_result, on_error=on_error, channel="range")
+
+    def similar_calls(self, file_path, on_result, on_error=None, top_k=10):
+        """Species ranked by how closely their calls match a recording: [(id, name, score)]."""
+        return self.submit(self.call_index.query_file, file_path, top_k,
+                           on_result=on_result, on_error=on_error, channel="calls")
+
+    def ingest_audio(self, file_path, on_result, on_error=None):
+        """Transcode, measure and preview a recording: ``audio_ingest.ingest_file``'s dict.
+
+        Runs in the ingest process pool, not on a query thread, so a long
+        recording never holds up lists, searches or the map.
+        """
+        # pydub and numpy load on the first recording added
+        import audio_ingest
+        return workers.watch(audio_ingest.executor().submit(audio_ingest.ingest_file, file_path),
+                             on_result, on_error)
+
+    def add_image(self, file_path, dest_dir, on_result, on_error=None):
+        """Store an image and look for near-duplicates: ``(path, image_hash.describe rows)``."""
+        def run(session):
+            path = copy_file_to_dir(file_path, dest_dir)
+            return path, image_hash.check_image(session, self.image_index, path)
+        return self.submit(self._in_session, run, on_result=on_result, on_error=on_error)
+
+    # One small batch per job, resubmitted until none are left, so hashing
+    # a large library never holds a query thread for long
+    def hash_images(self):
+        """Hash library images that have no perceptual hash yet."""
+        def next_batch(done):
+            if done:
+                self.hash_images()
+        return self.submit(self._in_session, image_hash.hash_missing, image_hash.HASH_BATCH, 1, self.image_index,
+                           on_result=next_batch)
+
+    def species_states(self, frog_toad_id, on_result, on_error=None):
+        return self.submit(self._in_session, queries.species_states, frog_toad_id,
+                           on_result=on_result, on_error=on_error)
+
+    def save_profile(self, frog_toad_id, changes, on_result, on_error=None):
+        """Apply a ``queries.ProfileChanges`` built by ``queries.profile_changes``."""
+        def save(session):
+            change = queries.save_profile(session, frog_toad_id, changes)
+            # Only names and state links feed the state index
+            if frog_toad_id is None or changes.touches_states:
+                self.state_index.invalidate()
+            if frog_toad_id is None or changes.touches_facets:
+                self.facet_index.refresh_species(change[1])
+            if changes.touches_calls and self._call_index is not None:
+                self._call_index.invalidate()
+            return change
+        return self.submit(self._in_session, save, on_result=on_result, on_error=on_error)
@@ -0,0 +1,80 @@
+import re
+
+from sqlalchemy import text
+
+# External-content FTS5 index over the text columns of frogs_toads. The
+# index stores only tokens; column values are read back from frogs_toads.
+FTS_TABLE = "frogs_toads_fts"
+FTS_COLUMNS = (
+    "name", "breeding_season", "habitat", "diet",
+    "adult_size", "color_scheme", "profile_notes",
+)
+# bm25 weight per column, in FTS_COLUMNS order, so name hits rank first
+FTS_WEIGHTS = (10.0, 2.0, 2.0, 2.0, 1.0, 2.0, 1.0)
+
+# Queries shorter than this match too much of the catalog to be useful
+MIN_QUERY_LENGTH = 2
+SEARCH_LIMIT = 200
+
+def init_search(engine):
+    """Create the FTS5 table and its sync triggers if they don't exist.
+
+    A freshly created index is rebuilt from frogs_toads so databases that
+    predate search become searchable on the next start.
+    """
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"new.{column}" for column in FTS_COLUMNS)
+    old_values = ", ".join(f"old.{column}" for column in FTS_COLUMNS)
+    delete_old = (
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old_values});"
+    )
+    insert_new = f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});"
+
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE},
+        ).first()
+        if not exists:
+            # prefix='2 3' keeps short prefix queries off the full-scan path
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({columns}, "
+                f"content='frogs_toads', content_rowid='id', prefix='2 3', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON frogs_toads "
+            f"BEGIN {insert_new} END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON frogs_toads "
+            f"BEGIN {delete_old} END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON frogs_toads "
+            f"BEGIN {delete_old} {insert_new} END"
+        )
+        if not exists:
+            conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+# Turn free text into an FTS5 query where every word must match as a prefix.
+# Words are quoted so user input can never be parsed as FTS5 syntax.
+def build_match_query(query_text):
+    terms = re.findall(r"\w+", query_text)
+    return " ".join(f'"{term}"*' for term in terms)
+
+# Up to `limit` (id, name) rows matching query_text, best bm25 score first
+def search_species(session, query_text, limit=SEARCH_LIMIT):
+    match = build_match_query(query_text)
+    if len(query_text.strip()) < MIN_QUERY_LENGTH or not match:
+        return []
+    weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+    rows = session.execute(
+        text(
+            f"SELECT rowid, name FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT :limit"
+        ),
+        {"match": match, "limit": limit},
+    )
+    return [tuple(row) for row in rows]
@@ -0,0 +1,473 @@
+import argparse
+import bisect
+import json
+import mimetypes
+import os
+import re
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from sqlalchemy import exists, or_, select
+
+import queries
+from db import create_session_factory, create_sqlite_engine
+from models import AudioFile, Image, TerritoryMap
+from snapshot import catalog_version
+from state_index import StateSpeciesIndex
+
+DEFAULT_PORT = 8080
+# Worker processes; each serves its connections on threads
+WORKERS = os.cpu_count() or 2
+# Rows per page of a species list, unless ?limit= asks for fewer or more
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# The change counter is re-read at most this often per process, so a save
+# in the desktop app is visible to clients within this many seconds
+VERSION_CHECK_SECONDS = 0.1
+# Per-process response cache: whichever limit is reached first
+CACHE_ENTRIES = 4096
+CACHE_BYTES = 64 * 1024 * 1024
+# MediaStore names files after their SHA-256, so their content never changes
+_DIGEST_NAME = re.compile(r"[0-9a-f]{64}")
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+# SQLite integers are signed 64-bit; larger ids can't be bound, let alone exist
+MAX_ID = 2 ** 63 - 1
+
+# Workers read through their own connections with query_only set; the
+# file is opened read-only too (see create_engine)
+SERVER_PROFILE = {
+    "cache_size": -32 * 1024,
+    # Pages mapped from the file are shared between worker processes
+    # through the OS page cache instead of copied into each one
+    "mmap_size": 1024 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "query_only": "ON",
+    "busy_timeout": 5000,
+}
+
+def create_engine(db_path):
+    """Read-only engine for one worker process."""
+    return create_sqlite_engine(db_path, "small", read_only=True, **SERVER_PROFILE)
+
+class ResponseCache:
+    """LRU of encoded response bodies, tagged with the catalog version.
+
+    A body is only served for the version it was built at, so nothing
+    needs invalidating entry by entry when the catalog changes.
+    """
+
+    def __init__(self, max_entries=CACHE_ENTRIES, max_bytes=CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, body):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (version, body)
+            self._bytes += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+class NotFound(Exception):
+    pass
+
+class BadRequest(Exception):
+    pass
+
+class Catalog:
+    """One worker process's database access, caches and JSON builders."""
+
+    def __init__(self, db_path, media_root="."):
+        self.engine = create_engine(db_path)
+        self.Session = create_session_factory(self.engine)
+        self.media_root = media_root
+        self.state_index = StateSpeciesIndex(self.Session)
+        self.cache = ResponseCache()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked = 0.0
+
+    def version(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked >= VERSION_CHECK_SECONDS:
+                session = self.Session()
+                try:
+                    version = catalog_version(session)
+                finally:
+                    session.close()
+                self._checked = now
+                if version != self._version:
+                    self._version = version
+                    self.state_index.invalidate()
+                    self.cache.clear()
+            return self._version
+
+    @staticmethod
+    def media_url(path):
+        return f"/media/{quote(path)}" if path else None
+
+    def species_page(self, query):
+        after = _int_param(query, "after")
+        limit = min(max(_int_param(query, "limit", PAGE_SIZE), 1), MAX_PAGE_SIZE)
+        session = self.Session()
+        try:
+            rows = queries.species_page(session, after, limit)
+        finally:
+            session.close()
+        return _page([{"id": frog_toad_id, "name": name} for frog_toad_id, name in rows], "/species", limit)
+
+    def profile(self, frog_toad_id):
+        session = self.Session()
+        try:
+            frog_toad = queries.load_profile(session, frog_toad_id)
+            if frog_toad is None:
+                raise NotFound(f"no species {frog_toad_id}")
+            territory_map = frog_toad.territory_map
+            return {
+                "id": frog_toad.id,
+                **{field: getattr(frog_toad, field) for field in queries.PROFILE_FIELDS},
+                "images": [{"id": image.id, "url": self.media_url(image.image_path)} for image in frog_toad.images],
+                "audio": [
+                    {"id": audio.id, "url": self.media_url(audio.audio_path), "duration_ms": audio.duration_ms,
+                     "preview_url": self.media_url(audio.preview_path)}
+                    for audio in frog_toad.audio_files
+                ],
+                "map": {"id": territory_map.id, "url": self.media_url(territory_map.map_path)} if territory_map else None,
+                "states": sorted(state.state_name for state in frog_toad.states),
+            }
+        finally:
+            session.close()
+
+    def states(self):
+        session = self.Session()
+        try:
+            rows = queries.all_states(session)
+        finally:
+            session.close()
+        counts = self.state_index.counts()
+        return {"states": [{"id": state_id, "name": name, "species": counts.get(name, 0),
+                            "url": f"/states/{quote(name)}/species"} for state_id, name in rows]}
+
+    def state_species(self, state_name, query):
+        if state_name not in self.state_index.counts():
+            raise NotFound(f"no species recorded in {state_name}")
+        # The index lists each state's species in id order, so a page is
+        # a bisect and a slice
+        species = self.state_index.species_for(state_name)
+        after = _int_param(query, "after")
+        limit = min(max(_int_param(query, "limit", PAGE_SIZE), 1), MAX_PAGE_SIZE)
+        start = 0 if after is None else bisect.bisect_right(species, after, key=lambda row: row[0])
+        rows = species[start:start + limit]
+        return _page([{"id": frog_toad_id, "name": name} for frog_toad_id, name in rows],
+                     f"/states/{quote(state_name)}/species", limit)
+
+    def media_file(self, path):
+        """Filesystem path for a media URL, if a row references it."""
+        session = self.Session()
+        try:
+            referenced = session.execute(select(or_(
+                exists().where(Image.image_path == path),
+                exists().where(AudioFile.audio_path == path),
+                exists().where(AudioFile.preview_path == path),
+                exists().where(TerritoryMap.map_path == path),
+            ))).scalar()
+        finally:
+            session.close()
+        if not referenced:
+            raise NotFound(path)
+        return os.path.join(self.media_root, path)
+
+def _int_param(query, name, default=None):
+    values = query.get(name)
+    if not values or not values[0]:
+        return default
+    try:
+        value = int(values[0])
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer")
+    if abs(value) > MAX_ID:
+        raise BadRequest(f"{name} is out of range")
+    return value
+
+def _page(items, base_url, limit):
+    # A full page may have more after it; the next link carries the cursor
+    next_url = f"{base_url}?after={items[-1]['id']}&limit={limit}" if len(items) == limit else None
+    return {"items": items, "next": next_url}
+
+class CatalogHandler(BaseHTTPRequestHandler):
+    """Routes GET and HEAD requests to the process's ``Catalog``.
+
+    JSON responses carry the catalog version as their ETag, so a client
+    revalidating with If-None-Match gets a bodyless 304 until something
+    is saved. Media files are sent with ``socket.sendfile``.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without TCP_NODELAY the
+    # body waits on the client's delayed ACK on every keep-alive request
+    disable_nagle_algorithm = True
+    server_version = "FrogsCatalog/1"
+    routes = (
+        (re.compile(r"/species"), "get_species_page"),
+        (re.compile(r"/species/(\d+)"), "get_profile"),
+        (re.compile(r"/states"), "get_states"),
+        (re.compile(r"/states/([^/]+)/species"), "get_state_species"),
+        (re.compile(r"/media/(.+)"), "get_media"),
+    )
+
+    @property
+    def catalog(self):
+        return self.server.catalog
+
+    def log_message(self, format, *args):
+        if self.server.access_log:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self.head_only = False
+        self.dispatch()
+
+    def do_HEAD(self):
+        self.head_only = True
+        self.dispatch()
+
+    def dispatch(self):
+        self.responded = False
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        for pattern, method in self.routes:
+            match = pattern.fullmatch(url.path)
+            if match:
+                try:
+                    getattr(self, method)(url, query, *(unquote(group) for group in match.groups()))
+                except NotFound as e:
+                    self.send_error_json(HTTPStatus.NOT_FOUND, str(e))
+                except BadRequest as e:
+                    self.send_error_json(HTTPStatus.BAD_REQUEST, str(e))
+                except ConnectionError:
+                    # The client went away mid-response
+                    self.close_connection = True
+                except Exception:
+                    traceback.print_exc()
+                    # A response already under way can only be cut short
+                    if self.responded:
+                        self.close_connection = True
+                    else:
+                        self.send_error_json(HTTPStatus.INTERNAL_SERVER_ERROR, "internal error")
+                return
+        self.send_error_json(HTTPStatus.NOT_FOUND, f"no route for {url.path}")
+
+    def send_response(self, code, message=None):
+        self.responded = True
+        super().send_response(code, message)
+
+    def send_body(self, status, body, content_type, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if not self.head_only:
+            self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_body(status, json.dumps({"error": message}).encode("utf-8"), "application/json")
+
+    def not_modified(self, etag):
+        if etag not in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            return False
+        self.send_response(HTTPStatus.NOT_MODIFIED)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        return True
+
+    def send_json(self, url, build):
+        version = self.catalog.version()
+        etag = f'"{version}"'
+        if self.not_modified(etag):
+            return
+        key = f"{url.path}?{url.query}"
+        body = self.catalog.cache.get(key, version)
+        if body is None:
+            body = json.dumps(build(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self.catalog.cache.put(key, version, body)
+        # Clients may keep the body but must revalidate it
+        self.send_body(HTTPStatus.OK, body, "application/json; charset=utf-8",
+                       [("ETag", etag), ("Cache-Control", "no-cache")])
+
+    def get_species_page(self, url, query):
+        self.send_json(url, lambda: self.catalog.species_page(query))
+
+    def get_profile(self, url, query, frog_toad_id):
+        frog_toad_id = int(frog_toad_id)
+        if frog_toad_id > MAX_ID:
+            raise NotFound(f"no species {frog_toad_id}")
+        self.send_json(url, lambda: self.catalog.profile(frog_toad_id))
+
+    def get_states(self, url, query):
+        self.send_json(url, self.catalog.states)
+
+    def get_state_species(self, url, query, state_name):
+        self.send_json(url, lambda: self.catalog.state_species(state_name, query))
+
+    def get_media(self, url, query, path):
+        file_path = self.catalog.media_file(path)
+        try:
+            f = open(file_path, "rb")
+        except OSError:
+            raise NotFound(path)
+        with f:
+            stat = os.fstat(f.fileno())
+            etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+            if self.not_modified(etag):
+                return
+            start, end = 0, stat.st_size
+            status = HTTPStatus.OK
+            # One byte range, which is what audio players ask for when seeking
+            match = _RANGE.match(self.headers.get("Range", ""))
+            if match and stat.st_size:
+                first, last = match.groups()
+                if first:
+                    start, end = int(first), min(int(last) + 1, stat.st_size) if last else stat.st_size
+                elif last:
+                    start = max(stat.st_size - int(last), 0)
+                if start >= end:
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header("Content-Range", f"bytes */{stat.st_size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                status = HTTPStatus.PARTIAL_CONTENT
+
+            self.send_response(status)
+            self.send_header("Content-Type", mimetypes.guess_type(file_path)[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(end - start))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            if status == HTTPStatus.PARTIAL_CONTENT:
+                self.send_header("Content-Range", f"bytes {start}-{end - 1}/{stat.st_size}")
+            stem = os.path.splitext(os.path.basename(file_path))[0]
+            if _DIGEST_NAME.fullmatch(stem):
+                self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+            self.end_headers()
+            if not self.head_only:
+                # Straight from the page cache to the socket where the OS
+                # supports it; a plain read/send loop elsewhere
+                self.connection.sendfile(f, start, end - start)
+
+class CatalogHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # Several processes accept on the one socket; let it queue bursts
+    request_queue_size = 128
+    catalog = None
+    access_log = False
+
+def _serve_worker(server, db_path, media_root):
+    # Opened after the fork, so no SQLite connection is shared by processes
+    server.catalog = Catalog(db_path, media_root)
+    server.serve_forever()
+
+def serve(db_path, host="127.0.0.1", port=DEFAULT_PORT, workers=WORKERS, media_root=".", access_log=False):
+    """Serve the catalog until interrupted.
+
+    The listening socket is bound once and then shared by ``workers``
+    forked processes, which the kernel hands connections to in turn; a
+    worker that dies is replaced. Without ``os.fork`` (Windows) one
+    process serves everything.
+    """
+    server = CatalogHTTPServer((host, port), CatalogHandler)
+    server.access_log = access_log
+    print(f"Serving {db_path} on http://{host}:{server.server_address[1]} with {workers} worker(s)", flush=True)
+    if workers <= 1 or not hasattr(os, "fork"):
+        try:
+            _serve_worker(server, db_path, media_root)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                _serve_worker(server, db_path, media_root)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited ({status}); starting another", file=sys.stderr)
+            spawn()
+    server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only JSON API over the species catalog.")
+    parser.add_argument("--db", default="frogs_toads.db")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--media-root", default=".", help="Directory relative media paths are resolved from")
+    parser.add_argument("--access-log", action="store_true")
+    args = parser.parse_args()
+
+    from main import init_db
+
+    # Creates any missing tables and the change-counter triggers; the
+    # workers themselves never write
+    init_db(args.db).dispose()
+    serve(args.db, args.host, args.port, args.workers, args.media_root, args.access_log)
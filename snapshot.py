@@ -0,0 +1,363 @@
+import argparse
+import mmap
+import os
+import struct
+
+import numpy as np
+from sqlalchemy import select
+
+from db import create_session_factory
+from facets import FACETS
+from models import CatalogVersion, FrogsToad, SpeciesVersion, State, frog_toad_states
+
+# File layout: a header, a directory of named sections, then the sections,
+# each 8-byte aligned so numpy can view them in place
+MAGIC = b"FROGSNAP"
+FORMAT_VERSION = 1
+# magic, format version, section count, catalog version, species count
+HEADER = struct.Struct("<8sIIqq")
+# name, byte offset, byte length
+SECTION = struct.Struct("<16sQQ")
+# Per-species columns are indexes into the string table; states are a
+# CSR list: species row i's states are state_strings[state_offsets[i]:state_offsets[i + 1]]
+SECTION_TYPES = {
+    "ids": np.int64,
+    "names": np.uint32,
+    **{facet: np.uint32 for facet in FACETS},
+    "state_offsets": np.uint32,
+    "state_strings": np.uint32,
+    "string_offsets": np.uint64,
+    "string_data": np.uint8,
+}
+# Columns read per species, in SELECT order
+STRING_COLUMNS = ("names",) + FACETS
+# Species re-read per query when updating; keeps IN lists under SQLite's limit
+READ_BATCH = 500
+# Past this share of changed species, or of strings no row uses any more,
+# a full rebuild is cheaper than patching
+REBUILD_FRACTION = 0.25
+
+def init_snapshot(engine):
+    """Create the change-counter row and the triggers that advance it.
+
+    Every insert, delete or update of a species, its state links or its
+    images, audio and map bumps catalog_version and stamps the species in
+    species_versions with the new value. The snapshot only needs names,
+    facets and states; the rest makes the counter cover everything the
+    API server (server.py) returns.
+    """
+    bump = "UPDATE catalog_version SET version = version + 1 WHERE id = 0;"
+
+    def stamp(frog_toad_id):
+        return (f"{bump} INSERT OR REPLACE INTO species_versions (frog_toad_id, version) "
+                f"SELECT {frog_toad_id}, version FROM catalog_version WHERE id = 0;")
+
+    triggers = {
+        "frogs_toads_version_ai": f"AFTER INSERT ON frogs_toads BEGIN {stamp('new.id')} END",
+        "frogs_toads_version_ad": f"AFTER DELETE ON frogs_toads BEGIN {stamp('old.id')} END",
+        "frogs_toads_version_au": f"AFTER UPDATE ON frogs_toads BEGIN {stamp('new.id')} END",
+        "frog_toad_states_version_ai": f"AFTER INSERT ON frog_toad_states BEGIN {stamp('new.frog_toad_id')} END",
+        "frog_toad_states_version_ad": f"AFTER DELETE ON frog_toad_states BEGIN {stamp('old.frog_toad_id')} END",
+        # A renamed state changes every species that lives there
+        "states_version_au": (
+            f"AFTER UPDATE OF state_name ON states BEGIN {bump} "
+            f"INSERT OR REPLACE INTO species_versions (frog_toad_id, version) "
+            f"SELECT frog_toad_states.frog_toad_id, catalog_version.version FROM frog_toad_states, catalog_version "
+            f"WHERE frog_toad_states.state_id = new.id AND catalog_version.id = 0; END"
+        ),
+    }
+    for table in ("images", "audio_files", "territory_maps"):
+        triggers[f"{table}_version_ai"] = f"AFTER INSERT ON {table} BEGIN {stamp('new.frog_toad_id')} END"
+        triggers[f"{table}_version_ad"] = f"AFTER DELETE ON {table} BEGIN {stamp('old.frog_toad_id')} END"
+        triggers[f"{table}_version_au"] = f"AFTER UPDATE ON {table} BEGIN {stamp('new.frog_toad_id')} END"
+    # SQLite keeps each trigger's CREATE statement, so one whose definition
+    # changed since the database was set up is found by comparing the text
+    # and replaced; IF NOT EXISTS would keep the old one under the same name
+    statements = {name: f"CREATE TRIGGER {name} {body}" for name, body in triggers.items()}
+    with engine.connect() as conn:
+        existing = dict(conn.exec_driver_sql("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").all())
+        has_row = conn.exec_driver_sql("SELECT 1 FROM catalog_version WHERE id = 0").first() is not None
+    stale = [name for name, statement in statements.items() if existing.get(name) != statement]
+    # Nothing is written to a database that is already set up
+    if has_row and not stale:
+        return
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (0, 0)")
+        for name in stale:
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+            conn.exec_driver_sql(statements[name])
+
+def catalog_version(session):
+    return session.execute(select(CatalogVersion.version).where(CatalogVersion.id == 0)).scalar() or 0
+
+class CatalogSnapshot:
+    """Read-only view of a snapshot file through ``mmap``.
+
+    Columns are numpy arrays over the mapping, so opening costs the same
+    whatever the catalog's size and nothing is copied until a string is
+    read: the OS pages in only the parts actually looked at.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, format_version, section_count, self.version, count = HEADER.unpack_from(self._map)
+            if magic != MAGIC or format_version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} catalog snapshot")
+            sections = {}
+            offsets = {}
+            for index in range(section_count):
+                name, offset, length = SECTION.unpack_from(self._map, HEADER.size + index * SECTION.size)
+                name = name.rstrip(b"\0").decode("ascii")
+                dtype = np.dtype(SECTION_TYPES[name])
+                sections[name] = np.frombuffer(self._map, dtype, length // dtype.itemsize, offset)
+                offsets[name] = offset
+            missing = set(SECTION_TYPES) - set(sections)
+            if missing:
+                raise ValueError(f"{path} lacks snapshot sections {sorted(missing)}")
+        except Exception:
+            self._map.close()
+            raise
+        self.ids = sections["ids"]
+        self.columns = {name: sections[name] for name in STRING_COLUMNS}
+        self.state_offsets = sections["state_offsets"]
+        self.state_strings = sections["state_strings"]
+        self.string_offsets = sections["string_offsets"]
+        self.string_data = sections["string_data"]
+        self._data_start = offsets["string_data"]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def string(self, index):
+        start, end = self.string_offsets[index], self.string_offsets[index + 1]
+        return self._map[self._data_start + int(start):self._data_start + int(end)].decode("utf-8")
+
+    def name(self, row):
+        return self.string(self.columns["names"][row])
+
+    def facet(self, row, facet):
+        return self.string(self.columns[facet][row])
+
+    def states(self, row):
+        start, end = self.state_offsets[row], self.state_offsets[row + 1]
+        return [self.string(index) for index in self.state_strings[start:end]]
+
+    def row_of(self, frog_toad_id):
+        row = int(np.searchsorted(self.ids, frog_toad_id))
+        return row if row < len(self.ids) and self.ids[row] == frog_toad_id else None
+
+    def page(self, after_id, limit):
+        """Same rows as ``queries.species_page``, read from the snapshot."""
+        start = 0 if after_id is None else int(np.searchsorted(self.ids, after_id, side="right"))
+        return [(int(self.ids[row]), self.name(row)) for row in range(start, min(start + limit, len(self.ids)))]
+
+    def close(self):
+        # Views over the mapping must go first or mmap refuses to close
+        self.ids = self.columns = self.state_offsets = self.state_strings = None
+        self.string_offsets = self.string_data = None
+        self._map.close()
+
+class _StringTable:
+    """Interns strings for a snapshot being written; None is stored as ''."""
+
+    def __init__(self, start=0):
+        self.start = start
+        self.indexes = {}
+        self.strings = []
+
+    def add(self, value):
+        value = value or ""
+        index = self.indexes.get(value)
+        if index is None:
+            index = self.indexes[value] = self.start + len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def encoded(self):
+        data = [value.encode("utf-8") for value in self.strings]
+        lengths = np.fromiter((len(item) for item in data), dtype=np.uint64, count=len(data))
+        return b"".join(data), lengths
+
+def _read_species(session, strings, frog_toad_ids=None):
+    """Species rows as arrays, for all species or the given ids.
+
+    Returns ``(ids, {column: string indexes}, state counts, state string
+    indexes)`` in id order; ids that no longer exist are simply absent.
+    """
+    columns = [FrogsToad.name] + [getattr(FrogsToad, facet) for facet in FACETS]
+    if frog_toad_ids is None:
+        batches = [None]
+    else:
+        frog_toad_ids = sorted(frog_toad_ids)
+        batches = [frog_toad_ids[start:start + READ_BATCH] for start in range(0, len(frog_toad_ids), READ_BATCH)]
+    ids, values, states = [], [], {}
+    for batch in batches:
+        species_query = select(FrogsToad.id, *columns).order_by(FrogsToad.id)
+        states_query = (
+            select(frog_toad_states.c.frog_toad_id, State.state_name)
+            .join(State, State.id == frog_toad_states.c.state_id)
+            .order_by(frog_toad_states.c.frog_toad_id, State.state_name)
+        )
+        if batch is not None:
+            species_query = species_query.where(FrogsToad.id.in_(batch))
+            states_query = states_query.where(frog_toad_states.c.frog_toad_id.in_(batch))
+        for frog_toad_id, *row in session.execute(species_query):
+            ids.append(frog_toad_id)
+            values.append([strings.add(value) for value in row])
+        for frog_toad_id, state_name in session.execute(states_query):
+            states.setdefault(frog_toad_id, []).append(strings.add(state_name))
+    values = np.array(values, dtype=np.uint32).reshape(len(ids), len(STRING_COLUMNS))
+    state_lists = [states.get(frog_toad_id, []) for frog_toad_id in ids]
+    return (
+        np.array(ids, dtype=np.int64),
+        {name: values[:, index] for index, name in enumerate(STRING_COLUMNS)},
+        np.fromiter((len(items) for items in state_lists), dtype=np.uint32, count=len(ids)),
+        np.array([index for items in state_lists for index in items], dtype=np.uint32),
+    )
+
+def _write(path, version, ids, columns, state_offsets, state_strings, string_offsets, string_data):
+    sections = {"ids": ids, **columns, "state_offsets": state_offsets, "state_strings": state_strings,
+                "string_offsets": string_offsets, "string_data": string_data}
+    offset = HEADER.size + SECTION.size * len(sections)
+    directory = []
+    for name, array in sections.items():
+        offset = (offset + 7) & ~7
+        array = np.ascontiguousarray(array, dtype=SECTION_TYPES[name])
+        directory.append((name, offset, array))
+        offset += array.nbytes
+
+    # Written under a temporary name and renamed into place: a running app
+    # keeps reading the old file through its mapping
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), version, len(ids)))
+            for name, offset, array in directory:
+                f.write(SECTION.pack(name.encode("ascii"), offset, array.nbytes))
+            for name, offset, array in directory:
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(array.tobytes())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _offsets(lengths, dtype):
+    offsets = np.zeros(len(lengths) + 1, dtype=dtype)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+def build_snapshot(session, path):
+    """Write a snapshot of the whole catalog; returns its version."""
+    # Read before the rows: a save landing mid-build is then re-read by the
+    # next update rather than missed
+    version = catalog_version(session)
+    strings = _StringTable()
+    strings.add("")
+    ids, columns, state_counts, state_strings = _read_species(session, strings)
+    data, lengths = strings.encoded()
+    _write(path, version, ids, columns, _offsets(state_counts, np.uint32), state_strings,
+           _offsets(lengths, np.uint64), np.frombuffer(data, np.uint8))
+    return version
+
+def _segments(starts, counts):
+    # Positions of every element of the segments [start, start + count)
+    ends = np.cumsum(counts, dtype=np.int64)
+    return np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts.astype(np.int64) - (ends - counts), counts)
+
+def update_snapshot(session, path):
+    """Bring the snapshot at ``path`` up to the database's catalog version.
+
+    Only species stamped since the snapshot's version are read from the
+    database; every other row is carried over from the old file as array
+    slices. Falls back to ``build_snapshot`` when there is no usable
+    snapshot or so much changed that patching would not pay. Returns
+    ``(version, changed species)``, where None means a full build.
+    """
+    try:
+        old = CatalogSnapshot(path)
+    except (OSError, ValueError):
+        return build_snapshot(session, path), None
+    try:
+        version = catalog_version(session)
+        if version == old.version:
+            return version, 0
+        changed = [frog_toad_id for frog_toad_id, in session.execute(
+            select(SpeciesVersion.frog_toad_id).where(SpeciesVersion.version > old.version))]
+        if len(changed) > REBUILD_FRACTION * max(len(old), 1):
+            old.close()
+            return build_snapshot(session, path), None
+
+        # New strings are appended to the old table, not matched against it
+        string_count = len(old.string_offsets) - 1
+        strings = _StringTable(string_count)
+        # Every snapshot stores the empty string first
+        strings.indexes[""] = 0
+        ids, columns, state_counts, state_strings = _read_species(session, strings, changed)
+
+        keep = ~np.isin(old.ids, np.array(changed, dtype=np.int64))
+        merged_ids = np.concatenate([old.ids[keep], ids])
+        order = np.argsort(merged_ids, kind="stable")
+        merged_columns = {name: np.concatenate([old.columns[name][keep], columns[name]])[order]
+                          for name in STRING_COLUMNS}
+        # Each row's states stay where they are in the old or new list;
+        # the merged list gathers them in the new row order
+        old_counts = np.diff(old.state_offsets)
+        starts = np.concatenate([old.state_offsets[:-1][keep], len(old.state_strings) + _offsets(state_counts, np.int64)[:-1]])
+        counts = np.concatenate([old_counts[keep], state_counts])[order]
+        merged_states = np.concatenate([old.state_strings, state_strings])[_segments(starts[order], counts)]
+
+        used = np.unique(np.concatenate([*merged_columns.values(), merged_states]))
+        if len(used) < (1 - REBUILD_FRACTION) * (string_count + len(strings.strings)):
+            # Renames and deletes have left too many unused strings behind
+            old.close()
+            return build_snapshot(session, path), None
+
+        data, lengths = strings.encoded()
+        string_offsets = np.concatenate([old.string_offsets, old.string_offsets[-1] + np.cumsum(lengths, dtype=np.uint64)])
+        string_data = np.concatenate([old.string_data, np.frombuffer(data, np.uint8)])
+        _write(path, version, merged_ids[order], merged_columns, _offsets(counts, np.uint32), merged_states,
+               string_offsets, string_data)
+        return version, len(changed)
+    finally:
+        if old.ids is not None:
+            old.close()
+
+def open_snapshot(Session, path):
+    """Update the snapshot at ``path`` if the catalog moved on, then open it.
+
+    On a read-only filesystem an existing snapshot is opened as it is.
+    """
+    session = Session()
+    try:
+        update_snapshot(session, path)
+    except OSError as e:
+        if not os.path.exists(path):
+            raise
+        print(f"Using the existing snapshot; could not update it: {e}")
+    finally:
+        session.close()
+    return CatalogSnapshot(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update a memory-mapped catalog snapshot.")
+    parser.add_argument("--db", default="frogs_toads.db")
+    parser.add_argument("path")
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch instead of patching")
+    args = parser.parse_args()
+
+    from main import init_db
+
+    session = create_session_factory(init_db(args.db))()
+    try:
+        if args.full:
+            version, changed = build_snapshot(session, args.path), None
+        else:
+            version, changed = update_snapshot(session, args.path)
+        how = "rebuilt" if changed is None else f"{changed} species updated"
+        print(f"Snapshot at catalog version {version} ({how}), {os.path.getsize(args.path)} bytes")
+    finally:
+        session.close()
@@ -0,0 +1,221 @@
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt, pyqtSignal
+
+import diagnostics
+
+# Role used to read a species' primary key back out of a list index
+SPECIES_ID_ROLE = Qt.UserRole
+
+# Number of (id, name) rows fetched per page
+PAGE_SIZE = 500
+
+class SpeciesListModel(QAbstractListModel):
+    """Lazily-paged list of species names for a QListView.
+
+    Only ``id`` and ``name`` are selected, one keyset page at a time, so the
+    view materializes rows as the user scrolls instead of hydrating every
+    ``FrogsToad`` up front. Pages are fetched through the repository's
+    thread pool; ``fetchMore`` only starts a request and rows are inserted
+    when it completes.
+    """
+
+    # Emitted after each page arrives, with the number of rows it added
+    # (possibly none, e.g. for an empty catalog)
+    pageLoaded = pyqtSignal(int)
+
+    def __init__(self, repository=None, page_size=PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.repository = repository
+        self.page_size = page_size
+        # Page request in flight, if any
+        self._request = None
+        self._ids = []
+        self._names = []
+        # Maps a loaded species id to its row so single-row patches are O(1)
+        self._rows = {}
+        # Last id seen, used as the keyset cursor for the next page
+        self._last_id = None
+        self._exhausted = repository is None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._ids)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._ids):
+            return None
+        if role == Qt.DisplayRole:
+            return self._names[index.row()]
+        if role == SPECIES_ID_ROLE:
+            return self._ids[index.row()]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return not self._exhausted and self._request is None
+
+    @diagnostics.timed("SpeciesList.fetch")
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted or self._request is not None:
+            return
+        self._request = self.repository.species_page(
+            self._last_id, self.page_size, self._page_loaded, self._page_failed
+        )
+
+    @diagnostics.timed("SpeciesList.populate")
+    def _page_loaded(self, rows):
+        self._request = None
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        if not rows:
+            self.pageLoaded.emit(0)
+            return
+        first = len(self._ids)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        for frog_toad_id, name in rows:
+            self._rows[frog_toad_id] = len(self._ids)
+            self._ids.append(frog_toad_id)
+            self._names.append(name)
+        self._last_id = rows[-1][0]
+        self.endInsertRows()
+        self.pageLoaded.emit(len(rows))
+
+    def _page_failed(self, error):
+        self._request = None
+        print(error)
+
+    def reset(self):
+        """Drop every loaded page and start again from the first one."""
+        if self._request is not None:
+            self._request.cancel()
+            self._request = None
+        self.beginResetModel()
+        self._ids = []
+        self._names = []
+        self._rows = {}
+        self._last_id = None
+        self._exhausted = self.repository is None
+        self.endResetModel()
+
+    def apply_change(self, action, frog_toad_id, name):
+        """Patch the single row touched by an ``EditView`` save.
+
+        Updated or renamed species are refreshed in place when their row is
+        loaded. New species get the highest id, so they are appended once the
+        last page has been read; otherwise the next ``fetchMore`` picks them up.
+        """
+        row = self._rows.get(frog_toad_id)
+        if row is not None:
+            self._names[row] = name
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DisplayRole])
+        elif action == "inserted" and self._exhausted and self.repository is not None:
+            row = len(self._ids)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._rows[frog_toad_id] = row
+            self._ids.append(frog_toad_id)
+            self._names.append(name)
+            self._last_id = frog_toad_id
+            self.endInsertRows()
+
+class SpeciesResultsModel(QAbstractListModel):
+    """Fixed list of (id, name) rows, such as search hits."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._ids = []
+        self._names = []
+        self._rows = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._ids)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._ids):
+            return None
+        if role == Qt.DisplayRole:
+            return self._names[index.row()]
+        if role == SPECIES_ID_ROLE:
+            return self._ids[index.row()]
+        return None
+
+    def set_rows(self, rows):
+        """Replace the whole list with ``rows`` in a single model reset."""
+        self.beginResetModel()
+        self._ids = [frog_toad_id for frog_toad_id, _ in rows]
+        self._names = [name for _, name in rows]
+        self._rows = {frog_toad_id: row for row, frog_toad_id in enumerate(self._ids)}
+        self.endResetModel()
+
+    def apply_change(self, action, frog_toad_id, name):
+        # Only rename rows already shown; new species appear on the next query
+        row = self._rows.get(frog_toad_id)
+        if row is not None:
+            self._names[row] = name
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DisplayRole])
+
+class SnapshotListModel(QAbstractListModel):
+    """The full species list served from a ``snapshot.CatalogSnapshot``.
+
+    Every row is there from the start and names are decoded from the
+    mapped file only when the view asks for them, so memory stays flat
+    however large the catalog is. Saves made while running are kept as
+    small overlays on top of the snapshot.
+    """
+
+    def __init__(self, snapshot, parent=None):
+        super().__init__(parent)
+        self.snapshot = snapshot
+        # Snapshot row -> name for species renamed since it was built
+        self._renamed = {}
+        # (id, name) of species added since it was built
+        self._added = []
+        self._added_rows = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.snapshot) + len(self._added)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < self.rowCount():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            if row >= len(self.snapshot):
+                return self._added[row - len(self.snapshot)][1]
+            name = self._renamed.get(row)
+            return name if name is not None else self.snapshot.name(row)
+        if role == SPECIES_ID_ROLE:
+            if row >= len(self.snapshot):
+                return self._added[row - len(self.snapshot)][0]
+            return int(self.snapshot.ids[row])
+        return None
+
+    def reset(self):
+        # Nothing to reload: the snapshot is the whole list
+        self.beginResetModel()
+        self.endResetModel()
+
+    def apply_change(self, action, frog_toad_id, name):
+        row = self.snapshot.row_of(frog_toad_id)
+        if row is not None:
+            self._renamed[row] = name
+        elif frog_toad_id in self._added_rows:
+            row = self._added_rows[frog_toad_id]
+            self._added[row - len(self.snapshot)] = (frog_toad_id, name)
+        elif action == "inserted":
+            row = self.rowCount()
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._added_rows[frog_toad_id] = row
+            self._added.append((frog_toad_id, name))
+            self.endInsertRows()
+            return
+        else:
+            return
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole])
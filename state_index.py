@@ -0,0 +1,63 @@
+import threading
+
+from models import FrogsToad, State, frog_toad_states
+
+class StateSpeciesIndex:
+    """In-memory map of state name -> [(species id, name), ...].
+
+    Built with one joined query on first use and served from memory after
+    that. ``invalidate`` drops it so the next lookup rebuilds; EditView saves
+    call it because any save can change a species' name or states.
+    """
+
+    def __init__(self, Session):
+        self.Session = Session
+        self._lock = threading.Lock()
+        self._species_by_state = None
+
+    def _build(self):
+        session = self.Session()
+        try:
+            rows = (
+                session.query(State.state_name, FrogsToad.id, FrogsToad.name)
+                .join(frog_toad_states, frog_toad_states.c.state_id == State.id)
+                .join(FrogsToad, FrogsToad.id == frog_toad_states.c.frog_toad_id)
+                .order_by(State.state_name, FrogsToad.id)
+            )
+            species_by_state = {}
+            for state_name, frog_toad_id, name in rows:
+                species_by_state.setdefault(state_name, []).append((frog_toad_id, name))
+            return species_by_state
+        finally:
+            session.close()
+
+    def ensure_built(self):
+        # Safe to call from a worker thread to warm the index ahead of use
+        with self._lock:
+            if self._species_by_state is None:
+                self._species_by_state = self._build()
+            return self._species_by_state
+
+    def species_for(self, state_name):
+        return self.ensure_built().get(state_name, [])
+
+    def counts(self):
+        return {state_name: len(species) for state_name, species in self.ensure_built().items()}
+
+    def payload(self):
+        """The whole index as ``{"names": {id: name}, "states": {state: [id, ...]}}``.
+
+        Each name appears once however many states the species lives in,
+        which keeps the map's single JSON push small.
+        """
+        names = {}
+        states = {}
+        for state_name, species in self.ensure_built().items():
+            states[state_name] = [frog_toad_id for frog_toad_id, _ in species]
+            names.update(species)
+        return {"names": names, "states": states}
+
+    def invalidate(self, *args):
+        # Accepts and ignores EditView.saved arguments so it can be connected directly
+        with self._lock:
+            self._species_by_state = None
@@ -0,0 +1,478 @@
+import os
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from PyQt5.QtCore import QByteArray, QPointF, QRectF, Qt, pyqtSignal
+from PyQt5.QtGui import QBrush, QColor, QPainter, QPainterPath, QPen, QTransform
+from PyQt5.QtSvg import QGraphicsSvgItem, QSvgRenderer
+from PyQt5.QtWidgets import (
+    QGraphicsPathItem, QGraphicsScene, QGraphicsView, QHBoxLayout, QLabel, QListView, QPushButton, QToolTip,
+    QVBoxLayout, QWidget
+)
+
+import diagnostics
+from ranges import albers, albers_inverse, fit_affine
+from species_model import SpeciesResultsModel
+
+# The U.S. map, next to this module so the working directory doesn't matter
+SVG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "us_map.svg")
+# Grid cells per side of the spatial index
+GRID_SIZE = 32
+# Shading from no species to the busiest state, as in the web map. It is
+# drawn translucent over the SVG so its borders and labels show through.
+EMPTY_COLOR = QColor(45, 45, 45)
+FULL_COLOR = QColor(76, 175, 80)
+SHADE_ALPHA = 190
+HOVER_PEN = QPen(QColor("#FF4500"), 2)
+SELECTED_PEN = QPen(QColor("white"), 3)
+POINT_PEN = QPen(QColor("#FF4500"), 2)
+# Radius of the marker drawn where a range query was made, in scene units
+POINT_RADIUS = 4
+
+# Geographic centers (lon, lat) of the contiguous states. The map carries no
+# coordinates of its own, so it is georeferenced by fitting these, projected
+# with Albers, onto the centroids of the matching state paths. Alaska and
+# Hawaii are usually drawn as insets and are left out.
+STATE_CENTERS = {
+    "Alabama": (-86.83, 32.78), "Arizona": (-111.66, 34.27), "Arkansas": (-92.44, 34.89),
+    "California": (-119.47, 37.18), "Colorado": (-105.55, 39.00), "Connecticut": (-72.73, 41.62),
+    "Delaware": (-75.51, 38.99), "Florida": (-82.45, 28.63), "Georgia": (-83.44, 32.64),
+    "Idaho": (-114.61, 44.35), "Illinois": (-89.20, 40.04), "Indiana": (-86.28, 39.89),
+    "Iowa": (-93.50, 42.08), "Kansas": (-98.38, 38.49), "Kentucky": (-85.30, 37.53),
+    "Louisiana": (-92.00, 31.07), "Maine": (-69.24, 45.37), "Maryland": (-76.79, 39.06),
+    "Massachusetts": (-71.81, 42.26), "Michigan": (-85.41, 44.35), "Minnesota": (-94.31, 46.28),
+    "Mississippi": (-89.67, 32.74), "Missouri": (-92.46, 38.36), "Montana": (-109.63, 47.05),
+    "Nebraska": (-99.80, 41.54), "Nevada": (-116.63, 39.33), "New Hampshire": (-71.58, 43.68),
+    "New Jersey": (-74.67, 40.19), "New Mexico": (-106.11, 34.41), "New York": (-75.53, 42.95),
+    "North Carolina": (-79.39, 35.56), "North Dakota": (-100.47, 47.45), "Ohio": (-82.79, 40.29),
+    "Oklahoma": (-97.49, 35.59), "Oregon": (-120.56, 43.93), "Pennsylvania": (-77.80, 40.88),
+    "Rhode Island": (-71.56, 41.68), "South Carolina": (-80.90, 33.92), "South Dakota": (-100.23, 44.44),
+    "Tennessee": (-86.35, 35.86), "Texas": (-99.33, 31.48), "Utah": (-111.67, 39.31),
+    "Vermont": (-72.67, 44.07), "Virginia": (-78.85, 37.52), "Washington": (-120.45, 47.38),
+    "West Virginia": (-80.62, 38.64), "Wisconsin": (-89.99, 44.62), "Wyoming": (-107.55, 43.00),
+}
+# Fewer matched states than this and the fit is not trusted
+MIN_GEOREFERENCE_STATES = 6
+
+_SVG_NS = "{http://www.w3.org/2000/svg}"
+_PATH_TOKEN = re.compile(r"[MmLlHhVvCcSsQqTtAaZz]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_TRANSFORM = re.compile(r"(matrix|translate|scale|rotate)\s*\(([^)]*)\)")
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+# Numbers each path command consumes per repetition
+_ARG_COUNTS = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7, "Z": 0}
+
+def parse_path_data(d):
+    """Build a QPainterPath from an SVG ``d`` attribute.
+
+    Arcs are drawn as straight segments to their end point, which is close
+    enough for hit testing; the visible map is rendered by QSvgRenderer.
+    """
+    path = QPainterPath()
+    tokens = _PATH_TOKEN.findall(d)
+    x = y = start_x = start_y = 0.0
+    # Second control point of the previous curve, for S/T reflection
+    last_control = None
+    command = None
+    i = 0
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            command = tokens[i]
+            i += 1
+            if command in "Zz":
+                path.closeSubpath()
+                x, y = start_x, start_y
+                last_control = None
+                continue
+        if command is None:
+            break
+        count = _ARG_COUNTS[command.upper()]
+        args = [float(token) for token in tokens[i:i + count]]
+        if len(args) < count:
+            break
+        i += count
+        relative = command.islower()
+        upper = command.upper()
+        dx, dy = (x, y) if relative else (0.0, 0.0)
+        if upper == "M":
+            x, y = args[0] + dx, args[1] + dy
+            path.moveTo(x, y)
+            start_x, start_y = x, y
+            # Further coordinate pairs after a moveto are implicit linetos
+            command = "l" if relative else "L"
+            last_control = None
+        elif upper == "L" or upper == "A":
+            x, y = (args[0] + dx, args[1] + dy) if upper == "L" else (args[5] + dx, args[6] + dy)
+            path.lineTo(x, y)
+            last_control = None
+        elif upper == "H":
+            x = args[0] + dx
+            path.lineTo(x, y)
+            last_control = None
+        elif upper == "V":
+            y = args[0] + dy
+            path.lineTo(x, y)
+            last_control = None
+        elif upper == "C":
+            c1 = QPointF(args[0] + dx, args[1] + dy)
+            c2 = QPointF(args[2] + dx, args[3] + dy)
+            x, y = args[4] + dx, args[5] + dy
+            path.cubicTo(c1, c2, QPointF(x, y))
+            last_control = c2
+        elif upper == "S":
+            c1 = QPointF(2 * x - last_control.x(), 2 * y - last_control.y()) if last_control else QPointF(x, y)
+            c2 = QPointF(args[0] + dx, args[1] + dy)
+            x, y = args[2] + dx, args[3] + dy
+            path.cubicTo(c1, c2, QPointF(x, y))
+            last_control = c2
+        elif upper == "Q":
+            c = QPointF(args[0] + dx, args[1] + dy)
+            x, y = args[2] + dx, args[3] + dy
+            path.quadTo(c, QPointF(x, y))
+            last_control = c
+        elif upper == "T":
+            c = QPointF(2 * x - last_control.x(), 2 * y - last_control.y()) if last_control else QPointF(x, y)
+            x, y = args[0] + dx, args[1] + dy
+            path.quadTo(c, QPointF(x, y))
+            last_control = c
+    return path
+
+def parse_transform(text):
+    """QTransform for an SVG ``transform`` attribute (matrix/translate/scale/rotate)."""
+    transform = QTransform()
+    for name, arguments in _TRANSFORM.findall(text or ""):
+        values = [float(value) for value in _NUMBER.findall(arguments)]
+        if name == "matrix" and len(values) == 6:
+            step = QTransform(values[0], values[1], values[2], values[3], values[4], values[5])
+        elif name == "translate" and values:
+            step = QTransform.fromTranslate(values[0], values[1] if len(values) > 1 else 0.0)
+        elif name == "scale" and values:
+            step = QTransform.fromScale(values[0], values[1] if len(values) > 1 else values[0])
+        elif name == "rotate" and values:
+            cx, cy = (values[1], values[2]) if len(values) == 3 else (0.0, 0.0)
+            step = QTransform().translate(cx, cy).rotate(values[0]).translate(-cx, -cy)
+        else:
+            continue
+        # SVG lists apply right to left; QTransform products apply left to right
+        transform = step * transform
+    return transform
+
+def load_state_paths(svg_bytes):
+    """{state id: QPainterPath} for every ``<path id=...>``, in user units."""
+    paths = {}
+
+    def walk(element, transform):
+        transform = parse_transform(element.get("transform")) * transform
+        if element.tag in (_SVG_NS + "path", "path") and element.get("id") and element.get("d"):
+            path = transform.map(parse_path_data(element.get("d")))
+            state = element.get("id")
+            paths[state] = paths[state].united(path) if state in paths else path
+        for child in element:
+            walk(child, transform)
+
+    walk(ET.fromstring(svg_bytes), QTransform())
+    return paths
+
+class StateGrid:
+    """Uniform grid over the map's bounds for point -> state hit tests.
+
+    Each cell lists the states whose bounding box overlaps it, so a lookup
+    runs the exact ``QPainterPath.contains`` test on only a few candidates.
+    """
+
+    def __init__(self, paths, size=GRID_SIZE):
+        self.paths = paths
+        self.size = size
+        self.bounds = QRectF()
+        for path in paths.values():
+            self.bounds = self.bounds.united(path.boundingRect())
+        self.cell_width = max(self.bounds.width() / size, 1e-9)
+        self.cell_height = max(self.bounds.height() / size, 1e-9)
+        self.cells = {}
+        for state, path in paths.items():
+            box = path.boundingRect()
+            left, top = self._cell(box.left(), box.top())
+            right, bottom = self._cell(box.right(), box.bottom())
+            for column in range(left, right + 1):
+                for row in range(top, bottom + 1):
+                    self.cells.setdefault((column, row), []).append(state)
+
+    def _cell(self, x, y):
+        column = int((x - self.bounds.left()) / self.cell_width)
+        row = int((y - self.bounds.top()) / self.cell_height)
+        return min(max(column, 0), self.size - 1), min(max(row, 0), self.size - 1)
+
+    def state_at(self, point):
+        if not self.bounds.contains(point):
+            return None
+        for state in self.cells.get(self._cell(point.x(), point.y()), ()):
+            path = self.paths[state]
+            if path.boundingRect().contains(point) and path.contains(point):
+                return state
+        return None
+
+def path_centroid(path):
+    """Area-weighted centroid of a QPainterPath's closed subpaths."""
+    total_area = total_x = total_y = 0.0
+    for polygon in path.toSubpathPolygons():
+        points = np.array([(point.x(), point.y()) for point in polygon])
+        if len(points) < 3:
+            continue
+        x, y = points[:, 0], points[:, 1]
+        x_next, y_next = np.roll(x, -1), np.roll(y, -1)
+        cross = x * y_next - x_next * y
+        area = cross.sum() / 2
+        if area:
+            total_area += area
+            total_x += ((x + x_next) * cross).sum() / 6
+            total_y += ((y + y_next) * cross).sum() / 6
+    if not total_area:
+        return None
+    return total_x / total_area, total_y / total_area
+
+class MapGeoreference:
+    """Scene position <-> longitude/latitude for the state map.
+
+    An affine fit from Albers coordinates to scene coordinates, made from
+    the states found in both the SVG and STATE_CENTERS. ``residual`` is
+    the fit's RMS error in scene units.
+    """
+
+    def __init__(self, to_scene, residual):
+        self.to_scene = to_scene
+        self.from_scene = np.linalg.inv(np.vstack([to_scene, [0.0, 0.0, 1.0]]))[:2]
+        self.residual = residual
+
+    @classmethod
+    def fit(cls, paths):
+        """Fit from ``{state: QPainterPath}``; None if too few states match."""
+        projected, scene = [], []
+        for state, (lon, lat) in STATE_CENTERS.items():
+            centroid = path_centroid(paths[state]) if state in paths else None
+            if centroid is not None:
+                projected.append(albers(lon, lat))
+                scene.append(centroid)
+        if len(scene) < MIN_GEOREFERENCE_STATES:
+            return None
+        to_scene = fit_affine(projected, scene)
+        fitted = np.column_stack([projected, np.ones(len(projected))]) @ to_scene.T
+        return cls(to_scene, float(np.sqrt(((fitted - scene) ** 2).sum(axis=1).mean())))
+
+    def to_lonlat(self, point):
+        x, y = self.from_scene @ (point.x(), point.y(), 1.0)
+        lon, lat = albers_inverse(x, y)
+        return float(lon), float(lat)
+
+    def to_point(self, lon, lat):
+        x, y = self.to_scene @ (*albers(lon, lat), 1.0)
+        return QPointF(x, y)
+
+def format_lonlat(lon, lat):
+    return f"{abs(lat):.2f}°{'N' if lat >= 0 else 'S'} {abs(lon):.2f}°{'E' if lon >= 0 else 'W'}"
+
+class _MapGraphicsView(QGraphicsView):
+    def __init__(self, map_view, scene):
+        super().__init__(scene)
+        self.map_view = map_view
+        self.setMouseTracking(True)
+        self.setRenderHint(QPainter.Antialiasing)
+        self.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
+        self.setStyleSheet("background-color: #1E1E1E; border: none;")
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.fitInView(self.sceneRect(), Qt.KeepAspectRatio)
+
+    def mouseMoveEvent(self, event):
+        self.map_view.hover(self.mapToScene(event.pos()), event.globalPos())
+        super().mouseMoveEvent(event)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.map_view.click(self.mapToScene(event.pos()))
+        super().mousePressEvent(event)
+
+    def leaveEvent(self, event):
+        self.map_view.hover(None, None)
+        super().leaveEvent(event)
+
+class NativeMapView(QWidget):
+    """The interactive map drawn with QtSvg instead of QtWebEngine.
+
+    The SVG is read once: QSvgRenderer draws it and the same bytes are
+    parsed into one QPainterPath per state for shading, highlights and hit
+    testing. Everything renders on the raster paint engine in-process, so
+    there is no Chromium renderer and no GPU requirement. Clicks go
+    through the repository's in-memory state index like the web map's
+    data does; ``refresh``, ``species_changed`` and ``dataLoaded`` match
+    MapView.
+
+    With "Ranges at point" on, a click lists the species whose range
+    polygons contain that spot instead (see ranges.py).
+    """
+
+    dataLoaded = pyqtSignal()
+
+    @diagnostics.timed("NativeMapView.build")
+    def __init__(self, repository, svg_path=SVG_PATH):
+        super().__init__()
+        self.repository = repository
+        self._stale = True
+        self.counts = {}
+        self.hovered = None
+        self.selected = None
+
+        self.setWindowTitle("Interactive U.S. Map")
+        self.resize(1000, 600)
+        self.setStyleSheet("background-color: #1E1E1E; color: white;")
+
+        # A missing or broken map leaves an empty view with the reason in
+        # the status line; raising here would abort the app from a Qt slot
+        load_error = None
+        try:
+            with open(svg_path, "rb") as f:
+                svg_bytes = f.read()
+            state_paths = load_state_paths(svg_bytes)
+        except (OSError, ET.ParseError, ValueError) as e:
+            load_error = f"Could not load the map {svg_path}: {e}"
+            svg_bytes, state_paths = b"", {}
+        self.renderer = QSvgRenderer(QByteArray(svg_bytes), self)
+        # Paths are in the SVG's user units (its viewBox); the rendered
+        # item is in its default size, so map one onto the other
+        view_box = self.renderer.viewBoxF()
+        size = self.renderer.defaultSize()
+        to_item = QTransform()
+        if view_box.width() and view_box.height():
+            to_item = QTransform.fromTranslate(-view_box.x(), -view_box.y()) * QTransform.fromScale(
+                size.width() / view_box.width(), size.height() / view_box.height())
+        self.paths = {state: to_item.map(path) for state, path in state_paths.items()}
+        self.grid = StateGrid(self.paths)
+        self.georeference = MapGeoreference.fit(self.paths)
+
+        self.scene = QGraphicsScene(self)
+        # Hit testing uses the grid; the scene's own BSP index is not needed
+        self.scene.setItemIndexMethod(QGraphicsScene.NoIndex)
+        self.svg_item = QGraphicsSvgItem()
+        self.svg_item.setSharedRenderer(self.renderer)
+        # Rasterized once per zoom level, not on every hover repaint
+        self.svg_item.setCacheMode(QGraphicsSvgItem.DeviceCoordinateCache)
+        self.scene.addItem(self.svg_item)
+        self.state_items = {}
+        for state, path in self.paths.items():
+            item = QGraphicsPathItem(path)
+            item.setPen(QPen(Qt.NoPen))
+            item.setBrush(QBrush(QColor(EMPTY_COLOR.red(), EMPTY_COLOR.green(), EMPTY_COLOR.blue(), SHADE_ALPHA)))
+            self.scene.addItem(item)
+            self.state_items[state] = item
+        self.selected_item = self.scene.addPath(QPainterPath(), SELECTED_PEN)
+        self.hover_item = self.scene.addPath(QPainterPath(), HOVER_PEN)
+        self.point_item = self.scene.addEllipse(-POINT_RADIUS, -POINT_RADIUS, 2 * POINT_RADIUS, 2 * POINT_RADIUS, POINT_PEN)
+        self.point_item.hide()
+        self.scene.setSceneRect(self.svg_item.boundingRect())
+
+        layout = QVBoxLayout(self)
+        controls = QHBoxLayout()
+        self.point_button = QPushButton("Ranges at point")
+        self.point_button.setCheckable(True)
+        self.point_button.setStyleSheet("background-color: #3C3C3C; color: white; padding: 5px;")
+        if self.georeference is None:
+            self.point_button.setEnabled(False)
+            self.point_button.setToolTip("The map's states could not be matched to coordinates")
+        controls.addWidget(self.point_button)
+        self.status_label = QLabel(load_error or "")
+        controls.addWidget(self.status_label, 1)
+        layout.addLayout(controls)
+        self.graphics_view = _MapGraphicsView(self, self.scene)
+        layout.addWidget(self.graphics_view, 3)
+
+        self.species_results = SpeciesResultsModel(self)
+        self.species_list = QListView()
+        self.species_list.setModel(self.species_results)
+        self.species_list.setUniformItemSizes(True)
+        self.species_list.setStyleSheet("background-color: #2D2D2D; color: white; border: 1px solid #555;")
+        layout.addWidget(self.species_list, 1)
+
+    def showEvent(self, event):
+        if self._stale:
+            self.refresh()
+        super().showEvent(event)
+
+    def refresh(self):
+        """Reload per-state counts and re-shade the map."""
+        if self.repository:
+            self._stale = False
+            self.repository.state_counts(self.shade, self.show_error)
+
+    # The index is invalidated by every save, so re-shading from fresh
+    # counts is the delta; the selected state's list is re-queried too
+    def species_changed(self, frog_toad_id):
+        if self._stale:
+            return
+        self.refresh()
+        if self.selected:
+            self.repository.species_for_state(self.selected, self.show_species, self.show_error)
+
+    @diagnostics.timed("NativeMapView.populate")
+    def shade(self, counts):
+        self.counts = counts
+        busiest = max(counts.values(), default=0) or 1
+        for state, item in self.state_items.items():
+            t = counts.get(state, 0) / busiest
+            item.setBrush(QBrush(QColor(
+                round(EMPTY_COLOR.red() + t * (FULL_COLOR.red() - EMPTY_COLOR.red())),
+                round(EMPTY_COLOR.green() + t * (FULL_COLOR.green() - EMPTY_COLOR.green())),
+                round(EMPTY_COLOR.blue() + t * (FULL_COLOR.blue() - EMPTY_COLOR.blue())),
+                SHADE_ALPHA,
+            )))
+        self.dataLoaded.emit()
+
+    def hover(self, scene_pos, global_pos):
+        state = self.grid.state_at(scene_pos) if scene_pos is not None else None
+        if state != self.hovered:
+            self.hovered = state
+            self.hover_item.setPath(self.paths[state] if state else QPainterPath())
+        if state:
+            QToolTip.showText(global_pos, f"{state}: {self.counts.get(state, 0)} species", self.graphics_view)
+        else:
+            QToolTip.hideText()
+
+    def click(self, scene_pos):
+        if self.point_button.isChecked():
+            self.point_clicked(scene_pos)
+        else:
+            self.state_clicked(scene_pos)
+
+    @diagnostics.timed("NativeMapView.pointClicked")
+    def point_clicked(self, scene_pos):
+        lon, lat = self.georeference.to_lonlat(scene_pos)
+        self.point_item.setPos(scene_pos)
+        self.point_item.show()
+        self.selected = None
+        self.selected_item.setPath(QPainterPath())
+        self.status_label.setText(f"Looking up {format_lonlat(lon, lat)}...")
+        if self.repository:
+            self.repository.species_at_point(
+                lon, lat, lambda rows: self.show_point_species(lon, lat, rows), self.show_error)
+
+    def show_point_species(self, lon, lat, rows):
+        self.status_label.setText(f"{len(rows)} species ranges include {format_lonlat(lon, lat)}")
+        self.species_results.set_rows(rows)
+
+    @diagnostics.timed("NativeMapView.stateClicked")
+    def state_clicked(self, scene_pos):
+        state = self.grid.state_at(scene_pos)
+        if state is None:
+            return
+        self.selected = state
+        self.selected_item.setPath(self.paths[state])
+        self.point_item.hide()
+        self.status_label.setText(state)
+        if self.repository:
+            self.repository.species_for_state(state, self.show_species, self.show_error)
+
+    def show_species(self, rows):
+        self.species_results.set_rows(rows)
+
+    def show_error(self, error):
+        self._stale = True
+        print(error)
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import threading
+
+from PyQt5.QtCore import QObject, QSize, Qt, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader, QPixmap, QPixmapCache
+
+import workers
+from workers import Worker
+
+THUMBNAIL_DIR = "data/thumbnails"
+# Upper bound for the on-disk cache; least recently used files go first
+DISK_CACHE_LIMIT = 256 * 1024 * 1024
+# Eviction trims the cache to this fraction of the limit so it doesn't run
+# again on the very next write
+DISK_CACHE_LOW_WATER = 0.9
+# Size of the in-memory QPixmapCache tier in KB
+MEMORY_CACHE_LIMIT_KB = 64 * 1024
+# Decoding is CPU and disk heavy; keep it from starving database workers
+MAX_DECODE_THREADS = 2
+
+# Cache key for a thumbnail of `path` at `size`. Including mtime and file
+# size means an edited or replaced source file never serves a stale thumbnail.
+def thumbnail_key(path, size):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    raw = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{size.width()}x{size.height()}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class DiskCache:
+    """Directory of PNG thumbnails capped at ``limit`` bytes (LRU).
+
+    Hits bump the file's mtime, which eviction uses as the access time.
+    Safe to call from several worker threads.
+    """
+
+    def __init__(self, cache_dir=THUMBNAIL_DIR, limit=DISK_CACHE_LIMIT):
+        self.cache_dir = cache_dir
+        self.limit = limit
+        self._lock = threading.Lock()
+        # Running total of cached bytes, measured on first write
+        self._total = None
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def get(self, key):
+        path = self._path(key)
+        image = QImage(path)
+        if image.isNull():
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return image
+
+    def put(self, key, image):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        # Write under a temporary name so readers never see a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        if not image.save(tmp_path, "PNG"):
+            return
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._total is None:
+                self._total = self._measure()
+            else:
+                self._total += os.path.getsize(path)
+            if self._total > self.limit:
+                self._evict()
+
+    def _entries(self):
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".png") and entry.is_file():
+                yield entry
+
+    def _measure(self):
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        target = self.limit * DISK_CACHE_LOW_WATER
+        for entry in entries:
+            if self._total <= target:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._total -= size
+
+# Decode `path` straight to roughly `size` and store it in `disk_cache`.
+# Runs on a pool thread, so it only touches QImage, never QPixmap.
+def load_thumbnail(path, size, key, disk_cache):
+    image = disk_cache.get(key)
+    if image is not None:
+        return key, image
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    source_size = reader.size()
+    if source_size.isValid():
+        # Lets the JPEG decoder skip most of the full-resolution work
+        reader.setScaledSize(source_size.scaled(size, Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        return key, image
+    if image.width() > size.width() or image.height() > size.height():
+        image = image.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    disk_cache.put(key, image)
+    return key, image
+
+class ThumbnailService(QObject):
+    """Two-tier thumbnail cache with off-thread decoding.
+
+    ``request`` returns a cached pixmap straight away when the memory tier
+    has one; otherwise it returns None and ``thumbnailReady`` is emitted with
+    the same path and size once the image has been decoded. Missing or
+    unreadable files yield a null pixmap.
+    """
+
+    thumbnailReady = pyqtSignal(str, QSize, QPixmap)
+
+    def __init__(self, cache_dir=THUMBNAIL_DIR, disk_limit=DISK_CACHE_LIMIT, parent=None):
+        super().__init__(parent)
+        self.disk_cache = DiskCache(cache_dir, disk_limit)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(MAX_DECODE_THREADS)
+        # Keys currently being decoded, mapped to every (path, size) waiting on them
+        self._pending = {}
+        QPixmapCache.setCacheLimit(max(QPixmapCache.cacheLimit(), MEMORY_CACHE_LIMIT_KB))
+
+    def request(self, path, width, height):
+        size = QSize(width, height)
+        key = thumbnail_key(path, size)
+        if key is None:
+            return QPixmap()
+        pixmap = QPixmapCache.find(key)
+        if pixmap is not None and not pixmap.isNull():
+            return pixmap
+        waiting = self._pending.get(key)
+        if waiting is not None:
+            waiting.append((path, size))
+            return None
+        self._pending[key] = [(path, size)]
+        worker = Worker(load_thumbnail, path, size, key, self.disk_cache)
+        worker.signals.finished.connect(self._loaded)
+        worker.signals.failed.connect(lambda error, key=key: self._failed(key, error))
+        workers.start(self.pool, worker)
+        return None
+
+    def _failed(self, key, error):
+        self._pending.pop(key, None)
+        print(error)
+
+    def _loaded(self, result):
+        key, image = result
+        waiting = self._pending.pop(key, [])
+        pixmap = QPixmap.fromImage(image)
+        if not pixmap.isNull():
+            QPixmapCache.insert(key, pixmap)
+        for path, size in waiting:
+            self.thumbnailReady.emit(path, size, pixmap)
+
+_service = None
+
+# Shared service for all dialogs; created on first use so QPixmap work only
+# happens once a QApplication exists.
+def thumbnail_service():
+    global _service
+    if _service is None:
+        _service = ThumbnailService()
+    return _service
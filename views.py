@@ -1,26 +1,54 @@
-import os
-from sqlalchemy.orm import sessionmaker
-from PyQt5.QtCore import QObject, Qt, QUrl, pyqtSlot
-from PyQt5.QtGui import QPixmap, QPalette, QColor
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
-from PyQt5.QtWebChannel import QWebChannel
-from PyQt5.QtWebEngineWidgets import QWebEngineView
+from PyQt5.QtCore import Qt, QTimer, QUrl, pyqtSignal
+from PyQt5.QtGui import QPalette, QColor, QKeySequence
 from PyQt5.QtWidgets import (
-    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QListWidget, QPushButton,
-    QDialog, QLabel, QLineEdit, QTextEdit, QFileDialog, QCheckBox, QDesktopWidget
+    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QListWidget, QListWidgetItem, QListView,
+    QPushButton, QDialog, QLabel, QLineEdit, QTextEdit, QFileDialog, QCheckBox, QDesktopWidget, QScrollArea,
+    QShortcut, QMessageBox
 )
 
-from models import FrogsToad, State, Image, AudioFile, TerritoryMap
+from db import create_session_factory
+from media_reconciler import START_DELAY_MS, MediaReconciler
+from queries import profile_changes
+import diagnostics
+from repository import CatalogRepository
+from species_model import SPECIES_ID_ROLE, SnapshotListModel, SpeciesListModel, SpeciesResultsModel
+from thumbnails import thumbnail_service
 from utils import copy_file_to_dir
 
+# Delay after the last keystroke before a search query is started
+SEARCH_DEBOUNCE_MS = 250
+# EditView audio rows keep audio_ingest's metadata under this role
+AUDIO_INFO_ROLE = Qt.UserRole + 1
+
+def format_duration(duration_ms):
+    minutes, seconds = divmod(round(duration_ms / 1000), 60)
+    return f"{minutes}:{seconds:02d}"
+
 class FrogsMainWindow(QMainWindow):
-    def __init__(self, parent=None, flags=Qt.WindowFlags(), engine=None):
+    def __init__(self, parent=None, flags=Qt.WindowFlags(), engine=None, map_mode="web", snapshot=None, read_only=False):
         super().__init__(parent, flags)
         self.engine = engine
+        # "web" for the QtWebEngine map, "native" for the QtSvg one that
+        # needs no Chromium process (low-memory machines)
+        self.map_mode = map_mode
         if self.engine:
-            self.Session = sessionmaker(bind=self.engine)
+            # The only session factory in the GUI; dialogs and the map use it
+            # through the repository
+            self.Session = create_session_factory(self.engine)
+            # All database work for this window and its dialogs goes
+            # through the repository's thread pool
+            self.repository = CatalogRepository(self.Session, parent=self)
+            # Checks media files in the background and watches their
+            # directories; started once the window is up. It and the image
+            # hashing it starts with record results, so a read-only
+            # database (a kiosk image) goes without
+            self.media_reconciler = None if read_only else MediaReconciler(self.Session, self)
         else:
             self.Session = None
+            self.repository = None
+            self.media_reconciler = None
+        self.map_view = None
+        self.diagnostics_window = None
 
         self.setWindowTitle("Frog & Toad Database - Musk Edition")
         self.resize(1000, 700)
@@ -43,9 +71,43 @@ class FrogsMainWindow(QMainWindow):
         self.setCentralWidget(central_widget)
         layout = QVBoxLayout(central_widget)
 
-        self.species_list = QListWidget()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Search name, habitat, diet, colors, notes...")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.setStyleSheet("background-color: #2D2D2D; color: white; border: 1px solid #555; padding: 4px;")
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(self.search_edit)
+        # The facet panel and its index are only built when first opened
+        self.filter_button = QPushButton("Filters")
+        self.filter_button.setCheckable(True)
+        self.filter_button.toggled.connect(self.toggle_filters)
+        search_layout.addWidget(self.filter_button)
+        layout.addLayout(search_layout)
+        self.facet_panel = None
+        self.facet_results = SpeciesResultsModel(self)
+
+        # Restarted on every keystroke so only the final text is queried
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_edit.textChanged.connect(self.search_timer.start)
+        self.search_results = SpeciesResultsModel(self)
+
+        # A catalog snapshot (see snapshot.py) gives the whole list at once
+        # without querying; otherwise pages are read as the user scrolls
+        if snapshot is not None:
+            self.species_model = SnapshotListModel(snapshot, self)
+        else:
+            self.species_model = SpeciesListModel(self.repository, parent=self)
+        self.species_list = QListView()
+        self.species_list.setModel(self.species_model)
+        # All rows share one height, which lets the view skip measuring each item
+        self.species_list.setUniformItemSizes(True)
         self.species_list.setStyleSheet("background-color: #2D2D2D; color: white; border: 1px solid #555;")
-        layout.addWidget(self.species_list)
+        self.body_layout = QHBoxLayout()
+        self.body_layout.addWidget(self.species_list, 1)
+        layout.addLayout(self.body_layout)
 
         button_layout = QHBoxLayout()
         self.view_button = QPushButton("View Profile")
@@ -71,52 +133,234 @@ class FrogsMainWindow(QMainWindow):
         self.edit_button.clicked.connect(self.edit_profile)
         self.add_button.clicked.connect(self.add_new)
         self.map_button.clicked.connect(self.show_map)
+        self.edit_button.setEnabled(not read_only)
+        self.add_button.setEnabled(not read_only)
+
+        # Hidden until the reconciler finds a missing or corrupt file
+        self.broken_media_button = QPushButton()
+        self.broken_media_button.setFlat(True)
+        self.broken_media_button.setStyleSheet("color: #FF8C00; padding: 0 6px;")
+        self.broken_media_button.clicked.connect(self.show_broken_media)
+        self.broken_media_button.hide()
+        self.statusBar().addPermanentWidget(self.broken_media_button)
+        if self.media_reconciler:
+            self.media_reconciler.brokenCountChanged.connect(self.show_broken_count)
+            QTimer.singleShot(START_DELAY_MS, self.media_reconciler.start)
+            # Perceptual hashes for images added before duplicate checks
+            QTimer.singleShot(START_DELAY_MS, self.repository.hash_images)
+
+        # Only wired up when diagnostics were switched on at startup
+        if diagnostics.enabled():
+            QShortcut(QKeySequence("Ctrl+Shift+D"), self, self.show_diagnostics)
 
         self.load_species()
 
-    def load_species(self):
-        if self.Session:
-            session = self.Session()
-            frogs_toads = session.query(FrogsToad).all()
-            self.species_list.clear()
-            for ft in frogs_toads:
-                self.species_list.addItem(ft.name)
-            session.close()
+    def set_loading(self, message):
+        # Shown while a background query runs; an empty message clears it
+        if message:
+            self.statusBar().showMessage(message)
+        else:
+            self.statusBar().clearMessage()
 
-    def view_profile(self):
-        selected_item = self.species_list.currentItem()
-        if selected_item and self.Session:
-            session = self.Session()
-            frog_toad = session.query(FrogsToad).filter_by(name=selected_item.text()).first()
-            if frog_toad:
-                profile_view = ProfileView(frog_toad, self.engine)
-                profile_view.exec_()
-            session.close()
+    def show_error(self, error):
+        self.set_loading("")
+        print(error)
 
+    def closeEvent(self, event):
+        if self.media_reconciler:
+            self.media_reconciler.shutdown()
+        if self.repository:
+            self.repository.shutdown()
+        event.accept()
+
+    def load_species(self):
+        # Pages are pulled in by the view through canFetchMore/fetchMore
+        self.species_model.reset()
+
+    @diagnostics.timed("Search")
+    def run_search(self):
+        query_text = self.search_edit.text()
+        if not query_text.strip() or not self.repository:
+            # Drops any search still in flight so it can't replace the list
+            if self.repository:
+                self.repository.cancel("search")
+            self.species_list.setModel(self.species_model)
+            return
+        self.repository.search(query_text, self.show_search_results, self.show_error)
+
+    @diagnostics.timed("Search.populate")
+    def show_search_results(self, rows):
+        self.search_results.set_rows(rows)
+        self.species_list.setModel(self.search_results)
+
+    def toggle_filters(self, shown):
+        if self.facet_panel is None:
+            from facet_panel import FacetPanel
+            self.facet_panel = FacetPanel()
+            self.facet_panel.filtersChanged.connect(self.run_facet_filter)
+            self.body_layout.insertWidget(0, self.facet_panel)
+        self.facet_panel.setVisible(shown)
+        if shown:
+            self.set_loading("Loading filters...")
+            self.run_facet_filter()
+        elif self.species_list.model() is self.facet_results:
+            self.species_list.setModel(self.species_model)
+
+    # Filter queries share the "facets" channel, so quick successive
+    # clicks only ever show the latest combination
+    @diagnostics.timed("Facets")
+    def run_facet_filter(self, selected=None):
+        if self.repository:
+            self.repository.facet_filter(selected or self.facet_panel.selected(),
+                                         self.show_facet_results, self.show_error)
+
+    @diagnostics.timed("Facets.populate")
+    def show_facet_results(self, result):
+        counts, total, rows = result
+        self.facet_panel.set_counts(counts)
+        if any(self.facet_panel.selected().values()):
+            self.facet_results.set_rows(rows)
+            self.species_list.setModel(self.facet_results)
+            shown = f" (showing {len(rows)})" if len(rows) < total else ""
+            self.set_loading(f"{total} species match{shown}")
+        else:
+            if self.species_list.model() is self.facet_results:
+                self.species_list.setModel(self.species_model)
+            self.set_loading("")
+
+    def apply_saved_change(self, action, frog_toad_id, name):
+        self.species_model.apply_change(action, frog_toad_id, name)
+        self.search_results.apply_change(action, frog_toad_id, name)
+        self.facet_results.apply_change(action, frog_toad_id, name)
+        if self.facet_panel is not None and self.facet_panel.isVisible():
+            self.run_facet_filter()
+        if self.map_view is not None:
+            self.map_view.species_changed(frog_toad_id)
+        if self.media_reconciler:
+            self.media_reconciler.species_changed(frog_toad_id)
+
+    def show_broken_count(self, count):
+        self.broken_media_button.setText(f"{count} broken media file(s)")
+        self.broken_media_button.setVisible(count > 0)
+
+    def show_broken_media(self):
+        self.media_reconciler.broken_media(self.open_broken_media)
+
+    def open_broken_media(self, rows):
+        broken_media_view = BrokenMediaView(rows, self)
+        broken_media_view.editSpecies.connect(self.edit_species)
+        broken_media_view.exec_()
+
+    def selected_species_id(self):
+        selected_index = self.species_list.currentIndex()
+        if selected_index.isValid() and self.repository:
+            return selected_index.data(SPECIES_ID_ROLE)
+        return None
+
+    # Profiles load on the "profile" channel, so picking another species
+    # before the first arrives only ever opens the latest one
+    @diagnostics.timed("ProfileView.load")
+    def view_profile(self):
+        frog_toad_id = self.selected_species_id()
+        if frog_toad_id is not None:
+            self.set_loading("Loading profile...")
+            self.repository.profile(frog_toad_id, self.open_profile, self.show_error)
+
+    def open_profile(self, profile):
+        self.set_loading("")
+        if profile:
+            profile_view = ProfileView(profile)
+            profile_view.exec_()
+
+    @diagnostics.timed("EditView.load")
     def edit_profile(self):
-        selected_item = self.species_list.currentItem()
-        if selected_item and self.Session:
-            session = self.Session()
-            frog_toad = session.query(FrogsToad).filter_by(name=selected_item.text()).first()
-            edit_view = EditView(frog_toad, self.engine)
+        frog_toad_id = self.selected_species_id()
+        if frog_toad_id is not None:
+            self.edit_species(frog_toad_id)
+
+    def edit_species(self, frog_toad_id):
+        self.set_loading("Loading profile...")
+        self.repository.profile(frog_toad_id, self.open_editor, self.show_error)
+
+    def open_editor(self, profile):
+        self.set_loading("")
+        if profile:
+            edit_view = EditView(profile, self.repository)
+            edit_view.saved.connect(self.apply_saved_change)
             edit_view.exec_()
-            session.close()
-            self.load_species()
 
     def add_new(self):
-        edit_view = EditView(None, self.engine)
+        edit_view = EditView(None, self.repository)
+        edit_view.saved.connect(self.apply_saved_change)
         edit_view.exec_()
-        self.load_species()
+
+    # The map is built once and kept: closing it only hides the window,
+    # and reopening skips starting QtWebEngine and loading the page again
+    def ensure_map_view(self):
+        if self.map_view is None:
+            if self.map_mode == "native":
+                from svg_map import NativeMapView
+                self.map_view = NativeMapView(self.repository)
+            else:
+                from map_view import MapView
+                self.map_view = MapView(self.repository)
+        return self.map_view
 
     def show_map(self):
-        map_view = MapView(self.engine)
-        map_view.show()
+        self.ensure_map_view().show()
+        self.map_view.raise_()
+
+    def prewarm_map(self):
+        """Build the map hidden and load its data so its first show is instant.
+
+        Returns the map view; its ``dataLoaded`` fires when the data is in.
+        """
+        map_view = self.ensure_map_view()
+        map_view.refresh()
+        return map_view
+
+    def show_diagnostics(self):
+        if self.diagnostics_window is None:
+            from diagnostics_window import DiagnosticsWindow
+            self.diagnostics_window = DiagnosticsWindow(self)
+        self.diagnostics_window.show()
+        self.diagnostics_window.raise_()
+
+class BrokenMediaView(QDialog):
+    """Media rows whose file was missing or corrupt at the last check.
+
+    Double-clicking a row opens that species in the editor.
+    """
+
+    editSpecies = pyqtSignal(int)
+
+    def __init__(self, rows, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Broken Media")
+        self.resize(700, 400)
+        self.setStyleSheet("background-color: #1E1E1E; color: white;")
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(f"{len(rows)} media reference(s) point at missing or corrupt files"))
+        self.media_list = QListWidget()
+        self.media_list.setStyleSheet("background-color: #2D2D2D; color: white; border: 1px solid #555;")
+        for kind, media_id, frog_toad_id, name, path, status in rows:
+            item = QListWidgetItem(f"{name} - {kind}: {path} ({status})")
+            item.setData(Qt.UserRole, frog_toad_id)
+            self.media_list.addItem(item)
+        self.media_list.itemDoubleClicked.connect(self.edit_item)
+        layout.addWidget(self.media_list)
+
+    def edit_item(self, item):
+        self.accept()
+        self.editSpecies.emit(item.data(Qt.UserRole))
 
 class ProfileView(QDialog):
-    def __init__(self, frog_toad, engine):
+    @diagnostics.timed("ProfileView.build")
+    def __init__(self, frog_toad):
         super().__init__()
+        # A repository.SpeciesProfile, fully loaded before the dialog opens
         self.frog_toad = frog_toad
-        self.engine = engine
 
         self.setWindowTitle(f"{frog_toad.name} - Profile")
         self.resize(600, 500)
@@ -132,25 +376,29 @@ class ProfileView(QDialog):
         layout.addWidget(QLabel(f"Color Scheme: {frog_toad.color_scheme}"))
         layout.addWidget(QLabel(f"Notes: {frog_toad.profile_notes}"))
 
+        # Thumbnails are decoded off the GUI thread; labels show a placeholder
+        # until thumbnailReady delivers the pixmap for their path
+        self.thumbnail_labels = {}
+        thumbnail_service().thumbnailReady.connect(self.show_thumbnail)
+
         if frog_toad.images:
             image_label = QLabel()
-            pixmap = QPixmap(frog_toad.images[0].image_path)
-            image_label.setPixmap(pixmap.scaled(300, 300, Qt.KeepAspectRatio))
             layout.addWidget(image_label)
+            self.request_thumbnail(image_label, frog_toad.images[0].image_path, 300, 300)
 
-        self.audio_player = QMediaPlayer()
+        # The player (and QtMultimedia itself) is created on the first play
+        self.audio_player = None
         if frog_toad.audio_files:
-            self.audio_player.setMedia(QMediaContent(QUrl.fromLocalFile(frog_toad.audio_files[0].audio_path)))
-            play_button = QPushButton("Play Call")
+            duration_ms = frog_toad.audio_files[0].duration_ms
+            play_button = QPushButton(f"Play Call ({format_duration(duration_ms)})" if duration_ms else "Play Call")
             play_button.setStyleSheet("background-color: #3C3C3C; color: white; padding: 5px;")
             play_button.clicked.connect(self.play_audio)
             layout.addWidget(play_button)
 
         if frog_toad.territory_map:
             map_label = QLabel()
-            pixmap = QPixmap(frog_toad.territory_map.map_path)
-            map_label.setPixmap(pixmap.scaled(300, 200, Qt.KeepAspectRatio))
             layout.addWidget(map_label)
+            self.request_thumbnail(map_label, frog_toad.territory_map.map_path, 300, 200)
 
         states = ", ".join([state.state_name for state in frog_toad.states])
         layout.addWidget(QLabel(f"Native to: {states}"))
@@ -160,21 +408,48 @@ class ProfileView(QDialog):
         ai_button.clicked.connect(self.ask_ai)
         layout.addWidget(ai_button)
 
+    def request_thumbnail(self, label, path, width, height):
+        label.setAlignment(Qt.AlignCenter)
+        label.setMinimumSize(width, height)
+        pixmap = thumbnail_service().request(path, width, height)
+        if pixmap is not None:
+            self.set_thumbnail(label, pixmap)
+            return
+        label.setText("Loading image...")
+        self.thumbnail_labels[(path, width, height)] = label
+
+    def show_thumbnail(self, path, size, pixmap):
+        label = self.thumbnail_labels.pop((path, size.width(), size.height()), None)
+        if label is not None:
+            self.set_thumbnail(label, pixmap)
+
+    def set_thumbnail(self, label, pixmap):
+        if pixmap.isNull():
+            label.setText("Image unavailable")
+        else:
+            label.setPixmap(pixmap)
+
     def play_audio(self):
+        if self.audio_player is None:
+            from PyQt5.QtMultimedia import QMediaContent, QMediaPlayer
+            self.audio_player = QMediaPlayer(self)
+            self.audio_player.setMedia(QMediaContent(QUrl.fromLocalFile(self.frog_toad.audio_files[0].audio_path)))
         self.audio_player.play()
 
     def ask_ai(self):
         print("AI feature coming soon - Imagine asking about frog calls or habitats!")
 
 class EditView(QDialog):
-    def __init__(self, frog_toad=None, engine=None):
+    # Emitted after a successful save with the action ("inserted", "updated"
+    # or "renamed"), the species id and its new name
+    saved = pyqtSignal(str, int, str)
+
+    @diagnostics.timed("EditView.build")
+    def __init__(self, frog_toad=None, repository=None):
         super().__init__()
-        print("Starting EditView")
-        self.setWindowTitle("Add New Species")
-        layout = QVBoxLayout(self)
-        label = QLabel("Test Dialog")
-        layout.addWidget(label)
-        print("Finished EditView")
+        # A repository.SpeciesProfile to edit, or None for a new species
+        self.frog_toad = frog_toad
+        self.repository = repository
 
         # Set window properties
         self.setWindowTitle("Edit Profile" if frog_toad else "Add New Species")
@@ -222,7 +497,7 @@ class EditView(QDialog):
         self.image_list = QListWidget()
         if frog_toad and frog_toad.images:
             for image in frog_toad.images:
-                self.image_list.addItem(image.image_path)
+                self.image_list.addItem(self.media_item(image.id, image.image_path))
         self.image_list.setStyleSheet("background-color: #2D2D2D; color: white; border: 1px solid #555;")
         content_layout.addWidget(QLabel("Images:"))
         content_layout.addWidget(self.image_list)
@@ -234,7 +509,7 @@ class EditView(QDialog):
         self.audio_list = QListWidget()
         if frog_toad and frog_toad.audio_files:
             for audio in frog_toad.audio_files:
-                self.audio_list.addItem(audio.audio_path)
+                self.audio_list.addItem(self.media_item(audio.id, audio.audio_path))
         self.audio_list.setStyleSheet("background-color: #2D2D2D; color: white; border: 1px solid #555;")
         content_layout.addWidget(QLabel("Audio Files:"))
         content_layout.addWidget(self.audio_list)
@@ -251,17 +526,15 @@ class EditView(QDialog):
         upload_map_btn.clicked.connect(self.upload_map)
         content_layout.addWidget(upload_map_btn)
 
-        # State selection with checkboxes
+        # State selection with checkboxes, filled in once the states arrive
         self.state_checkboxes = []
-        states = self.session.query(State).all()
         content_layout.addWidget(QLabel("Native States:"))
-        for state in states:
-            cb = QCheckBox(state.state_name)
-            cb.setStyleSheet("color: white;")
-            if frog_toad and state in frog_toad.states:
-                cb.setChecked(True)
-            self.state_checkboxes.append(cb)
-            content_layout.addWidget(cb)
+        self.states_layout = QVBoxLayout()
+        self.states_placeholder = QLabel("Loading states...")
+        self.states_layout.addWidget(self.states_placeholder)
+        content_layout.addLayout(self.states_layout)
+        if self.repository:
+            self.repository.states(self.show_states, self.show_error)
 
         # Set content widget to scroll area
         scroll_area.setWidget(content_widget)
@@ -270,154 +543,154 @@ class EditView(QDialog):
         layout.addWidget(scroll_area)
 
         # Add save button outside the scroll area
-        save_btn = QPushButton("Save")
-        save_btn.setStyleSheet("background-color: #FF4500; color: white; padding: 8px;")
-        save_btn.clicked.connect(self.save)
-        layout.addWidget(save_btn)
-
-        # Rest of your code (e.g., additional methods) goes here
+        self.save_btn = QPushButton("Save")
+        self.save_btn.setStyleSheet("background-color: #FF4500; color: white; padding: 8px;")
+        self.save_btn.clicked.connect(self.save)
+        layout.addWidget(self.save_btn)
+        # Recordings still being transcoded; saving waits for them
+        self.ingesting = 0
+
+    def show_states(self, states):
+        self.states_placeholder.hide()
+        checked_states = {state.id for state in self.frog_toad.states} if self.frog_toad else set()
+        for state_id, state_name in states:
+            cb = QCheckBox(state_name)
+            cb.setStyleSheet("color: white;")
+            if state_id in checked_states:
+                cb.setChecked(True)
+            self.state_checkboxes.append((state_id, cb))
+            self.states_layout.addWidget(cb)
+
+    # List rows for media already in the database remember their row id,
+    # so a save can tell kept, edited and new files apart
+    @staticmethod
+    def media_item(media_id, path):
+        item = QListWidgetItem(path)
+        item.setData(Qt.UserRole, media_id)
+        return item
+
+    @staticmethod
+    def media_rows(list_widget):
+        return [(list_widget.item(i).data(Qt.UserRole), list_widget.item(i).text())
+                for i in range(list_widget.count())]
+
+    def show_error(self, error):
+        self.update_save_button()
+        print(error)
+
+    def update_save_button(self):
+        self.save_btn.setEnabled(not self.ingesting)
+        self.save_btn.setText(f"Processing audio ({self.ingesting})..." if self.ingesting else "Save")
+
+    # Hashing a large file into the media store runs on the repository's
+    # pool; the path is added to the form when it is done
+    def store_media(self, file_path, dest_dir, on_stored):
+        if self.repository:
+            self.repository.submit(copy_file_to_dir, file_path, dest_dir,
+                                   on_result=on_stored, on_error=self.show_error)
+        else:
+            on_stored(copy_file_to_dir(file_path, dest_dir))
 
     def add_image(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select Image", "", "Images (*.png *.jpg *.jpeg)")
-        if file_path:
-            dest_path = copy_file_to_dir(file_path, "data/images")
-            self.image_list.addItem(dest_path)
+        if not file_path:
+            return
+        if self.repository:
+            self.repository.add_image(file_path, "data/images", self.add_checked_image, self.show_error)
+        else:
+            self.image_list.addItem(copy_file_to_dir(file_path, "data/images"))
+
+    # Near-duplicates of a new image are shown before it joins the form
+    def add_checked_image(self, result):
+        path, matches = result
+        if matches:
+            lines = "\n".join(
+                f"{name}: {'the same file' if match_path == path else f'{distance} bit(s) apart'}"
+                for distance, match_path, _, name in matches
+            )
+            answer = QMessageBox.question(
+                self, "Similar Image Found",
+                f"This image looks like {len(matches)} image(s) already in the library:\n\n{lines}\n\nAdd it anyway?",
+            )
+            if answer != QMessageBox.Yes:
+                return
+        self.image_list.addItem(path)
 
+    # Recordings are transcoded, measured and given a preview clip in the
+    # ingest process pool; the result comes back as a queued signal
     def add_audio(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select Audio", "", "Audio (*.mp3 *.wav)")
-        if file_path:
-            dest_path = copy_file_to_dir(file_path, "data/audio")
-            self.audio_list.addItem(dest_path)
+        if not file_path:
+            return
+        self.ingesting += 1
+        self.update_save_button()
+        if self.repository:
+            self.repository.ingest_audio(file_path, self.add_ingested_audio, self.ingest_failed)
+        else:
+            import audio_ingest
+            self.add_ingested_audio(audio_ingest.ingest_file(file_path))
+
+    def add_ingested_audio(self, info):
+        self.ingesting -= 1
+        item = self.media_item(None, info["audio_path"])
+        item.setData(AUDIO_INFO_ROLE, {name: value for name, value in info.items() if name != "audio_path"})
+        item.setToolTip(format_duration(info["duration_ms"]))
+        self.audio_list.addItem(item)
+        self.update_save_button()
+
+    def ingest_failed(self, error):
+        self.ingesting -= 1
+        self.show_error(error)
 
     def upload_map(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select Map Image", "", "Images (*.png *.jpg *.jpeg)")
         if file_path:
-            dest_path = copy_file_to_dir(file_path, "data/maps")
-            self.map_edit.setText(dest_path)
-
+            self.store_media(file_path, "data/maps", self.map_edit.setText)
+
+    def form_values(self):
+        values = {
+            "name": self.name_edit.text(),
+            "breeding_season": self.breeding_edit.text(),
+            "habitat": self.habitat_edit.text(),
+            "diet": self.diet_edit.text(),
+            "adult_size": self.size_edit.text(),
+            "color_scheme": self.color_edit.text(),
+            "profile_notes": self.notes_edit.toPlainText(),
+        }
+        values["images"] = self.media_rows(self.image_list)
+        values["audio_files"] = self.media_rows(self.audio_list)
+        values["audio_metadata"] = {
+            item.text(): item.data(AUDIO_INFO_ROLE)
+            for item in map(self.audio_list.item, range(self.audio_list.count()))
+            if item.data(AUDIO_INFO_ROLE)
+        }
+        values["map_path"] = self.map_edit.text()
+        values["states"] = [state_id for state_id, cb in self.state_checkboxes if cb.isChecked()]
+        return values
+
+    @diagnostics.timed("EditView.save")
     def save(self):
-        if not self.Session:
+        if not self.repository:
             print("No database session available.")
             return
 
-        session = self.Session()
-        images = [self.image_list.item(i).text() for i in range(self.image_list.count())]
-        audio_files = [self.audio_list.item(i).text() for i in range(self.audio_list.count())]
-        states = [cb.text() for cb in self.state_checkboxes if cb.isChecked()]
-
-        if self.frog_toad:
-            self.frog_toad.name = self.name_edit.text()
-            self.frog_toad.breeding_season = self.breeding_edit.text()
-            self.frog_toad.habitat = self.habitat_edit.text()
-            self.frog_toad.diet = self.diet_edit.text()
-            self.frog_toad.adult_size = self.size_edit.text()
-            self.frog_toad.color_scheme = self.color_edit.text()
-            self.frog_toad.profile_notes = self.notes_edit.toPlainText()
-            self.frog_toad.images = [Image(image_path=path) for path in images]
-            self.frog_toad.audio_files = [AudioFile(audio_path=path) for path in audio_files]
-            if self.map_edit.text():
-                if self.frog_toad.territory_map:
-                    self.frog_toad.territory_map.map_path = self.map_edit.text()
-                else:
-                    self.frog_toad.territory_map = TerritoryMap(map_path=self.map_edit.text())
-            self.frog_toad.states = [session.query(State).filter_by(state_name=state).first() for state in states]
-            session.merge(self.frog_toad)
-        else:
-            frog_toad = FrogsToad(
-                name=self.name_edit.text(),
-                breeding_season=self.breeding_edit.text(),
-                habitat=self.habitat_edit.text(),
-                diet=self.diet_edit.text(),
-                adult_size=self.size_edit.text(),
-                color_scheme=self.color_edit.text(),
-                profile_notes=self.notes_edit.toPlainText(),
-                images=[Image(image_path=path) for path in images],
-                audio_files=[AudioFile(audio_path=path) for path in audio_files],
-                territory_map=TerritoryMap(map_path=self.map_edit.text()) if self.map_edit.text() else None,
-                states=[session.query(State).filter_by(state_name=state).first() for state in states]
-            )
-            session.add(frog_toad)
-
-        session.commit()
-        session.close()
-        self.accept()
-
-class MapView(QWidget):
-    def __init__(self, engine):
-        super().__init__()
-        self.engine = engine
-        if self.engine:
-            self.Session = sessionmaker(bind=self.engine)
-        else:
-            self.Session = None
-
-        self.setWindowTitle("Interactive U.S. Map")
-        self.resize(1000, 600)
-        self.setStyleSheet("background-color: #1E1E1E; color: white;")
-
-        layout = QVBoxLayout(self)
+        form = self.form_values()
+        if self.frog_toad and not self.state_checkboxes:
+            # The checkboxes haven't loaded; keep the current states
+            form["states"] = [state.id for state in self.frog_toad.states]
+        changes = profile_changes(self.frog_toad, form)
+        if self.frog_toad and not changes:
+            # Nothing edited: close without touching the database
+            self.accept()
+            return
 
-        self.webview = QWebEngineView()
-        self.channel = QWebChannel()
-        self.bridge = MapBridge(self.engine, self, self.Session)
-        self.channel.registerObject('bridge', self.bridge)
-        self.webview.page().setWebChannel(self.channel)
-
-        html = '''
-        <html>
-        <body style="background-color: #1E1E1E; margin: 0;">
-        <object id="svgObject" type="image/svg+xml" data="us_map.svg" style="width: 100%; height: 400px;"></object>
-        <script>
-        var bridge;
-        new QWebChannel(qt.webChannelTransport, function(channel) {
-            bridge = channel.objects.bridge;
-        });
-        var svgObject = document.getElementById('svgObject');
-        svgObject.addEventListener('load', function() {
-            var svgDoc = svgObject.contentDocument;
-            var paths = svgDoc.querySelectorAll('path');
-            paths.forEach(function(path) {
-                path.style.transition = "fill 0.3s";
-                path.addEventListener('mouseover', function() {
-                    path.style.fill = "#FF4500";
-                });
-                path.addEventListener('mouseout', function() {
-                    path.style.fill = "";
-                });
-                path.addEventListener('click', function() {
-                    bridge.stateClicked(path.id);
-                });
-            });
-        });
-        </script>
-        </body>
-        </html>
-        '''
-        self.webview.setHtml(html, QUrl.fromLocalFile(os.path.abspath('resources')))
-        layout.addWidget(self.webview)
-
-        self.species_list = QListWidget()
-        self.species_list.setStyleSheet("background-color: #2D2D2D; color: white; border: 1px solid #555;")
-        layout.addWidget(self.species_list)
+        # The dialog stays open, with saving disabled, until the write commits
+        self.save_btn.setEnabled(False)
+        self.save_btn.setText("Saving...")
+        frog_toad_id = self.frog_toad.id if self.frog_toad else None
+        self.repository.save_profile(frog_toad_id, changes, self.finish_save, self.show_error)
 
-    def closeEvent(self, event):
-        event.accept()
-
-class MapBridge(QObject):
-    def __init__(self, engine, map_view, Session=None):
-        super().__init__()
-        self.engine = engine
-        self.map_view = map_view
-        self.Session = Session
-
-    @pyqtSlot(str)
-    def stateClicked(self, state_id):
-        if self.Session:
-            session = self.Session()
-            state = session.query(State).filter_by(state_name=state_id).first()
-            if state:
-                frogs_toads = state.frogs_toads
-                self.map_view.species_list.clear()
-                for ft in frogs_toads:
-                    self.map_view.species_list.addItem(ft.name)
-            session.close()
+    def finish_save(self, change):
+        action, frog_toad_id, name = change
+        self.saved.emit(action, frog_toad_id, name)
+        self.accept()
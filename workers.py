@@ -0,0 +1,103 @@
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+import diagnostics
+
+class WorkerSignals(QObject):
+    # QRunnable is not a QObject, so its signals live on a helper object.
+    # It is created on the GUI thread, so emits from the pool thread are
+    # queued back to the GUI thread's event loop.
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    # Always emitted last, cancelled or not
+    done = pyqtSignal()
+
+class Worker(QRunnable):
+    """Run ``fn(*args, **kwargs)`` on a ``QThreadPool`` thread.
+
+    The return value is delivered through ``signals.finished`` and any
+    exception, formatted as a traceback, through ``signals.failed``. After
+    ``cancel`` neither signal is emitted, and a worker that hasn't started
+    yet skips ``fn`` altogether.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self.cancelled = False
+        # Queries the worker runs count against the view that queued it
+        self.operation = diagnostics.current_operation()
+        # Python owns the worker; see start()
+        self.setAutoDelete(False)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            if self.cancelled:
+                return
+            try:
+                with diagnostics.resumed(self.operation):
+                    result = self.fn(*self.args, **self.kwargs)
+            except Exception:
+                if not self.cancelled:
+                    self.signals.failed.emit(traceback.format_exc())
+                return
+            if not self.cancelled:
+                self.signals.finished.emit(result)
+        finally:
+            self.signals.done.emit()
+
+# Workers started through start() and not yet done. Holding them here keeps
+# the Python wrapper and its WorkerSignals alive until their queued signals
+# have been delivered on the GUI thread; letting the pool delete a running
+# Python QRunnable can crash when those signals arrive.
+_running = set()
+
+def start(pool, worker):
+    _running.add(worker)
+    worker.signals.done.connect(lambda: _running.discard(worker))
+    pool.start(worker)
+
+# Pull a worker that hasn't started yet back out of the pool
+def take(pool, worker):
+    if pool.tryTake(worker):
+        _running.discard(worker)
+        return True
+    return False
+
+# WorkerSignals of futures passed to watch() whose result hasn't been
+# delivered yet, kept alive for the same reason as _running
+_watched = set()
+
+def watch(future, on_result, on_error=None):
+    """Deliver a ``concurrent.futures`` result on the GUI thread.
+
+    Call from the GUI thread. No thread waits on the future: its done
+    callback emits queued signals, as a finished ``Worker`` does.
+    """
+    signals = WorkerSignals()
+    _watched.add(signals)
+    signals.finished.connect(on_result)
+    signals.failed.connect(on_error or print)
+    signals.done.connect(lambda: _watched.discard(signals))
+
+    def done(future):
+        try:
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                signals.finished.emit(future.result())
+            else:
+                signals.failed.emit("".join(traceback.format_exception(error)))
+        finally:
+            signals.done.emit()
+
+    future.add_done_callback(done)
+    return future